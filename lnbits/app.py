@@ -7,6 +7,7 @@ import sys
 import time
 from collections.abc import Callable
 from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from pathlib import Path
 
 from fastapi import FastAPI
@@ -27,26 +28,37 @@ from lnbits.core.crud.extensions import create_installed_extension
 from lnbits.core.helpers import migrate_extension_database
 from lnbits.core.models.notifications import NotificationType
 from lnbits.core.services.extensions import deactivate_extension, get_valid_extensions
-from lnbits.core.services.notifications import enqueue_admin_notification
+from lnbits.core.services.funding_source import funding_source_startup
+from lnbits.core.services.notifications import (
+    close_notification_http_client,
+    enqueue_admin_notification,
+    webhook_outbox,
+)
 from lnbits.core.services.payments import check_pending_payments
+from lnbits.core.services.settings import settings_watcher
 from lnbits.core.tasks import (
     audit_queue,
+    audit_writer_stats,
     collect_exchange_rates_data,
+    flush_audit_queue,
     purge_audit_data,
     run_by_the_minute_tasks,
     wait_for_audit_data,
     wait_for_paid_invoices,
     wait_notification_messages,
 )
+from lnbits.db import Database
 from lnbits.exceptions import register_exception_handlers
 from lnbits.helpers import version_parse
 from lnbits.settings import settings
 from lnbits.tasks import (
     cancel_all_tasks,
     create_permanent_task,
+    create_singleton_task,
     register_invoice_listener,
 )
 from lnbits.utils.cache import cache
+from lnbits.utils.cache_backend import create_cache_backend
 from lnbits.utils.logger import (
     configure_logger,
     initialize_server_websocket_logger,
@@ -61,13 +73,20 @@ from .core.models.extensions import Extension, ExtensionMeta, InstallableExtensi
 from .core.services import check_admin_settings, check_webpush_settings
 from .middleware import (
     AuditMiddleware,
-    ExtensionsRedirectMiddleware,
     InstalledExtensionMiddleware,
     add_first_install_middleware,
     add_ip_block_middleware,
     add_ratelimit_middleware,
 )
-from .tasks import internal_invoice_listener, invoice_listener, run_interval
+from .tasks import (
+    internal_invoice_listener,
+    invoice_listener,
+    paid_invoice_dispatcher,
+    restore_invoice_stream_cursor,
+    run_interval,
+    settled_payments_relay,
+    singleton_tasks,
+)
 
 
 async def startup(app: FastAPI):
@@ -89,18 +108,18 @@ async def startup(app: FastAPI):
     log_server_info()
 
     # initialize WALLET
-    try:
-        set_funding_source()
-    except Exception as e:
-        logger.error(f"Error initializing {settings.lnbits_backend_wallet_class}: {e}")
-        set_void_wallet_class()
+    await start_funding_source()
 
     # initialize funding source
     await check_funding_source()
+    log_funding_source_startup()
 
     # register core routes
     init_core_routers(app)
 
+    # share the cache between workers, if configured
+    cache.backend = create_cache_backend(settings.lnbits_cache_url)
+
     # initialize tasks
     register_async_tasks()
 
@@ -134,6 +153,13 @@ async def shutdown():
     await asyncio.sleep(0.1)
     funding_source = get_funding_source()
     await funding_source.cleanup()
+    await singleton_tasks.release()
+    await settled_payments_relay.close()
+    await settings_watcher.close()
+    await cache.backend.close()
+    await close_notification_http_client()
+    await flush_audit_queue()
+    await Database.close_all()
 
 
 @asynccontextmanager
@@ -177,14 +203,15 @@ def create_app() -> FastAPI:
     )
     app.add_middleware(GZipMiddleware, minimum_size=1000)
 
-    app.add_middleware(AuditMiddleware, audit_queue=audit_queue)
+    app.add_middleware(
+        AuditMiddleware, audit_queue=audit_queue, audit_stats=audit_writer_stats
+    )
 
     # required for SSO login
     app.add_middleware(SessionMiddleware, secret_key=settings.auth_secret_key)
 
     # order of these two middlewares is important
     app.add_middleware(InstalledExtensionMiddleware)
-    app.add_middleware(ExtensionsRedirectMiddleware)
 
     register_custom_extensions_path()
 
@@ -199,17 +226,40 @@ def create_app() -> FastAPI:
     return app
 
 
+async def start_funding_source() -> None:
+    report = funding_source_startup
+    report.funding_source = settings.lnbits_backend_wallet_class
+    report.started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    try:
+        set_funding_source()
+        report.init_seconds = time.perf_counter() - start
+        funding_source = get_funding_source()
+        # a persisted cursor saves the funding source from looking it up
+        await restore_invoice_stream_cursor(funding_source)
+        start = time.perf_counter()
+        await funding_source.startup()
+        report.startup_seconds = time.perf_counter() - start
+    except Exception as e:
+        logger.error(f"Error initializing {settings.lnbits_backend_wallet_class}: {e}")
+        report.error = str(e)
+        set_void_wallet_class()
+
+
 async def check_funding_source() -> None:
     funding_source = get_funding_source()
 
     max_retries = settings.funding_source_max_retries
     retry_counter = 0
+    start = time.perf_counter()
 
     while settings.lnbits_running:
         try:
             logger.info(f"Connecting to backend {funding_source.__class__.__name__}...")
             error_message, balance = await funding_source.status()
             if not error_message:
+                funding_source_startup.status_seconds = time.perf_counter() - start
+                funding_source_startup.status_retries = retry_counter
                 retry_counter = 0
                 logger.success(
                     f"✔️ Backend {funding_source.__class__.__name__} connected "
@@ -240,6 +290,18 @@ async def check_funding_source() -> None:
         await asyncio.sleep(sleep_time)
 
 
+def log_funding_source_startup() -> None:
+    report = funding_source_startup
+    report.funding_source = get_funding_source().__class__.__name__
+    report.ready_at = datetime.now(timezone.utc)
+    total = report.init_seconds + report.startup_seconds + report.status_seconds
+    logger.info(
+        f"Funding source {report.funding_source} ready in {total:.2f} seconds "
+        f"(init: {report.init_seconds:.2f}s, startup: {report.startup_seconds:.2f}s, "
+        f"status: {report.status_seconds:.2f}s, retries: {report.status_retries})."
+    )
+
+
 def set_void_wallet_class():
     logger.warning(
         "Fallback to VoidWallet, because the backend for "
@@ -468,21 +530,32 @@ def register_async_tasks() -> None:
     create_permanent_task(wait_for_audit_data)
     create_permanent_task(wait_notification_messages)
 
-    create_permanent_task(run_interval(30 * 60, check_pending_payments))
-    create_permanent_task(invoice_listener)
+    # run in one worker process only, when several share the database
+    create_singleton_task("webhook_outbox", webhook_outbox.run)
+    create_singleton_task(
+        "check_pending_payments", run_interval(30 * 60, check_pending_payments)
+    )
+    create_singleton_task("invoice_listener", invoice_listener)
+    create_singleton_task("run_by_the_minute_tasks", run_by_the_minute_tasks)
+    create_singleton_task("purge_audit_data", purge_audit_data)
+    create_singleton_task("collect_exchange_rates_data", collect_exchange_rates_data)
+    create_permanent_task(singleton_tasks.run)
+
+    create_permanent_task(paid_invoice_dispatcher)
     create_permanent_task(internal_invoice_listener)
+    # payments settled by another worker, for long-polling and websockets
+    create_permanent_task(settled_payments_relay.run)
     create_permanent_task(cache.invalidate_forever)
+    create_permanent_task(cache.listen_invalidations)
 
     # core invoice listener
     invoice_queue: asyncio.Queue = asyncio.Queue()
     register_invoice_listener(invoice_queue, "core")
     create_permanent_task(lambda: wait_for_paid_invoices(invoice_queue))
 
-    create_permanent_task(run_by_the_minute_tasks)
-    create_permanent_task(purge_audit_data)
-    create_permanent_task(collect_exchange_rates_data)
-
     # server logs for websocket
     if settings.lnbits_admin_ui:
         server_log_task = initialize_server_websocket_logger()
         create_permanent_task(server_log_task)
+        # every worker reloads the settings changed by another worker
+        create_permanent_task(settings_watcher.run)
@@ -24,21 +24,34 @@ from lnbits.core.crud import (
     get_installed_extensions,
     get_payment,
     get_payments,
+    get_wallet_balance_mismatches,
+    rebuild_wallet_balances,
     remove_deleted_wallets,
     update_payment,
 )
 from lnbits.core.helpers import is_valid_url, migrate_databases
-from lnbits.core.models import Account, Payment, PaymentState
+from lnbits.core.models import (
+    Account,
+    Payment,
+    PaymentExportFormat,
+    PaymentFilters,
+    PaymentState,
+)
 from lnbits.core.models.extensions import (
     CreateExtension,
     ExtensionRelease,
     InstallableExtension,
 )
-from lnbits.core.services import check_admin_settings, create_user_account_no_ckeck
+from lnbits.core.services import (
+    check_admin_settings,
+    create_user_account_no_ckeck,
+    export_payments,
+)
 from lnbits.core.views.extension_api import (
     api_install_extension,
     api_uninstall_extension,
 )
+from lnbits.db import Filter, Filters
 from lnbits.settings import settings
 from lnbits.utils.crypto import AESCipher
 from lnbits.wallets.base import Wallet
@@ -204,6 +217,74 @@ async def database_revert_payment(checking_id: str):
         click.echo(f"Payment '{checking_id}' marked as pending.")
 
 
+@db.command("reconcile-balances")
+@click.option(
+    "-f", "--fix", is_flag=True, help="Rebuild the balances if they do not match."
+)
+@coro
+async def database_reconcile_balances(fix: bool = False):
+    """Verify the materialized wallet balances against the payments"""
+    async with core_db.connect() as conn:
+        mismatches = await get_wallet_balance_mismatches(conn)
+        click.echo(f"Mismatched wallet balances: {len(mismatches)}")
+        for mismatch in mismatches:
+            click.echo(
+                f"  {mismatch.wallet_id}: ledger={mismatch.ledger_balance_msat}"
+                f" expected={mismatch.expected_balance_msat} (msat)"
+            )
+        if not mismatches or not fix:
+            return
+
+        await rebuild_wallet_balances(conn)
+        mismatches = await get_wallet_balance_mismatches(conn)
+        click.echo(f"Balances rebuilt. Mismatched wallet balances: {len(mismatches)}")
+
+
+@db.command("export-payments")
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice([f.value for f in PaymentExportFormat]),
+    default=PaymentExportFormat.CSV.value,
+    show_default=True,
+    help="Output format.",
+)
+@click.option("-w", "--wallet", help="Only export payments of this wallet.")
+@click.option("-o", "--output", type=click.File("w"), default="-", help="Output file.")
+@click.option(
+    "--filter",
+    "filter_values",
+    multiple=True,
+    help="Payment filter as in the API, e.g. 'status[eq]=success'. Repeatable.",
+)
+@click.option("-s", "--search", help="Text based search.")
+@coro
+async def database_export_payments(
+    export_format: str,
+    output,
+    wallet: str | None = None,
+    filter_values: tuple[str, ...] = (),
+    search: str | None = None,
+):
+    """Export payments as CSV or JSON lines"""
+    filters: list[Filter] = []
+    for i, value in enumerate(filter_values):
+        key, _, raw_value = value.partition("=")
+        try:
+            filters.append(Filter.parse_query(key, [raw_value], PaymentFilters, i))
+        except ValueError as exc:
+            raise click.BadParameter(
+                f"'{value}': {exc}", param_hint="--filter"
+            ) from exc
+    chunks = export_payments(
+        PaymentExportFormat(export_format),
+        wallet_id=wallet,
+        filters=Filters(filters=filters, search=search, model=PaymentFilters),
+    )
+    async for chunk in chunks:
+        output.write(chunk)
+
+
 @db.command("check-payments")
 @click.option("-d", "--days", help="Maximum age of payments in days.")
 @click.option("-l", "--limit", help="Maximum number of payments to be checked.")
@@ -243,6 +324,7 @@ async def check_invalid_payments(
     wallet_class = getattr(wallets_module, settings.lnbits_backend_wallet_class)
 
     funding_source: Wallet = wallet_class()
+    await funding_source.startup()
 
     click.echo("Funding source: " + str(funding_source))
 
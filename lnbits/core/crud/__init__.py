@@ -1,4 +1,5 @@
 from .audit import create_audit_entry
+from .balances import get_wallet_balance_mismatches, rebuild_wallet_balances
 from .db_versions import (
     delete_dbversion,
     get_db_version,
@@ -31,9 +32,13 @@ from .payments import (
     get_payments_history,
     get_payments_paginated,
     get_standalone_payment,
+    get_standalone_payments,
     get_wallet_payment,
     is_internal_status_success,
     mark_webhook_sent,
+    settle_incoming_payments,
+    settle_pending_payment,
+    stream_payments,
     update_payment,
     update_payment_checking_id,
     update_payment_extra,
@@ -42,7 +47,9 @@ from .settings import (
     create_admin_settings,
     delete_admin_settings,
     get_admin_settings,
+    get_settings_version,
     get_super_settings,
+    increment_settings_version,
     reset_core_settings,
     update_admin_settings,
     update_super_user,
@@ -74,8 +81,14 @@ from .wallets import (
     get_wallet_for_key,
     get_wallets,
     remove_deleted_wallets,
+    reset_wallet_keys,
     update_wallet,
 )
+from .webhooks import (
+    create_webhook_delivery,
+    get_webhook_delivery,
+    update_webhook_delivery,
+)
 from .webpush import (
     create_webpush_subscription,
     delete_webpush_subscription,
@@ -95,6 +108,7 @@ __all__ = [
     "create_tinyurl",
     "create_user_extension",
     "create_wallet",
+    "create_webhook_delivery",
     "create_webpush_subscription",
     "delete_account",
     "delete_accounts_no_wallets",
@@ -127,7 +141,9 @@ __all__ = [
     "get_payments",
     "get_payments_history",
     "get_payments_paginated",
+    "get_settings_version",
     "get_standalone_payment",
+    "get_standalone_payments",
     "get_super_settings",
     "get_tinyurl",
     "get_tinyurl_by_url",
@@ -139,15 +155,23 @@ __all__ = [
     "get_user_extensions",
     "get_user_from_account",
     "get_wallet",
+    "get_wallet_balance_mismatches",
     "get_wallet_for_key",
     "get_wallet_payment",
     "get_wallets",
+    "get_webhook_delivery",
     "get_webpush_subscription",
     "get_webpush_subscriptions_for_user",
+    "increment_settings_version",
     "is_internal_status_success",
     "mark_webhook_sent",
+    "rebuild_wallet_balances",
     "remove_deleted_wallets",
     "reset_core_settings",
+    "reset_wallet_keys",
+    "settle_incoming_payments",
+    "settle_pending_payment",
+    "stream_payments",
     "update_account",
     "update_admin_settings",
     "update_installed_extension",
@@ -159,4 +183,5 @@ __all__ = [
     "update_super_user",
     "update_user_extension",
     "update_wallet",
+    "update_webhook_delivery",
 ]
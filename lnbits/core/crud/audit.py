@@ -11,6 +11,13 @@ async def create_audit_entry(
     await (conn or db).insert("audit", entry)
 
 
+async def create_audit_entries(
+    entries: list[AuditEntry],
+    conn: Connection | None = None,
+) -> None:
+    await (conn or db).insert_many("audit", entries)
+
+
 async def get_audit_entries(
     filters: Filters[AuditFilters] | None = None,
     conn: Connection | None = None,
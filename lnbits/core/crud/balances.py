@@ -0,0 +1,113 @@
+from time import time
+
+from lnbits.core.db import db
+from lnbits.core.models import PaymentState
+from lnbits.core.models.wallets import WalletBalanceMismatch
+from lnbits.db import Connection
+from lnbits.utils.cache import cache
+
+# same rules as the `balances` view: incoming payments count once they succeed,
+# outgoing payments (and their fee reserve) already count while pending
+_expected_balances_query = f"""
+    SELECT wallet_id, SUM(amount - ABS(fee)) AS balance FROM apipayments
+    WHERE (status = '{PaymentState.SUCCESS}' AND amount > 0)
+        OR (
+            status IN ('{PaymentState.SUCCESS}', '{PaymentState.PENDING}')
+            AND amount < 0
+        )
+    GROUP BY wallet_id
+"""  # noqa: S608
+
+
+def payment_balance_msat(amount: int, fee: int, status: str) -> int:
+    """The amount that a payment contributes to the balance of its wallet."""
+    if amount > 0 and status == PaymentState.SUCCESS.value:
+        return amount - abs(fee)
+    if amount < 0 and status in {
+        PaymentState.SUCCESS.value,
+        PaymentState.PENDING.value,
+    }:
+        return amount - abs(fee)
+    return 0
+
+
+async def increment_wallet_balance(
+    wallet_id: str, delta_msat: int, conn: Connection | None = None
+) -> None:
+    if delta_msat == 0:
+        return
+    await (conn or db).execute(
+        # Timestamp placeholder is safe from SQL injection (not user input)
+        f"""
+        INSERT INTO wallet_balances (wallet_id, balance, updated_at)
+        VALUES (:wallet_id, :delta, {db.timestamp_placeholder('now')})
+        ON CONFLICT (wallet_id) DO UPDATE
+        SET balance = wallet_balances.balance + :delta,
+            updated_at = {db.timestamp_placeholder('now')}
+        """,  # noqa: S608
+        {"wallet_id": wallet_id, "delta": delta_msat, "now": int(time())},
+    )
+    cache.invalidate_tag(f"wallet:{wallet_id}")
+
+
+async def get_wallet_balance_mismatches(
+    conn: Connection | None = None,
+) -> list[WalletBalanceMismatch]:
+    """
+    Compare the materialized `wallet_balances` with the sum over all payments.
+    """
+    ledger = await (conn or db).fetchall(
+        "SELECT wallet_id, balance FROM wallet_balances"
+    )
+    expected = await (conn or db).fetchall(_expected_balances_query)
+
+    ledger_balances = {row["wallet_id"]: int(row["balance"]) for row in ledger}
+    expected_balances = {row["wallet_id"]: int(row["balance"] or 0) for row in expected}
+
+    mismatches = []
+    for wallet_id in sorted(ledger_balances.keys() | expected_balances.keys()):
+        ledger_balance = ledger_balances.get(wallet_id, 0)
+        expected_balance = expected_balances.get(wallet_id, 0)
+        if ledger_balance != expected_balance:
+            mismatches.append(
+                WalletBalanceMismatch(
+                    wallet_id=wallet_id,
+                    ledger_balance_msat=ledger_balance,
+                    expected_balance_msat=expected_balance,
+                )
+            )
+    return mismatches
+
+
+async def rebuild_wallet_balances(conn: Connection) -> None:
+    """Recompute all materialized balances from `apipayments`."""
+    async with conn.transaction():
+        await conn.execute("DELETE FROM wallet_balances")
+        await conn.execute(
+            # The query is a static string, not user input
+            f"""
+            INSERT INTO wallet_balances (wallet_id, balance)
+            SELECT wallet_id, balance FROM ({_expected_balances_query}) AS expected
+            """  # noqa: S608
+        )
+
+
+async def debit_wallet_balance(
+    wallet_id: str, amount_msat: int, conn: Connection | None = None
+) -> bool:
+    """
+    Conditional debit: only succeeds if the balance covers `amount_msat`.
+    The check and the update are one statement, so concurrent debits (from any
+    worker process) can never take the balance below zero.
+    """
+    result = await (conn or db).execute(
+        # Timestamp placeholder is safe from SQL injection (not user input)
+        f"""
+        UPDATE wallet_balances
+        SET balance = balance - :amount, updated_at = {db.timestamp_placeholder('now')}
+        WHERE wallet_id = :wallet_id AND balance >= :amount
+        """,  # noqa: S608
+        {"wallet_id": wallet_id, "amount": abs(amount_msat), "now": int(time())},
+    )
+    cache.invalidate_tag(f"wallet:{wallet_id}")
+    return result.rowcount == 1
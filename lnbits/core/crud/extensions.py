@@ -4,6 +4,7 @@ from lnbits.core.models.extensions import (
     UserExtension,
 )
 from lnbits.db import Connection, Database
+from lnbits.utils.cache import cache
 
 
 async def create_installed_extension(
@@ -117,6 +118,7 @@ async def create_user_extension(
     user_extension: UserExtension, conn: Connection | None = None
 ) -> None:
     await (conn or db).insert("extensions", user_extension)
+    cache.invalidate_tag(f"user:{user_extension.user}")
 
 
 async def update_user_extension(
@@ -124,6 +126,7 @@ async def update_user_extension(
 ) -> None:
     where = """WHERE extension = :extension AND "user" = :user"""
     await (conn or db).update("extensions", user_extension, where)
+    cache.invalidate_tag(f"user:{user_extension.user}")
 
 
 async def get_user_active_extensions_ids(
@@ -1,11 +1,20 @@
+from collections.abc import AsyncIterator
 from datetime import datetime, timezone
 from time import time
 from typing import Any
 
+from sqlalchemy.exc import IntegrityError
+
+from lnbits.core.crud.balances import (
+    debit_wallet_balance,
+    increment_wallet_balance,
+    payment_balance_msat,
+)
 from lnbits.core.crud.wallets import get_total_balance, get_wallet, get_wallets_ids
 from lnbits.core.db import db
 from lnbits.core.models import PaymentState
 from lnbits.db import Connection, DateTrunc, Filters, Page
+from lnbits.exceptions import PaymentError
 
 from ..models import (
     CreatePayment,
@@ -67,6 +76,33 @@ async def get_standalone_payment(
     return row
 
 
+async def get_standalone_payments(
+    checking_ids_or_hashes: list[str],
+    incoming: bool | None = False,
+    conn: Connection | None = None,
+) -> list[Payment]:
+    """Like `get_standalone_payment`, but for many payments in one query."""
+    if not checking_ids_or_hashes:
+        return []
+    values = {f"id_{i}": v for i, v in enumerate(checking_ids_or_hashes)}
+    placeholders = ", ".join(f":{key}" for key in values)
+    clause = f"checking_id IN ({placeholders}) OR payment_hash IN ({placeholders})"
+    if incoming:
+        clause = f"({clause}) AND amount > 0"
+
+    return await (conn or db).fetchall(
+        # This query is safe from SQL injection
+        # The `clause` only contains placeholders
+        f"""
+        SELECT * FROM apipayments
+        WHERE {clause}
+        ORDER BY amount
+        """,  # noqa: S608
+        values,
+        Payment,
+    )
+
+
 async def get_wallet_payment(
     wallet_id: str, payment_hash: str, conn: Connection | None = None
 ) -> Payment | None:
@@ -182,9 +218,41 @@ async def get_payments_paginated(  # noqa: C901
         filters=filters,
         model=Payment,
         table_name="apipayments",
+        cursor_field="checking_id",
+        trusted=True,
     )
 
 
+async def stream_payments(
+    *,
+    wallet_id: str | None = None,
+    user_id: str | None = None,
+    filters: Filters[PaymentFilters] | None = None,
+    chunk_size: int = 1000,
+    conn: Connection | None = None,
+) -> AsyncIterator[list[Payment]]:
+    """
+    All payments matching the filters, in chunks ordered by `time`.
+    Chunks are fetched one at a time with keyset pagination and without counting
+    the payments, memory use does not depend on the number of payments.
+    """
+    filters = filters or Filters(model=PaymentFilters)
+    # `time` is never NULL, so the keyset cursor always moves forward
+    filters.sortby = "time"
+    filters.limit = min(chunk_size, 1000)
+    filters.offset = None
+    filters.count = "none"
+    while True:
+        page = await get_payments_paginated(
+            wallet_id=wallet_id, user_id=user_id, filters=filters, conn=conn
+        )
+        if page.data:
+            yield page.data
+        if not page.next_cursor:
+            return
+        filters.cursor = page.next_cursor
+
+
 async def get_payments(
     *,
     wallet_id: str | None = None,
@@ -271,7 +339,12 @@ async def create_payment(
     data: CreatePayment,
     status: PaymentState = PaymentState.PENDING,
     conn: Connection | None = None,
+    reserve_balance: bool = False,
 ) -> Payment:
+    """
+    If `reserve_balance` is set, a payment that lowers the wallet balance is only
+    created if the balance covers it, otherwise `PaymentError` is raised.
+    """
     # we don't allow the creation of the same invoice twice
     # note: this can be removed if the db uniqueness constraints are set appropriately
     previous_payment = await get_standalone_payment(checking_id, conn=conn)
@@ -296,11 +369,130 @@ async def create_payment(
         labels=data.labels or [],
     )
 
-    await (conn or db).insert("apipayments", payment)
+    balance_msat = payment_balance_msat(payment.amount, payment.fee, payment.status)
+    try:
+        async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+            async with new_conn.transaction():
+                await new_conn.insert("apipayments", payment)
+                if reserve_balance and balance_msat < 0:
+                    if not await debit_wallet_balance(
+                        payment.wallet_id, balance_msat, new_conn
+                    ):
+                        raise PaymentError("Insufficient balance.", status="failed")
+                else:
+                    await increment_wallet_balance(
+                        payment.wallet_id, balance_msat, new_conn
+                    )
+    except IntegrityError as exc:
+        # a concurrent request (or worker) created the same payment first
+        raise ValueError("Payment already exists") from exc
 
     return payment
 
 
+async def settle_pending_payment(
+    payment: Payment, conn: Connection | None = None
+) -> bool:
+    """
+    Mark a pending payment as successful.
+    Returns False if it is not pending anymore (e.g. settled by another request).
+    """
+    previous_msat = payment_balance_msat(
+        payment.amount, payment.fee, PaymentState.PENDING.value
+    )
+    current_msat = payment_balance_msat(
+        payment.amount, payment.fee, PaymentState.SUCCESS.value
+    )
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        async with new_conn.transaction():
+            result = await new_conn.execute(
+                # Timestamp placeholder is safe from SQL injection (not user input)
+                f"""
+                UPDATE apipayments
+                SET status = :success, updated_at = {db.timestamp_placeholder('now')}
+                WHERE checking_id = :checking_id AND status = :pending
+                """,  # noqa: S608
+                {
+                    "success": PaymentState.SUCCESS.value,
+                    "pending": PaymentState.PENDING.value,
+                    "checking_id": payment.checking_id,
+                    "now": int(time()),
+                },
+            )
+            if result.rowcount != 1:
+                return False
+            await increment_wallet_balance(
+                payment.wallet_id, current_msat - previous_msat, new_conn
+            )
+    payment.status = PaymentState.SUCCESS
+    return True
+
+
+async def settle_incoming_payments(
+    payments: list[Payment], conn: Connection | None = None
+) -> None:
+    """
+    Mark incoming payments as successful (with their `fee` and `preimage`)
+    in one statement and apply the balance changes.
+    """
+    if not payments:
+        return
+    ids = {f"id_{i}": payment.checking_id for i, payment in enumerate(payments)}
+    placeholders = ", ".join(f":{key}" for key in ids)
+    values: dict[str, Any] = {
+        **ids,
+        "success": PaymentState.SUCCESS.value,
+        "now": int(time()),
+    }
+    fee_cases = []
+    preimage_cases = []
+    for i, payment in enumerate(payments):
+        values[f"fee_{i}"] = payment.fee
+        fee_cases.append(f"WHEN :id_{i} THEN :fee_{i}")
+        if payment.preimage:
+            values[f"preimage_{i}"] = payment.preimage
+            preimage_cases.append(f"WHEN :id_{i} THEN :preimage_{i}")
+    set_preimage = (
+        f", preimage = CASE checking_id {' '.join(preimage_cases)} ELSE preimage END"
+        if preimage_cases
+        else ""
+    )
+
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        async with new_conn.transaction():
+            previous = await new_conn.fetchall(
+                # The query only contains placeholders
+                f"""
+                SELECT checking_id, wallet_id, amount, fee, status FROM apipayments
+                WHERE checking_id IN ({placeholders}) AND amount > 0
+                {db.for_update}
+                """,  # noqa: S608
+                ids,
+            )
+            await new_conn.execute(
+                # The query only contains placeholders
+                f"""
+                UPDATE apipayments
+                SET status = :success,
+                    fee = CASE checking_id {' '.join(fee_cases)} ELSE fee END,
+                    updated_at = {db.timestamp_placeholder('now')}
+                    {set_preimage}
+                WHERE checking_id IN ({placeholders}) AND amount > 0
+                """,  # noqa: S608
+                values,
+            )
+
+            fees = {payment.checking_id: payment.fee for payment in payments}
+            deltas: dict[str, int] = {}
+            for row in previous:
+                delta = payment_balance_msat(
+                    row["amount"], fees[row["checking_id"]], PaymentState.SUCCESS.value
+                ) - payment_balance_msat(row["amount"], row["fee"], row["status"])
+                deltas[row["wallet_id"]] = deltas.get(row["wallet_id"], 0) + delta
+            for wallet_id, delta in deltas.items():
+                await increment_wallet_balance(wallet_id, delta, new_conn)
+
+
 async def update_payment_checking_id(
     checking_id: str, new_checking_id: str, conn: Connection | None = None
 ) -> None:
@@ -324,11 +516,40 @@ async def update_payment(
     conn: Connection | None = None,
 ) -> None:
     payment.updated_at = datetime.now(timezone.utc)
-    await (conn or db).update(
-        "apipayments", payment, "WHERE checking_id = :checking_id"
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        async with new_conn.transaction():
+            previous = await new_conn.fetchone(
+                f"""
+                SELECT wallet_id, amount, fee, status FROM apipayments
+                WHERE checking_id = :checking_id {new_conn.for_update}
+                """,  # noqa: S608
+                {"checking_id": payment.checking_id},
+            )
+            await new_conn.update(
+                "apipayments", payment, "WHERE checking_id = :checking_id"
+            )
+            if previous:
+                await _update_balance_for_payment_change(previous, payment, new_conn)
+            if new_checking_id and new_checking_id != payment.checking_id:
+                await update_payment_checking_id(
+                    payment.checking_id, new_checking_id, new_conn
+                )
+
+
+async def _update_balance_for_payment_change(
+    previous: dict, payment: Payment, conn: Connection
+) -> None:
+    previous_msat = payment_balance_msat(
+        previous["amount"], previous["fee"], previous["status"]
     )
-    if new_checking_id and new_checking_id != payment.checking_id:
-        await update_payment_checking_id(payment.checking_id, new_checking_id, conn)
+    current_msat = payment_balance_msat(payment.amount, payment.fee, payment.status)
+    if previous["wallet_id"] == payment.wallet_id:
+        await increment_wallet_balance(
+            payment.wallet_id, current_msat - previous_msat, conn
+        )
+        return
+    await increment_wallet_balance(previous["wallet_id"], -previous_msat, conn)
+    await increment_wallet_balance(payment.wallet_id, current_msat, conn)
 
 
 async def get_payments_history(
@@ -532,10 +753,32 @@ async def get_wallets_stats(
 async def delete_wallet_payment(
     checking_id: str, wallet_id: str, conn: Connection | None = None
 ) -> None:
-    await (conn or db).execute(
-        "DELETE FROM apipayments WHERE checking_id = :checking_id AND wallet = :wallet",
-        {"checking_id": checking_id, "wallet": wallet_id},
-    )
+    async with db.reuse_conn(conn) if conn else db.connect() as conn:
+        async with conn.transaction():
+            payment = await conn.fetchone(
+                f"""
+                SELECT amount, fee, status FROM apipayments
+                WHERE checking_id = :checking_id AND wallet_id = :wallet
+                {conn.for_update}
+                """,  # noqa: S608
+                {"checking_id": checking_id, "wallet": wallet_id},
+            )
+            if not payment:
+                return
+            await conn.execute(
+                """
+                DELETE FROM apipayments
+                WHERE checking_id = :checking_id AND wallet_id = :wallet
+                """,
+                {"checking_id": checking_id, "wallet": wallet_id},
+            )
+            await increment_wallet_balance(
+                wallet_id,
+                -payment_balance_msat(
+                    payment["amount"], payment["fee"], payment["status"]
+                ),
+                conn,
+            )
 
 
 async def check_internal(
@@ -4,7 +4,7 @@ from typing import Any
 from loguru import logger
 
 from lnbits.core.db import db
-from lnbits.db import dict_to_model
+from lnbits.db import POSTGRES, dict_to_model
 from lnbits.settings import (
     AdminSettings,
     EditableSettings,
@@ -51,6 +51,7 @@ async def update_admin_settings(
         except Exception as exc:
             logger.warning(exc)
             logger.warning(f"Failed to update settings for '{tag}.{key}'.")
+    await increment_settings_version()
 
 
 async def update_super_user(super_user: str) -> SuperSettings:
@@ -79,6 +80,7 @@ async def reset_core_settings() -> None:
         )
         """,
     )
+    await increment_settings_version()
 
 
 async def create_admin_settings(super_user: str, new_settings: dict) -> SuperSettings:
@@ -105,7 +107,8 @@ async def get_settings_field(
     )
     if not row:
         return None
-    return SettingsField(id=row["id"], value=json.loads(row["value"]), tag=row["tag"])
+    value = json.loads(row["value"]) if row["value"] is not None else None
+    return SettingsField(id=row["id"], value=value, tag=row["tag"])
 
 
 async def set_settings_field(id_: str, value: Any | None, tag: str | None = "core"):
@@ -136,3 +139,37 @@ async def get_settings_by_tag(tag: str) -> dict[str, Any] | None:
             )
     data.pop("super_user")
     return data
+
+
+# Postgres channel that is notified of new settings versions
+SETTINGS_CHANNEL = "lnbits_settings"
+
+
+async def get_settings_version() -> int:
+    row: dict = await db.fetchone(
+        "SELECT version FROM settings_version WHERE id = 'core'"
+    )
+    return row["version"] if row else 0
+
+
+async def increment_settings_version() -> int:
+    """Tell the other workers to reload the settings."""
+    async with db.connect() as conn:
+        async with conn.transaction():
+            await conn.execute(
+                f"""
+                UPDATE settings_version
+                SET version = version + 1, updated_at = {db.timestamp_now}
+                WHERE id = 'core'
+                """  # noqa: S608
+            )
+            row: dict = await conn.fetchone(
+                "SELECT version FROM settings_version WHERE id = 'core'"
+            )
+            if db.type == POSTGRES:
+                # delivered to the listeners when the transaction commits
+                await conn.execute(
+                    "SELECT pg_notify(:channel, :version)",
+                    {"channel": SETTINGS_CHANNEL, "version": str(row["version"])},
+                )
+    return row["version"]
@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+
+from lnbits.core.db import db
+from lnbits.core.models import TaskLease
+from lnbits.db import Connection
+
+
+async def acquire_task_lease(
+    name: str,
+    owner: str,
+    lease_seconds: int,
+    conn: Connection | None = None,
+) -> bool:
+    """
+    Take the lease if it is free or expired, renew it if `owner` already holds it.
+    Returns `True` if `owner` holds the lease now.
+    """
+    now = datetime.now(timezone.utc)
+    result = await (conn or db).execute(
+        # Timestamp placeholders are safe from SQL injection (not user input)
+        f"""
+        INSERT INTO task_leases (name, owner, expires_at, updated_at)
+        VALUES (:name, :owner, {db.timestamp_placeholder("expires_at")},
+            {db.timestamp_placeholder("now")})
+        ON CONFLICT (name) DO UPDATE SET
+            owner = :owner,
+            expires_at = {db.timestamp_placeholder("expires_at")},
+            updated_at = {db.timestamp_placeholder("now")}
+        WHERE task_leases.owner = :owner
+            OR task_leases.expires_at < {db.timestamp_placeholder("now")}
+        """,  # noqa: S608
+        {
+            "name": name,
+            "owner": owner,
+            "expires_at": int((now + timedelta(seconds=lease_seconds)).timestamp()),
+            "now": int(now.timestamp()),
+        },
+    )
+    return result.rowcount == 1
+
+
+async def release_task_leases(
+    owner: str,
+    conn: Connection | None = None,
+) -> None:
+    await (conn or db).execute(
+        "DELETE FROM task_leases WHERE owner = :owner", {"owner": owner}
+    )
+
+
+async def get_task_leases(
+    conn: Connection | None = None,
+) -> list[TaskLease]:
+    return await (conn or db).fetchall(
+        "SELECT * FROM task_leases ORDER BY name", model=TaskLease
+    )
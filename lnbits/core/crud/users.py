@@ -4,11 +4,17 @@ from typing import Any
 from uuid import uuid4
 
 from lnbits.core.crud.extensions import get_user_active_extensions_ids
-from lnbits.core.crud.wallets import clear_wallet_cache, create_wallet, get_wallets
+from lnbits.core.crud.wallets import (
+    clear_wallet_cache,
+    create_wallet,
+    get_wallets,
+    wallet_cache_tags,
+)
 from lnbits.core.db import db
 from lnbits.core.models import UserAcls
 from lnbits.db import Connection, Filters, Page
 from lnbits.helpers import sha256s
+from lnbits.settings import settings
 from lnbits.utils.cache import cache
 
 from ..models import (
@@ -35,6 +41,7 @@ async def create_account(
 async def update_account(account: Account, conn: Connection | None = None) -> Account:
     account.updated_at = datetime.now(timezone.utc)
     await (conn or db).update("accounts", account)
+    await cache.ainvalidate_tag(f"user:{account.id}")
     return account
 
 
@@ -74,7 +81,7 @@ async def get_accounts(
             accounts.external_id,
             accounts.activated,
             SUM(COALESCE((
-                SELECT balance FROM balances WHERE wallet_id = wallets.id
+                SELECT balance FROM wallet_balances WHERE wallet_id = wallets.id
             ), 0)) as balance_msat,
             SUM((
                 SELECT COUNT(*) FROM apipayments WHERE wallet_id = wallets.id
@@ -202,6 +209,18 @@ async def get_account_by_username_or_email(
     )
 
 
+def _user_cache_tags(user: User) -> list[str]:
+    tags = [f"user:{user.id}"]
+    for wallet in user.wallets:
+        tags.extend(wallet_cache_tags(wallet))
+    return tags
+
+
+@cache.memoize(
+    "crud:user",
+    expiry=lambda: settings.lnbits_crud_cache_seconds,
+    tags=_user_cache_tags,
+)
 async def get_user(
     user_id: str, active_only: bool = True, conn: Connection | None = None
 ) -> User | None:
@@ -266,12 +285,14 @@ async def get_user_access_control_lists(
 
 
 async def clear_user_id_cache(user_id: str):
+    await cache.ainvalidate_tag(f"user:{user_id}")
     user = await get_user(user_id, active_only=True)
     if user:
         clear_user_cache(user)
 
 
 def clear_user_cache(user: User):
+    cache.invalidate_tag(f"user:{user.id}")
     user_cache_key: str | None = cache.pop(
         f"auth:user:cache_key:{sha256s(user.id)}", None
     )
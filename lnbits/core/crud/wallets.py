@@ -3,8 +3,16 @@ from time import time
 from uuid import uuid4
 
 from lnbits.core.db import db
-from lnbits.core.models.wallets import BaseWallet, WalletsFilters, WalletType
-from lnbits.db import Connection, Filters, Page
+from lnbits.core.models.wallets import (
+    BaseWallet,
+    KeyType,
+    WalletAuth,
+    WalletKey,
+    WalletsFilters,
+    WalletType,
+)
+from lnbits.db import Connection, Filters, Page, dict_to_model
+from lnbits.helpers import sha256s
 from lnbits.settings import settings
 from lnbits.utils.cache import cache
 
@@ -31,7 +39,11 @@ async def create_wallet(
         currency=settings.lnbits_default_accounting_currency or "USD",
     )
 
-    await (conn or db).insert("wallets", wallet)
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        async with new_conn.transaction():
+            await new_conn.insert("wallets", wallet)
+            await _insert_wallet_keys(wallet, new_conn)
+    cache.invalidate_tag(f"user:{user_id}")
     return wallet
 
 
@@ -41,6 +53,26 @@ async def update_wallet(
 ) -> Wallet:
     wallet.updated_at = datetime.now(timezone.utc)
     await (conn or db).update("wallets", wallet)
+    await cache.ainvalidate_tag(f"wallet:{wallet.id}")
+    return wallet
+
+
+async def reset_wallet_keys(
+    wallet: Wallet,
+    conn: Connection | None = None,
+) -> Wallet:
+    """Replace the admin and invoice keys of `wallet` with new ones."""
+    clear_wallet_cache(wallet)
+    wallet.adminkey = uuid4().hex
+    wallet.inkey = uuid4().hex
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        async with new_conn.transaction():
+            await new_conn.execute(
+                "DELETE FROM wallet_keys WHERE wallet_id = :wallet",
+                {"wallet": wallet.id},
+            )
+            await _insert_wallet_keys(wallet, new_conn)
+            await update_wallet(wallet, new_conn)
     return wallet
 
 
@@ -50,7 +82,7 @@ async def delete_wallet(
     deleted: bool = True,
     conn: Connection | None = None,
 ) -> None:
-    clear_wallet_id_cache(wallet_id)
+    await cache.ainvalidate_tag(f"wallet:{wallet_id}")
     now = int(time())
 
     await (conn or db).execute(
@@ -65,17 +97,21 @@ async def delete_wallet(
 
 
 async def force_delete_wallet(wallet_id: str, conn: Connection | None = None) -> None:
-    clear_wallet_id_cache(wallet_id)
+    await cache.ainvalidate_tag(f"wallet:{wallet_id}")
     await (conn or db).execute(
         "DELETE FROM wallets WHERE id = :wallet",
         {"wallet": wallet_id},
     )
+    await (conn or db).execute(
+        "DELETE FROM wallet_keys WHERE wallet_id = :wallet",
+        {"wallet": wallet_id},
+    )
 
 
 async def delete_wallet_by_id(
     wallet_id: str, conn: Connection | None = None
 ) -> int | None:
-    clear_wallet_id_cache(wallet_id)
+    await cache.ainvalidate_tag(f"wallet:{wallet_id}")
     now = int(time())
     result = await (conn or db).execute(
         # Timestamp placeholder is safe from SQL injection (not user input)
@@ -91,6 +127,7 @@ async def delete_wallet_by_id(
 
 async def remove_deleted_wallets(conn: Connection | None = None) -> None:
     await (conn or db).execute("DELETE FROM wallets WHERE deleted = true")
+    await _delete_orphaned_wallet_keys(conn)
 
 
 async def delete_unused_wallets(
@@ -110,6 +147,7 @@ async def delete_unused_wallets(
         """,
         {"delta": delta},
     )
+    await _delete_orphaned_wallet_keys(conn)
 
 
 async def get_standalone_wallet(
@@ -117,7 +155,7 @@ async def get_standalone_wallet(
 ) -> Wallet | None:
     query = """
             SELECT *, COALESCE((
-                SELECT balance FROM balances WHERE wallet_id = wallets.id
+                SELECT balance FROM wallet_balances WHERE wallet_id = wallets.id
             ), 0) AS balance_msat FROM wallets
             WHERE id = :wallet
             """
@@ -150,7 +188,7 @@ async def get_wallets(
 ) -> list[Wallet]:
     query = """
             SELECT *, COALESCE((
-                SELECT balance FROM balances WHERE wallet_id = wallets.id
+                SELECT balance FROM wallet_balances WHERE wallet_id = wallets.id
             ), 0) AS balance_msat FROM wallets
             WHERE "user" = :user
             """
@@ -166,6 +204,7 @@ async def get_wallets(
             "wallet_type": wallet_type.value if wallet_type else None,
         },
         Wallet,
+        trusted=True,
     )
 
     return await get_source_wallets(wallets, conn)
@@ -184,7 +223,7 @@ async def get_wallets_paginated(
     wallets = await (conn or db).fetch_page(
         """
             SELECT *, COALESCE((
-                SELECT balance FROM balances WHERE wallet_id = wallets.id
+                SELECT balance FROM wallet_balances WHERE wallet_id = wallets.id
             ), 0) AS balance_msat FROM wallets
         """,
         where=where,
@@ -192,6 +231,7 @@ async def get_wallets_paginated(
         filters=filters,
         model=Wallet,
         table_name="wallets",
+        trusted=True,
     )
 
     wallets.data = await get_source_wallets(wallets.data, conn)
@@ -220,6 +260,18 @@ async def get_wallets_count():
     return row.get("count", 0)
 
 
+def wallet_cache_tags(wallet: Wallet) -> list[str]:
+    tags = [f"wallet:{wallet.id}", f"user:{wallet.user}"]
+    if wallet.shared_wallet_id:
+        tags.append(f"wallet:{wallet.shared_wallet_id}")
+    return tags
+
+
+@cache.memoize(
+    "crud:wallet_for_key",
+    expiry=lambda: settings.lnbits_crud_cache_seconds,
+    tags=wallet_cache_tags,
+)
 async def get_wallet_for_key(
     key: str,
     conn: Connection | None = None,
@@ -227,15 +279,16 @@ async def get_wallet_for_key(
     wallet = await (conn or db).fetchone(
         """
         SELECT wallets.*, COALESCE((
-            SELECT balance FROM balances WHERE wallet_id = wallets.id
+            SELECT balance FROM wallet_balances WHERE wallet_id = wallets.id
         ), 0)
-        AS balance_msat FROM wallets
+        AS balance_msat FROM wallet_keys
+        INNER JOIN wallets ON wallets.id = wallet_keys.wallet_id
         INNER JOIN accounts ON wallets.user = accounts.id
-        WHERE (adminkey = :key OR inkey = :key)
+        WHERE wallet_keys.key_hash = :key_hash
             AND deleted = false
             AND accounts.activated = true
         """,
-        {"key": key},
+        {"key_hash": wallet_key_hash(key)},
         Wallet,
     )
     if not wallet:
@@ -253,13 +306,14 @@ async def get_base_wallet_for_key(
 ) -> BaseWallet | None:
     wallet = await (conn or db).fetchone(
         """
-        SELECT wallets.id, "user", wallet_type, adminkey, inkey FROM wallets
+        SELECT wallets.id, "user", wallet_type, adminkey, inkey FROM wallet_keys
+        INNER JOIN wallets ON wallets.id = wallet_keys.wallet_id
         INNER JOIN accounts ON wallets.user = accounts.id
-        WHERE (adminkey = :key OR inkey = :key)
+        WHERE wallet_keys.key_hash = :key_hash
             AND deleted = false
             AND accounts.activated = true
         """,
-        {"key": key},
+        {"key_hash": wallet_key_hash(key)},
         BaseWallet,
     )
     if not wallet:
@@ -268,6 +322,69 @@ async def get_base_wallet_for_key(
     return wallet
 
 
+async def get_wallet_auth_for_key(
+    key: str,
+    with_balance: bool = True,
+    conn: Connection | None = None,
+) -> WalletAuth | None:
+    """
+    The wallet of `key`, mirroring its source wallet if it is a shared wallet,
+    and the active extensions of its owner in a single query. Without
+    `with_balance` the balances are not looked up and left at 0.
+    """
+    balance = source_balance = "0"
+    if with_balance:
+        balance = """COALESCE((
+            SELECT balance FROM wallet_balances WHERE wallet_id = wallets.id
+        ), 0)"""
+        source_balance = """COALESCE((
+            SELECT balance FROM wallet_balances WHERE wallet_id = source.id
+        ), 0)"""
+
+    rows: list[dict] = await (conn or db).fetchall(
+        # the balance subqueries are fixed SQL, not user input
+        f"""
+        SELECT wallets.*, {balance} AS balance_msat,
+            source.id AS source_id, source."user" AS source_user,
+            source.wallet_type AS source_wallet_type,
+            source.adminkey AS source_adminkey, source.inkey AS source_inkey,
+            source.name AS source_name, source.currency AS source_currency,
+            source.extra AS source_extra,
+            source.stored_paylinks AS source_stored_paylinks,
+            {source_balance} AS source_balance_msat,
+            extensions.extension AS active_extension
+        FROM wallet_keys
+        INNER JOIN wallets ON wallets.id = wallet_keys.wallet_id
+        INNER JOIN accounts ON wallets."user" = accounts.id
+        LEFT JOIN wallets AS source
+            ON source.id = wallets.shared_wallet_id AND source.deleted = false
+        LEFT JOIN extensions
+            ON extensions."user" = wallets."user" AND extensions.active
+        WHERE wallet_keys.key_hash = :key_hash
+            AND wallets.deleted = false
+            AND accounts.activated = true
+        """,  # noqa: S608
+        {"key_hash": wallet_key_hash(key)},
+    )
+    if not rows:
+        return None
+
+    # one row per active extension
+    row = rows[0]
+    wallet = dict_to_model(row, Wallet)
+    if wallet.is_lightning_shared_wallet:
+        if not row["source_id"]:
+            return None
+        source_row = {
+            name.removeprefix("source_"): value
+            for name, value in row.items()
+            if name.startswith("source_")
+        }
+        wallet.mirror_shared_wallet(dict_to_model(source_row, Wallet))
+    extensions = [r["active_extension"] for r in rows if r["active_extension"]]
+    return WalletAuth(wallet=wallet, active_extensions=extensions)
+
+
 async def get_source_wallet(
     wallet: Wallet, conn: Connection | None = None
 ) -> Wallet | None:
@@ -295,19 +412,47 @@ async def get_source_wallets(
 
 
 async def get_total_balance(conn: Connection | None = None):
-    result = await (conn or db).execute("SELECT SUM(balance) as balance FROM balances")
+    result = await (conn or db).execute(
+        """
+        SELECT SUM(wallet_balances.balance) as balance FROM wallet_balances
+        INNER JOIN wallets ON wallets.id = wallet_balances.wallet_id
+        WHERE wallets.deleted = false OR wallets.deleted is NULL
+        """
+    )
     row = result.mappings().first()
     return row.get("balance", 0) or 0
 
 
+def wallet_key_hash(key: str) -> str:
+    return sha256s(key)
+
+
+async def _insert_wallet_keys(wallet: BaseWallet, conn: Connection) -> None:
+    for key, key_type in [
+        (wallet.adminkey, KeyType.admin),
+        (wallet.inkey, KeyType.invoice),
+    ]:
+        wallet_key = WalletKey(
+            key_hash=wallet_key_hash(key), wallet_id=wallet.id, key_type=key_type.name
+        )
+        await conn.insert("wallet_keys", wallet_key)
+
+
+async def _delete_orphaned_wallet_keys(conn: Connection | None = None) -> None:
+    await (conn or db).execute(
+        """
+        DELETE FROM wallet_keys
+        WHERE NOT EXISTS (
+            SELECT 1 FROM wallets WHERE wallets.id = wallet_keys.wallet_id
+        )
+        """
+    )
+
+
 def clear_wallet_id_cache(wallet_id: str):
-    cached_wallet: BaseWallet | None = cache.pop(f"auth:wallet:{wallet_id}")
-    if cached_wallet:
-        cache.pop(f"auth:x-api-key:{cached_wallet.adminkey}")
-        cache.pop(f"auth:x-api-key:{cached_wallet.inkey}")
+    # also drops the wallet keys resolved for authentication
+    cache.invalidate_tag(f"wallet:{wallet_id}")
 
 
 def clear_wallet_cache(wallet: Wallet):
-    cache.pop(f"auth:wallet:{wallet.id}")
-    cache.pop(f"auth:x-api-key:{wallet.adminkey}")
-    cache.pop(f"auth:x-api-key:{wallet.inkey}")
+    clear_wallet_id_cache(wallet.id)
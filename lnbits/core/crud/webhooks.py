@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta, timezone
+
+from lnbits.core.db import db
+from lnbits.core.models import (
+    WebhookDelivery,
+    WebhookDeliveryFilters,
+    WebhookDeliveryStatus,
+)
+from lnbits.core.models.webhooks import WebhookOutboxStats
+from lnbits.db import Connection, Filters, Page
+
+
+async def create_webhook_delivery(
+    delivery: WebhookDelivery,
+    conn: Connection | None = None,
+) -> WebhookDelivery:
+    await (conn or db).insert("webhook_outbox", delivery)
+    return delivery
+
+
+async def get_webhook_delivery(
+    delivery_id: str,
+    conn: Connection | None = None,
+) -> WebhookDelivery | None:
+    return await (conn or db).fetchone(
+        "SELECT * FROM webhook_outbox WHERE id = :id",
+        {"id": delivery_id},
+        WebhookDelivery,
+    )
+
+
+async def get_webhook_deliveries(
+    filters: Filters[WebhookDeliveryFilters] | None = None,
+    conn: Connection | None = None,
+) -> Page[WebhookDelivery]:
+    return await (conn or db).fetch_page(
+        "SELECT * FROM webhook_outbox",
+        [],
+        {},
+        filters=filters,
+        model=WebhookDelivery,
+        table_name="webhook_outbox",
+    )
+
+
+async def get_due_webhook_deliveries(
+    limit: int,
+    exclude: set[str] | None = None,
+    conn: Connection | None = None,
+) -> list[WebhookDelivery]:
+    """Pending deliveries whose next attempt is due, oldest first."""
+    values: dict = {
+        "status": WebhookDeliveryStatus.PENDING.value,
+        "now": int(datetime.now(timezone.utc).timestamp()),
+        "limit": limit,
+    }
+    clause = ""
+    if exclude:
+        placeholders = []
+        for i, delivery_id in enumerate(exclude):
+            values[f"id_{i}"] = delivery_id
+            placeholders.append(f":id_{i}")
+        clause = f"AND id NOT IN ({', '.join(placeholders)})"
+    return await (conn or db).fetchall(
+        # `clause` only contains generated placeholders, not user input
+        f"""
+        SELECT * FROM webhook_outbox
+        WHERE status = :status AND next_attempt_at <= {db.timestamp_placeholder("now")}
+        {clause}
+        ORDER BY next_attempt_at LIMIT :limit
+        """,  # noqa: S608
+        values,
+        WebhookDelivery,
+    )
+
+
+async def update_webhook_delivery(
+    delivery: WebhookDelivery,
+    conn: Connection | None = None,
+) -> None:
+    delivery.updated_at = datetime.now(timezone.utc)
+    await (conn or db).update("webhook_outbox", delivery)
+
+
+async def claim_webhook_delivery(
+    delivery: WebhookDelivery,
+    until: datetime,
+    conn: Connection | None = None,
+) -> bool:
+    """
+    Move the next attempt of a pending delivery to `until`, so that no other
+    worker picks it up in the meantime. Fails if the delivery was changed
+    since it was read, e.g. claimed by another worker.
+    """
+    result = await (conn or db).execute(
+        # Timestamp placeholders are safe from SQL injection (not user input)
+        f"""
+        UPDATE webhook_outbox
+        SET next_attempt_at = {db.timestamp_placeholder("until")},
+            updated_at = {db.timestamp_now}
+        WHERE id = :id AND status = :status
+        AND next_attempt_at = {db.timestamp_placeholder("next_attempt_at")}
+        """,  # noqa: S608
+        {
+            "id": delivery.id,
+            "status": WebhookDeliveryStatus.PENDING.value,
+            "until": int(until.timestamp()),
+            "next_attempt_at": int(delivery.next_attempt_at.timestamp()),
+        },
+    )
+    if result.rowcount != 1:
+        return False
+    delivery.next_attempt_at = until
+    return True
+
+
+async def replay_failed_webhook_deliveries(
+    conn: Connection | None = None,
+) -> int:
+    """Schedule all failed deliveries for a new round of attempts."""
+    result = await (conn or db).execute(
+        f"""
+        UPDATE webhook_outbox
+        SET status = :pending, attempts = 0,
+            next_attempt_at = {db.timestamp_now}, updated_at = {db.timestamp_now}
+        WHERE status = :failed
+        """,  # noqa: S608
+        {
+            "pending": WebhookDeliveryStatus.PENDING.value,
+            "failed": WebhookDeliveryStatus.FAILED.value,
+        },
+    )
+    return result.rowcount
+
+
+async def delete_sent_webhook_deliveries(
+    retention_days: int,
+    conn: Connection | None = None,
+) -> None:
+    before = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    await (conn or db).execute(
+        # Timestamp placeholder is safe from SQL injection (not user input)
+        f"""
+        DELETE FROM webhook_outbox
+        WHERE status = :status AND updated_at < {db.timestamp_placeholder("before")}
+        """,  # noqa: S608
+        {
+            "status": WebhookDeliveryStatus.SENT.value,
+            "before": int(before.timestamp()),
+        },
+    )
+
+
+async def get_webhook_outbox_stats(
+    conn: Connection | None = None,
+) -> WebhookOutboxStats:
+    rows: list[dict] = await (conn or db).fetchall(
+        "SELECT status, COUNT(*) AS total FROM webhook_outbox GROUP BY status"
+    )
+    return WebhookOutboxStats(**{row["status"]: row["total"] for row in rows})
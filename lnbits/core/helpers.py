@@ -72,7 +72,7 @@ def to_valid_user_id(user_id: str) -> UUID:
 async def load_disabled_extension_list() -> None:
     """Update list of extensions that have been explicitly disabled"""
     inactive_extensions = await get_installed_extensions(active=False)
-    settings.lnbits_deactivated_extensions.update([e.id for e in inactive_extensions])
+    settings.deactivate_extensions([e.id for e in inactive_extensions])
 
 
 async def migrate_databases():
@@ -1,3 +1,4 @@
+import hashlib
 import json
 from time import time
 from typing import Any
@@ -864,3 +865,152 @@ async def m044_add_activated_to_accounts(db: Connection):
     Used for account activation status.
     """
     await db.execute("ALTER TABLE accounts ADD COLUMN activated BOOLEAN DEFAULT true")
+
+
+async def m045_create_wallet_balances_table(db: Connection):
+    """
+    Materialized wallet balances, maintained together with `apipayments`.
+    Replaces the aggregation over all payments done by the `balances` view.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS wallet_balances (
+            wallet_id TEXT PRIMARY KEY,
+            balance {db.big_int} NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO wallet_balances (wallet_id, balance)
+        SELECT wallet_id, SUM(amount - ABS(fee)) FROM apipayments
+        WHERE (status = 'success' AND amount > 0)
+            OR (status IN ('success', 'pending') AND amount < 0)
+        GROUP BY wallet_id
+        """
+    )
+
+
+async def m046_create_webhook_outbox(db: Connection):
+    """
+    Outbox of payment webhooks, delivered and retried by a background worker.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS webhook_outbox (
+            id TEXT PRIMARY KEY,
+            payment_hash TEXT NOT NULL,
+            url TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INT NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now},
+            last_status TEXT,
+            last_error TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now},
+            updated_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+    await db.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_webhook_outbox_status
+        ON webhook_outbox (status, next_attempt_at)
+        """
+    )
+
+
+async def m047_create_task_leases(db: Connection):
+    """
+    Leases of the background tasks that must run in only one worker process.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS task_leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+
+
+async def m048_create_settings_version(db: Connection):
+    """
+    Incremented on every change of the admin settings, so that all workers
+    reload them.
+    """
+    await db.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS settings_version (
+            id TEXT PRIMARY KEY,
+            version INT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT {db.timestamp_now}
+        );
+        """
+    )
+    await db.execute(
+        """
+        INSERT INTO settings_version (id, version) VALUES ('core', 0)
+        ON CONFLICT (id) DO NOTHING
+        """
+    )
+
+
+async def m049_create_wallet_keys(db: Connection):
+    """
+    Index of the wallet keys by their SHA256 hash, so that a key is resolved
+    with one probe of the primary key instead of `adminkey = :key OR inkey = :key`.
+    """
+    await db.execute(
+        """
+        CREATE TABLE IF NOT EXISTS wallet_keys (
+            key_hash TEXT PRIMARY KEY,
+            wallet_id TEXT NOT NULL,
+            key_type TEXT NOT NULL
+        );
+        """
+    )
+    await db.execute(
+        "CREATE INDEX IF NOT EXISTS idx_wallet_keys_wallet ON wallet_keys (wallet_id)"
+    )
+
+    # keyset pages by id, 2 keys of 3 bound values per wallet stay within
+    # the 999 bound values of older SQLite versions
+    page_size = 150
+    last_id = ""
+    while True:
+        rows: list[dict] = await db.fetchall(
+            """
+            SELECT id, adminkey, inkey FROM wallets
+            WHERE id > :last_id ORDER BY id LIMIT :limit
+            """,
+            {"last_id": last_id, "limit": page_size},
+        )
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        keys = [
+            (hashlib.sha256(key.encode()).hexdigest(), row["id"], key_type)
+            for row in rows
+            for key, key_type in [(row["adminkey"], "admin"), (row["inkey"], "invoice")]
+            if key
+        ]
+        if not keys:
+            continue
+        values: dict = {}
+        placeholders = []
+        for i, (key_hash, wallet_id, key_type) in enumerate(keys):
+            values.update({f"h{i}": key_hash, f"w{i}": wallet_id, f"t{i}": key_type})
+            placeholders.append(f"(:h{i}, :w{i}, :t{i})")
+        await db.execute(
+            # only generated placeholders, the values are bound
+            f"""
+            INSERT INTO wallet_keys (key_hash, wallet_id, key_type)
+            VALUES {", ".join(placeholders)}
+            ON CONFLICT (key_hash) DO NOTHING
+            """,  # noqa: S608
+            values,
+        )
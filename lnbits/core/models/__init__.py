@@ -6,6 +6,7 @@ from .misc import (
     ConversionData,
     CoreAppExtra,
     DbVersion,
+    FundingSourceStartup,
     SimpleStatus,
 )
 from .payments import (
@@ -18,14 +19,17 @@ from .payments import (
     PaymentCountField,
     PaymentCountStat,
     PaymentDailyStats,
+    PaymentExportFormat,
     PaymentExtra,
     PaymentFilters,
     PaymentHistoryPoint,
     PaymentsStatusCount,
     PaymentState,
     PaymentWalletStats,
+    PendingPaymentsCheck,
     SettleInvoice,
 )
+from .tasks import SingletonTasksStats, TaskLease
 from .tinyurl import TinyURL
 from .users import (
     AccessTokenPayload,
@@ -47,6 +51,7 @@ from .users import (
     UserExtra,
 )
 from .wallets import CreateWallet, KeyType, Wallet, WalletInfo, WalletTypeInfo
+from .webhooks import WebhookDelivery, WebhookDeliveryFilters, WebhookDeliveryStatus
 from .webpush import CreateWebPushSubscription, WebPushSubscription
 
 __all__ = [
@@ -70,6 +75,7 @@ __all__ = [
     "CreateWebPushSubscription",
     "DbVersion",
     "DecodePayment",
+    "FundingSourceStartup",
     "KeyType",
     "LoginUsernamePassword",
     "LoginUsr",
@@ -78,16 +84,20 @@ __all__ = [
     "PaymentCountField",
     "PaymentCountStat",
     "PaymentDailyStats",
+    "PaymentExportFormat",
     "PaymentExtra",
     "PaymentFilters",
     "PaymentHistoryPoint",
     "PaymentState",
     "PaymentWalletStats",
     "PaymentsStatusCount",
+    "PendingPaymentsCheck",
     "RegisterUser",
     "ResetUserPassword",
     "SettleInvoice",
     "SimpleStatus",
+    "SingletonTasksStats",
+    "TaskLease",
     "TinyURL",
     "UpdateBalance",
     "UpdateSuperuserPassword",
@@ -101,4 +111,7 @@ __all__ = [
     "WalletInfo",
     "WalletTypeInfo",
     "WebPushSubscription",
+    "WebhookDelivery",
+    "WebhookDeliveryFilters",
+    "WebhookDeliveryStatus",
 ]
@@ -59,3 +59,13 @@ class AuditStats(BaseModel):
     response_code: list[AuditCountStat] = []
     component: list[AuditCountStat] = []
     long_duration: list[AuditCountStat] = []
+
+
+class AuditWriterStats(BaseModel):
+    queued: int = 0
+    written: int = 0
+    batches: int = 0
+    # not queued because the queue was full
+    dropped: int = 0
+    # not written because the insert failed
+    failed: int = 0
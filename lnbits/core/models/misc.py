@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from collections.abc import Callable
+from datetime import datetime
 
 from pydantic import BaseModel
 
@@ -33,6 +34,20 @@ class BalanceDelta(BaseModel):
         return int(self.lnbits_balance_sats - self.node_balance_sats)
 
 
+class FundingSourceStartup(BaseModel):
+    funding_source: str | None = None
+    started_at: datetime | None = None
+    ready_at: datetime | None = None
+    # creating the funding source instance
+    init_seconds: float = 0
+    # `Wallet.startup`, e.g. the first requests to the node
+    startup_seconds: float = 0
+    # from the startup until the first successful status check
+    status_seconds: float = 0
+    status_retries: int = 0
+    error: str | None = None
+
+
 class SimpleStatus(BaseModel):
     success: bool
     message: str
@@ -28,6 +28,17 @@ class PaymentState(str, Enum):
         return self.value
 
 
+class PaymentExportFormat(str, Enum):
+    CSV = "csv"
+    JSONL = "jsonl"
+
+    @property
+    def media_type(self) -> str:
+        if self == PaymentExportFormat.CSV:
+            return "text/csv"
+        return "application/x-ndjson"
+
+
 class PaymentExtra(BaseModel):
     comment: str | None = None
     success_action: str | None = None
@@ -80,6 +91,9 @@ class Payment(BaseModel):
 
     def __init__(self, **data):
         super().__init__(**data)
+        self.post_construct()
+
+    def post_construct(self) -> None:
         if "fiat_payment_request" in self.extra:
             self.payment_request = self.extra["fiat_payment_request"]
         else:
@@ -271,6 +285,18 @@ class PaymentsStatusCount(BaseModel):
     pending: int = 0
 
 
+class PendingPaymentsCheck(BaseModel):
+    total: int = 0
+    checked: int = 0
+    success: int = 0
+    failed: int = 0
+    errors: int = 0
+    # statuses resolved with one batch request to the funding source
+    batched: int = 0
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+
+
 class SettleInvoice(BaseModel):
     preimage: str = Field(
         ...,
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class TaskLease(BaseModel):
+    name: str
+    # worker process that runs the task until the lease expires
+    owner: str
+    expires_at: datetime
+    updated_at: datetime
+
+
+class SingletonTasksStats(BaseModel):
+    owner: str
+    # `advisory` (Postgres advisory locks) or `row` (rows in `task_leases`)
+    lease: str
+    tasks: list[str] = []
+    leading: list[str] = []
+    elections: int = 0
+    # leadership taken over from other workers or lost to them
+    acquired: int = 0
+    lost: int = 0
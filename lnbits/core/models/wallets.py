@@ -19,6 +19,12 @@ class WalletInfo(BaseModel):
     balance_msat: int
 
 
+class WalletBalanceMismatch(BaseModel):
+    wallet_id: str
+    ledger_balance_msat: int
+    expected_balance_msat: int
+
+
 class WalletType(Enum):
     LIGHTNING = "lightning"
     LIGHTNING_SHARED = "lightning-shared"
@@ -239,6 +245,23 @@ class BaseWalletTypeInfo:
     wallet: BaseWallet
 
 
+class WalletKey(BaseModel):
+    """Row of the `wallet_keys` index, the key itself is not stored."""
+
+    key_hash: str
+    wallet_id: str
+    key_type: str
+
+
+@dataclass
+class WalletAuth:
+    """A wallet key resolved with everything needed to authorize the request."""
+
+    wallet: Wallet
+    # extensions the owner of the wallet has enabled
+    active_extensions: list[str]
+
+
 class WalletsFilters(FilterModel):
     __search_fields__ = ["id", "name", "currency"]
 
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from enum import Enum
+from uuid import uuid4
+
+from pydantic import BaseModel, Field
+
+from lnbits.db import FilterModel
+
+
+class WebhookDeliveryStatus(str, Enum):
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class WebhookDelivery(BaseModel):
+    id: str = Field(default_factory=lambda: uuid4().hex)
+    payment_hash: str
+    url: str
+    payload: str
+    status: WebhookDeliveryStatus = WebhookDeliveryStatus.PENDING
+    attempts: int = 0
+    # whole seconds, due deliveries are queried by unix timestamp
+    next_attempt_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc).replace(microsecond=0)
+    )
+    # http status code of the last attempt, `-1` if there was no response
+    last_status: str | None = None
+    last_error: str | None = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+class WebhookDeliveryFilters(FilterModel):
+    __search_fields__ = ["payment_hash", "url", "status", "last_status"]
+    __sort_fields__ = ["created_at", "updated_at", "next_attempt_at", "attempts"]
+
+    payment_hash: str | None = None
+    url: str | None = None
+    status: str | None = None
+    last_status: str | None = None
+
+
+class WebhookOutboxStats(BaseModel):
+    pending: int = 0
+    sent: int = 0
+    failed: int = 0
+    in_flight: int = 0
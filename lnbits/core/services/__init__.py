@@ -15,10 +15,12 @@ from .payments import (
     create_invoice,
     create_payment_request,
     create_wallet_invoice,
+    export_payments,
     fee_reserve,
     fee_reserve_total,
     get_payments_daily_stats,
     pay_invoice,
+    poll_pending_payment,
     service_fee,
     settle_hold_invoice,
     update_pending_payment,
@@ -54,6 +56,7 @@ __all__ = [
     "create_user_account_no_ckeck",
     "create_wallet_invoice",
     "enqueue_admin_notification",
+    "export_payments",
     "fee_reserve",
     "fee_reserve_total",
     "fetch_lnurl_pay_request",
@@ -62,6 +65,7 @@ __all__ = [
     "get_pr_from_lnurl",
     "pay_invoice",
     "perform_withdraw",
+    "poll_pending_payment",
     "send_payment_notification",
     "service_fee",
     "settle_hold_invoice",
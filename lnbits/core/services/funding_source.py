@@ -6,7 +6,10 @@ from lnbits.settings import settings
 from lnbits.wallets import get_funding_source, set_funding_source
 
 from ..crud import get_total_balance
-from ..models import BalanceDelta
+from ..models import BalanceDelta, FundingSourceStartup
+
+# timings of the funding source startup, filled in by the app startup sequence
+funding_source_startup = FundingSourceStartup()
 
 
 async def switch_to_voidwallet() -> None:
@@ -1,30 +1,50 @@
 import asyncio
 import json
 import smtplib
+import time
 from asyncio.tasks import create_task
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from functools import partial
 from http import HTTPStatus
+from urllib.parse import urlparse
 
 import httpx
 from loguru import logger
 from py_vapid import Vapid
+from pydantic import BaseModel
 from pywebpush import WebPushException, webpush
 
 from lnbits.core.crud import (
+    create_webhook_delivery,
     delete_webpush_subscriptions,
     get_webpush_subscriptions_for_user,
     mark_webhook_sent,
+    update_webhook_delivery,
 )
 from lnbits.core.crud.users import get_user
 from lnbits.core.crud.wallets import get_wallet
-from lnbits.core.models import Payment, Wallet
+from lnbits.core.crud.webhooks import (
+    claim_webhook_delivery,
+    delete_sent_webhook_deliveries,
+    get_due_webhook_deliveries,
+    get_webhook_outbox_stats,
+)
+from lnbits.core.models import (
+    Payment,
+    Wallet,
+    WebhookDelivery,
+    WebhookDeliveryStatus,
+)
 from lnbits.core.models.notifications import (
     NOTIFICATION_TEMPLATES,
     NotificationMessage,
     NotificationType,
 )
 from lnbits.core.models.users import UserNotifications
+from lnbits.core.models.webhooks import WebhookOutboxStats
 from lnbits.core.services.nostr import fetch_nip5_details, send_nostr_dm
 from lnbits.core.services.websockets import websocket_manager
 from lnbits.helpers import check_callback_url, is_valid_email_address
@@ -34,6 +54,50 @@ from lnbits.utils.nostr import normalize_private_key
 notifications_queue: asyncio.Queue[NotificationMessage] = asyncio.Queue()
 
 
+class NotificationChannelStats(BaseModel):
+    channel: str
+    sent: int = 0
+    failed: int = 0
+    avg_seconds: float = 0
+    max_seconds: float = 0
+
+
+notification_stats: dict[str, NotificationChannelStats] = {}
+
+# `pywebpush` is blocking, it runs in its own small thread pool
+_webpush_executor = ThreadPoolExecutor(
+    max_workers=settings.notification_webpush_workers,
+    thread_name_prefix="webpush",
+)
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def notification_http_client() -> httpx.AsyncClient:
+    """
+    Shared, pooled client for webhooks and chat notifications.
+    A client is bound to the event loop it was created in.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            headers={"User-Agent": settings.user_agent},
+            limits=httpx.Limits(
+                max_connections=settings.notification_http_max_connections
+            ),
+        )
+        _http_client_loop = loop
+    return _http_client
+
+
+async def close_notification_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
 def enqueue_admin_notification(message_type: NotificationType, values: dict) -> None:
     if not _is_message_type_enabled(message_type):
         return
@@ -171,10 +235,10 @@ async def send_telegram_notification(chat_id: str, message: str) -> dict:
 async def send_telegram_message(token: str, chat_id: str, message: str) -> dict:
     url = f"https://api.telegram.org/bot{token}/sendMessage"
     payload = {"chat_id": chat_id, "text": message, "parse_mode": "markdown"}
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, data=payload)
-        response.raise_for_status()
-        return response.json()
+    client = notification_http_client()
+    response = await client.post(url, data=payload)
+    response.raise_for_status()
+    return response.json()
 
 
 async def send_email_notification(
@@ -229,62 +293,225 @@ async def send_email(
         return True
 
 
-async def dispatch_webhook(payment: Payment):
+class WebhookOutbox:
     """
-    Dispatches the webhook to the webhook url.
+    Webhooks are stored in the `webhook_outbox` table before they are sent.
+    `run` delivers the due ones with a bounded number of requests per host
+    and retries failed attempts with an exponential backoff.
+    Every attempt first claims its row by moving `next_attempt_at` past the
+    request timeout, so a delivery is not sent twice by concurrent attempts.
     """
-    logger.debug("sending webhook", payment.webhook)
 
-    if not payment.webhook:
-        return await mark_webhook_sent(payment.payment_hash, "-1")
+    poll_interval: float = 5
+    cleanup_interval: float = 60 * 60
+
+    def __init__(self) -> None:
+        self._in_flight: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+        self._host_limits_loop: asyncio.AbstractEventLoop | None = None
+
+    async def enqueue(self, payment: Payment) -> WebhookDelivery:
+        assert payment.webhook, "payment has no webhook"
+        return await create_webhook_delivery(
+            WebhookDelivery(
+                payment_hash=payment.payment_hash,
+                url=payment.webhook,
+                payload=payment.json(),
+                # claimed for the first attempt, made right after enqueueing
+                next_attempt_at=_claim_until(),
+            )
+        )
 
-    headers = {"User-Agent": settings.user_agent}
-    async with httpx.AsyncClient(headers=headers) as client:
+    async def deliver(self, delivery: WebhookDelivery) -> WebhookDelivery:
+        """Make one delivery attempt, unless one is already in flight."""
+        if delivery.id in self._in_flight:
+            return delivery
+        self._in_flight.add(delivery.id)
         try:
-            check_callback_url(payment.webhook)
-        except ValueError as exc:
-            await mark_webhook_sent(payment.payment_hash, "-1")
-            logger.warning(f"Invalid webhook URL {payment.webhook}: {exc!s}")
+            await self._deliver(delivery)
+        finally:
+            self._in_flight.discard(delivery.id)
+        return delivery
+
+    async def replay(self, delivery: WebhookDelivery) -> WebhookDelivery:
+        delivery.status = WebhookDeliveryStatus.PENDING
+        delivery.attempts = 0
+        delivery.next_attempt_at = datetime.now(timezone.utc).replace(microsecond=0)
+        await update_webhook_delivery(delivery)
+        return await self.deliver(delivery)
+
+    async def run(self) -> None:
+        last_cleanup = 0.0
+        while settings.lnbits_running:
+            free = settings.webhook_outbox_batch_size - len(self._in_flight)
+            if free > 0:
+                due = await get_due_webhook_deliveries(free, exclude=self._in_flight)
+                for delivery in due:
+                    task = create_task(self._deliver_due(delivery))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            if time.monotonic() - last_cleanup > self.cleanup_interval:
+                await delete_sent_webhook_deliveries(
+                    settings.webhook_outbox_retention_days
+                )
+                last_cleanup = time.monotonic()
+            await asyncio.sleep(self.poll_interval)
+
+    async def stats(self) -> WebhookOutboxStats:
+        stats = await get_webhook_outbox_stats()
+        stats.in_flight = len(self._in_flight)
+        return stats
+
+    async def _deliver_due(self, delivery: WebhookDelivery) -> None:
         try:
-            r = await client.post(payment.webhook, json=payment.json(), timeout=40)
-            r.raise_for_status()
-            await mark_webhook_sent(payment.payment_hash, str(r.status_code))
-        except httpx.HTTPStatusError as exc:
-            await mark_webhook_sent(payment.payment_hash, str(exc.response.status_code))
+            await self.deliver(delivery)
+        except Exception as exc:
+            logger.error(f"Error delivering webhook {delivery.id}: {exc!s}")
+
+    async def _deliver(self, delivery: WebhookDelivery) -> None:
+        async with self._host_limit(urlparse(delivery.url).netloc):
+            # always a new value, concurrent claims of the old one must fail
+            until = max(_claim_until(), delivery.next_attempt_at + timedelta(seconds=1))
+            if not await claim_webhook_delivery(delivery, until):
+                logger.debug(f"Webhook delivery {delivery.id} is already claimed.")
+                return
+            status_code, error = await self._post(delivery)
+        now = datetime.now(timezone.utc)
+        delivery.attempts += 1
+        delivery.last_status = str(status_code or -1)
+        delivery.last_error = error
+        if status_code and 200 <= status_code < 300:
+            delivery.status = WebhookDeliveryStatus.SENT
+        elif (
+            _is_retryable_status(status_code)
+            and delivery.attempts < settings.webhook_max_attempts
+        ):
+            # whole seconds, due deliveries are queried by unix timestamp
+            next_attempt_at = now + timedelta(seconds=_retry_delay(delivery.attempts))
+            delivery.next_attempt_at = next_attempt_at.replace(microsecond=0)
+        else:
+            delivery.status = WebhookDeliveryStatus.FAILED
             logger.warning(
-                f"webhook returned a bad status_code: {exc.response.status_code} "
-                f"while requesting {exc.request.url!r}."
+                f"Webhook to {delivery.url} failed after {delivery.attempts} "
+                f"attempts: {error}"
             )
-        except httpx.RequestError:
-            await mark_webhook_sent(payment.payment_hash, "-1")
-            logger.warning(f"Could not send webhook to {payment.webhook}")
+        await update_webhook_delivery(delivery)
+        await mark_webhook_sent(delivery.payment_hash, delivery.last_status)
 
+    async def _post(self, delivery: WebhookDelivery) -> tuple[int | None, str | None]:
+        client = notification_http_client()
+        try:
+            # the payload is sent JSON encoded again, as it always has been
+            r = await client.post(
+                delivery.url, json=delivery.payload, timeout=settings.webhook_timeout
+            )
+        except httpx.RequestError as exc:
+            logger.debug(f"Could not send webhook to {delivery.url}: {exc!r}")
+            return None, str(exc) or exc.__class__.__name__
+        if r.is_success:
+            return r.status_code, None
+        return r.status_code, f"HTTP {r.status_code}"
+
+    def _host_limit(self, host: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._host_limits_loop is not loop:
+            self._host_limits = {}
+            self._host_limits_loop = loop
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = asyncio.Semaphore(settings.webhook_max_concurrency_per_host)
+            self._host_limits[host] = limit
+        return limit
+
+
+def _is_retryable_status(status_code: int | None) -> bool:
+    """No response, timeouts, rate limits and server errors are retried."""
+    return (
+        status_code is None
+        or status_code in {HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS}
+        or status_code >= 500
+    )
+
+
+def _claim_until() -> datetime:
+    """Until an attempt is surely finished, in whole seconds."""
+    until = datetime.now(timezone.utc) + timedelta(seconds=settings.webhook_timeout)
+    return until.replace(microsecond=0) + timedelta(seconds=5)
+
+
+def _retry_delay(attempts: int) -> float:
+    delay = settings.webhook_retry_base_seconds * 2 ** (attempts - 1)
+    return min(delay, settings.webhook_retry_max_seconds)
+
+
+webhook_outbox = WebhookOutbox()
+
+
+async def dispatch_webhook(payment: Payment):
+    """
+    Stores the webhook in the outbox and makes the first delivery attempt.
+    Failed attempts are retried by `webhook_outbox.run`.
+    """
+    logger.debug("sending webhook", payment.webhook)
+
+    if not payment.webhook:
+        return await mark_webhook_sent(payment.payment_hash, "-1")
 
-async def send_payment_notification(wallet: Wallet, payment: Payment):
-    try:
-        await send_ws_payment_notification(wallet, payment)
-        for shared in wallet.extra.shared_with:
-            if not shared.shared_with_wallet_id:
-                continue
-            shared_wallet = await get_wallet(shared.shared_with_wallet_id)
-            if shared_wallet and shared_wallet.can_view_payments:
-                await send_ws_payment_notification(shared_wallet, payment)
-    except Exception as e:
-        logger.error(f"Error sending websocket payment notification {e!s}")
-    try:
-        await send_chat_payment_notification(wallet, payment)
-    except Exception as e:
-        logger.error(f"Error sending chat payment notification {e!s}")
     try:
-        await send_payment_push_notification(wallet, payment)
-    except Exception as e:
-        logger.error(f"Error sending push payment notification {e!s}")
+        check_callback_url(payment.webhook)
+    except ValueError as exc:
+        await mark_webhook_sent(payment.payment_hash, "-1")
+        logger.warning(f"Invalid webhook URL {payment.webhook}: {exc!s}")
+        return
+
+    delivery = await webhook_outbox.enqueue(payment)
+    await webhook_outbox.deliver(delivery)
 
+
+async def send_payment_notification(wallet: Wallet, payment: Payment):
+    """
+    Send the payment to all notification channels concurrently,
+    a failing or slow channel does not hold up the others.
+    """
+    channels = {
+        "websocket": send_payment_ws_notifications(wallet, payment),
+        "chat": send_chat_payment_notification(wallet, payment),
+        "push": send_payment_push_notification(wallet, payment),
+    }
+    if payment.webhook and not payment.webhook_status:
+        channels["webhook"] = dispatch_webhook(payment)
+    await asyncio.gather(
+        *[_send_to_channel(channel, coro) for channel, coro in channels.items()]
+    )
+
+
+async def _send_to_channel(channel: str, coro) -> None:
+    stats = notification_stats.setdefault(
+        channel, NotificationChannelStats(channel=channel)
+    )
+    start = time.perf_counter()
     try:
-        if payment.webhook and not payment.webhook_status:
-            await dispatch_webhook(payment)
+        await coro
+        stats.sent += 1
     except Exception as e:
-        logger.error(f"Error dispatching webhook: {e!s}")
+        stats.failed += 1
+        logger.error(f"Error sending {channel} payment notification {e!s}")
+    elapsed = time.perf_counter() - start
+    count = stats.sent + stats.failed
+    stats.avg_seconds += (elapsed - stats.avg_seconds) / count
+    stats.max_seconds = max(stats.max_seconds, elapsed)
+
+
+async def send_payment_ws_notifications(wallet: Wallet, payment: Payment):
+    """To the websockets of the wallet and of the wallets it is shared with."""
+    await send_ws_payment_notification(wallet, payment)
+    for shared in wallet.extra.shared_with:
+        if not shared.shared_with_wallet_id:
+            continue
+        shared_wallet = await get_wallet(shared.shared_with_wallet_id)
+        if shared_wallet and shared_wallet.can_view_payments:
+            await send_ws_payment_notification(shared_wallet, payment)
 
 
 def send_payment_notification_in_background(wallet: Wallet, payment: Payment):
@@ -360,26 +587,39 @@ async def send_payment_push_notification(wallet: Wallet, payment: Payment):
     if payment.memo:
         body += f"\r\n{payment.memo}"
 
-    for subscription in subscriptions:
-        # todo: review permissions when user-id-only not allowed
-        # todo: replace all this logic with websockets?
-        url = f"https://{subscription.host}/wallet?usr={wallet.user}&wal={wallet.id}"
-        await send_push_notification(subscription, title, body, url)
+    # todo: review permissions when user-id-only not allowed
+    # todo: replace all this logic with websockets?
+    await asyncio.gather(
+        *[
+            send_push_notification(
+                subscription,
+                title,
+                body,
+                f"https://{subscription.host}/wallet?usr={wallet.user}&wal={wallet.id}",
+            )
+            for subscription in subscriptions
+        ]
+    )
 
 
 async def send_push_notification(subscription, title, body, url=""):
     vapid = Vapid()
     try:
         logger.debug("sending push notification")
-        webpush(
-            json.loads(subscription.data),
-            json.dumps({"title": title, "body": body, "url": url}),
-            (
-                vapid.from_pem(bytes(settings.lnbits_webpush_privkey, "utf-8"))
-                if settings.lnbits_webpush_privkey
-                else None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            _webpush_executor,
+            partial(
+                webpush,
+                json.loads(subscription.data),
+                json.dumps({"title": title, "body": body, "url": url}),
+                (
+                    vapid.from_pem(bytes(settings.lnbits_webpush_privkey, "utf-8"))
+                    if settings.lnbits_webpush_privkey
+                    else None
+                ),
+                {"aud": "", "sub": "mailto:alan@lnbits.com"},
             ),
-            {"aud": "", "sub": "mailto:alan@lnbits.com"},
         )
     except WebPushException as e:
         if e.response and e.response.status_code == HTTPStatus.GONE:
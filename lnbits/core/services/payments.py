@@ -1,6 +1,11 @@
 import asyncio
+import csv
+import json
 import time
+from collections.abc import AsyncIterator
 from datetime import datetime, timedelta, timezone
+from io import StringIO
+from typing import Any
 
 from bolt11 import Bolt11, MilliSatoshi, Tags
 from bolt11 import decode as bolt11_decode
@@ -10,8 +15,14 @@ from lnurl import execute_withdraw as lnurl_withdraw
 from loguru import logger
 
 from lnbits.core.crud.payments import get_daily_stats
+from lnbits.core.crud.settings import get_settings_field, set_settings_field
 from lnbits.core.db import db
-from lnbits.core.models import PaymentDailyStats, PaymentFilters
+from lnbits.core.models import (
+    PaymentDailyStats,
+    PaymentExportFormat,
+    PaymentFilters,
+    PendingPaymentsCheck,
+)
 from lnbits.core.models.payments import CreateInvoice
 from lnbits.db import Connection, Filters
 from lnbits.decorators import check_user_extension_access
@@ -20,6 +31,7 @@ from lnbits.fiat import get_fiat_provider
 from lnbits.helpers import check_callback_url
 from lnbits.settings import settings
 from lnbits.tasks import create_task, internal_invoice_queue_put
+from lnbits.utils.cache import cache
 from lnbits.utils.crypto import fake_privkey, random_secret_and_hash, verify_preimage
 from lnbits.utils.exchange_rates import fiat_amount_as_satoshis, satoshis_amount_as_fiat
 from lnbits.wallets import fake_wallet, get_funding_source
@@ -40,6 +52,8 @@ from ..crud import (
     get_wallet,
     get_wallet_payment,
     is_internal_status_success,
+    settle_pending_payment,
+    stream_payments,
     update_payment,
 )
 from ..models import (
@@ -51,9 +65,6 @@ from ..models import (
 from .fiat_providers import check_fiat_status
 from .notifications import send_payment_notification_in_background
 
-payment_lock = asyncio.Lock()
-wallets_payments_lock: dict[str, asyncio.Lock] = {}
-
 
 async def pay_invoice(
     *,
@@ -367,6 +378,25 @@ async def update_pending_payment(
     payment: Payment, conn: Connection | None = None
 ) -> Payment:
     status = await check_payment_status(payment)
+    return await _update_payment_from_status(payment, status, conn=conn)
+
+
+async def poll_pending_payment(payment: Payment) -> Payment:
+    """
+    `update_pending_payment` for clients polling the payment status.
+    Concurrent polls of the same payment share one status check with the
+    funding source, and its result is reused for `payment_poll_interval`.
+    """
+    return await cache.save_result(
+        lambda: update_pending_payment(payment),
+        key=f"payment_poll:{payment.checking_id}",
+        expiry=settings.payment_poll_interval,
+    )
+
+
+async def _update_payment_from_status(
+    payment: Payment, status: PaymentStatus, conn: Connection | None = None
+) -> Payment:
     if status.failed:
         payment.status = PaymentState.FAILED
         await update_payment(payment, conn=conn)
@@ -375,11 +405,20 @@ async def update_pending_payment(
     return payment
 
 
+pending_payments_check = PendingPaymentsCheck()
+
+
 async def check_pending_payments():
     """
     check_pending_payments is called during startup to check for pending payments with
     the backend and also to delete expired invoices. Incoming payments will be
     checked only once, outgoing pending payments will be checked regularly.
+
+    Outgoing payments are checked first, with one batch request if the funding
+    source supports it. The rest is checked by a few concurrent workers, rate
+    limited per funding source. The progress is saved, so an interrupted check
+    resumes where it stopped. Funding sources with a resumable invoice stream
+    skip the incoming payments that have not expired yet.
     """
     funding_source = get_funding_source()
     if funding_source.__class__.__name__ == "VoidWallet":
@@ -392,18 +431,137 @@ async def check_pending_payments():
         pending=True,
         exclude_uncheckable=True,
     )
+    if funding_source.resumable_invoice_stream:
+        # settlements are replayed by the invoice stream after a restart or
+        # reconnect, so only expired invoices need a final check
+        pending_payments = [
+            p for p in pending_payments if not p.is_in or p.is_expired or not p.expiry
+        ]
+    pending_payments.sort(key=_pending_check_key)
+
+    progress = await get_settings_field("progress", tag="pending_check")
+    if progress and progress.value:
+        pending_payments = [
+            p for p in pending_payments if _pending_check_key(p) >= progress.value
+        ]
+        logger.info("Task: resuming interrupted pending check")
+
     count = len(pending_payments)
     if count > 0:
         logger.info(f"Task: checking {count} pending payments of last 15 days...")
-        for i, payment in enumerate(pending_payments):
-            payment = await update_pending_payment(payment)
-            prefix = f"payment ({i+1} / {count})"
-            logger.debug(f"{prefix} {payment.status} {payment.checking_id}")
-            await asyncio.sleep(0.01)  # to avoid complete blocking
+        run = _PendingPaymentsCheckRun(pending_payments)
+        await run.check_all()
         logger.info(
             f"Task: pending check finished for {count} payments"
             f" (took {time.time() - start_time:0.3f} s)"
         )
+    await set_settings_field("progress", None, tag="pending_check")
+
+
+def _pending_check_key(payment: Payment) -> list:
+    # outgoing payments first, they hold the funds of the users
+    return [payment.is_in, payment.time.timestamp(), payment.checking_id]
+
+
+class _RateLimiter:
+    """Spaces the calls to `wait` evenly, `rate` calls per second (0: no limit)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_slot = 0.0
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class _PendingPaymentsCheckRun:
+
+    # how often (in checked payments) the progress is saved
+    save_every = 100
+
+    def __init__(self, payments: list[Payment]):
+        self.payments = payments
+        self.queue: asyncio.Queue = asyncio.Queue()
+        for index, payment in enumerate(payments):
+            self.queue.put_nowait((index, payment))
+        self.done = [False] * len(payments)
+        self.first_unfinished = 0
+        self.statuses: dict[str, PaymentStatus] = {}
+        self.funding_source = get_funding_source()
+        self.limiter = _RateLimiter(
+            self.funding_source.status_requests_per_second
+            or settings.pending_check_rate_limit
+        )
+
+        progress = pending_payments_check
+        progress.total = len(payments)
+        progress.checked = progress.success = progress.failed = 0
+        progress.errors = progress.batched = 0
+        progress.started_at = datetime.now(timezone.utc)
+        progress.finished_at = None
+
+    async def check_all(self) -> None:
+        outgoing = [p for p in self.payments if p.is_out]
+        if outgoing:
+            try:
+                self.statuses = await self.funding_source.get_payment_statuses(
+                    [p.checking_id for p in outgoing],
+                    created_after=min(p.created_at for p in outgoing),
+                )
+            except Exception as exc:
+                logger.warning(f"Task: batch payment status failed: {exc!s}")
+        workers = min(settings.pending_check_concurrency, len(self.payments))
+        await asyncio.gather(*[self._worker() for _ in range(workers)])
+        pending_payments_check.finished_at = datetime.now(timezone.utc)
+
+    async def _worker(self) -> None:
+        while not self.queue.empty():
+            index, payment = self.queue.get_nowait()
+            try:
+                payment = await self._check(payment)
+                logger.debug(
+                    f"payment ({index + 1} / {len(self.payments)})"
+                    f" {payment.status} {payment.checking_id}"
+                )
+            except Exception as exc:
+                pending_payments_check.errors += 1
+                logger.warning(f"Task: could not check {payment.checking_id}: {exc!s}")
+            await self._done(index)
+
+    async def _check(self, payment: Payment) -> Payment:
+        status = self.statuses.get(payment.checking_id)
+        if status is None:
+            await self.limiter.wait()
+            status = await check_payment_status(payment)
+        else:
+            pending_payments_check.batched += 1
+        payment = await _update_payment_from_status(payment, status)
+        if payment.success:
+            pending_payments_check.success += 1
+        elif payment.failed:
+            pending_payments_check.failed += 1
+        return payment
+
+    async def _done(self, index: int) -> None:
+        self.done[index] = True
+        while (
+            self.first_unfinished < len(self.done) and self.done[self.first_unfinished]
+        ):
+            self.first_unfinished += 1
+        pending_payments_check.checked += 1
+        if (
+            pending_payments_check.checked % self.save_every == 0
+            and self.first_unfinished < len(self.payments)
+        ):
+            # everything before the first unfinished payment is checked
+            resume_key = _pending_check_key(self.payments[self.first_unfinished])
+            await set_settings_field("progress", resume_key, tag="pending_check")
 
 
 def fee_reserve_total(amount_msat: int, internal: bool = False) -> int:
@@ -698,22 +856,16 @@ async def _pay_invoice(
     create_payment_model: CreatePayment,
     conn: Connection | None = None,
 ):
-    async with payment_lock:
-        if wallet_id not in wallets_payments_lock:
-            wallets_payments_lock[wallet_id] = asyncio.Lock()
-
-    async with wallets_payments_lock[wallet_id]:
-        # get the wallet again to make sure we have the latest balance
-        wallet = await get_wallet(wallet_id, conn=conn)
-        if not wallet:
-            raise PaymentError(
-                f"Could not fetch wallet '{wallet_id}'.", status="failed"
-            )
+    # the balance is reserved by a conditional debit in the database,
+    # so no lock is needed and several workers can pay from the same wallet
+    wallet = await get_wallet(wallet_id, conn=conn)
+    if not wallet:
+        raise PaymentError(f"Could not fetch wallet '{wallet_id}'.", status="failed")
 
-        payment = await _pay_internal_invoice(wallet, create_payment_model, conn)
-        if not payment:
-            payment = await _pay_external_invoice(wallet, create_payment_model, conn)
-        return payment
+    payment = await _pay_internal_invoice(wallet, create_payment_model, conn)
+    if not payment:
+        payment = await _pay_external_invoice(wallet, create_payment_model, conn)
+    return payment
 
 
 async def _pay_internal_invoice(
@@ -762,18 +914,24 @@ async def _pay_internal_invoice(
     internal_id = f"internal_{create_payment_model.payment_hash}"
     logger.debug(f"creating temporary internal payment with id {internal_id}")
 
-    payment = await create_payment(
-        checking_id=internal_id,
-        data=create_payment_model,
-        status=PaymentState.SUCCESS,
-        conn=conn,
-    )
+    async with db.reuse_conn(conn) if conn else db.connect() as new_conn:
+        async with new_conn.transaction():
+            try:
+                payment = await create_payment(
+                    checking_id=internal_id,
+                    data=create_payment_model,
+                    status=PaymentState.SUCCESS,
+                    conn=new_conn,
+                    reserve_balance=True,
+                )
+            except ValueError as exc:
+                raise PaymentError("Payment already paid.", status="success") from exc
 
-    # mark the invoice from the other side as not pending anymore
-    # so the other side only has access to his new money when we are sure
-    # the payer has enough to deduct from
-    internal_payment.status = PaymentState.SUCCESS
-    await update_payment(internal_payment, conn=conn)
+            # mark the invoice from the other side as not pending anymore
+            # so the other side only has access to his new money when we are sure
+            # the payer has enough to deduct from
+            if not await settle_pending_payment(internal_payment, conn=new_conn):
+                raise PaymentError("Payment already paid.", status="success")
     logger.success(f"internal payment successful {internal_payment.checking_id}")
 
     await _send_payment_notification_in_background(wallet.id, payment, conn=conn)
@@ -811,11 +969,19 @@ async def _pay_external_invoice(
         return await _verify_external_payment(old_payment, conn)
 
     create_payment_model.fee = -abs(fee_reserve_total_msat)
-    payment = await create_payment(
-        checking_id=checking_id,
-        data=create_payment_model,
-        conn=conn,
-    )
+    try:
+        payment = await create_payment(
+            checking_id=checking_id,
+            data=create_payment_model,
+            conn=conn,
+            reserve_balance=True,
+        )
+    except ValueError:
+        # another request created the same payment in the meantime
+        old_payment = await get_standalone_payment(checking_id, conn=conn)
+        if not old_payment:
+            raise
+        return await _verify_external_payment(old_payment, conn)
 
     fee_reserve_msat = fee_reserve(amount_msat, internal=False)
 
@@ -1060,6 +1226,71 @@ async def cancel_hold_invoice(payment: Payment) -> InvoiceResponse:
     return response
 
 
+PAYMENT_EXPORT_FIELDS = [
+    "checking_id",
+    "payment_hash",
+    "wallet_id",
+    "status",
+    "amount",
+    "fee",
+    "memo",
+    "time",
+    "created_at",
+    "updated_at",
+    "expiry",
+    "bolt11",
+    "preimage",
+    "tag",
+    "extension",
+    "webhook",
+    "webhook_status",
+    "labels",
+    "extra",
+]
+
+
+async def export_payments(
+    export_format: PaymentExportFormat,
+    *,
+    wallet_id: str | None = None,
+    user_id: str | None = None,
+    filters: Filters[PaymentFilters] | None = None,
+) -> AsyncIterator[str]:
+    """
+    Payments as CSV or JSON lines, one string per chunk of payments.
+    Only one chunk is held in memory, no matter how many payments there are.
+    """
+    if export_format == PaymentExportFormat.CSV:
+        yield _payments_to_csv([], header=True)
+    async for payments in stream_payments(
+        wallet_id=wallet_id, user_id=user_id, filters=filters
+    ):
+        if export_format == PaymentExportFormat.CSV:
+            yield _payments_to_csv(payments)
+        else:
+            yield "".join(f"{payment.json()}\n" for payment in payments)
+
+
+def _payments_to_csv(payments: list[Payment], header: bool = False) -> str:
+    output = StringIO()
+    writer = csv.writer(output)
+    if header:
+        writer.writerow(PAYMENT_EXPORT_FIELDS)
+    for payment in payments:
+        writer.writerow(
+            [_csv_value(getattr(payment, name)) for name in PAYMENT_EXPORT_FIELDS]
+        )
+    return output.getvalue()
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
 async def _send_payment_notification_in_background(
     wallet_id: str, payment: Payment, conn: Connection | None = None
 ):
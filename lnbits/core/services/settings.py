@@ -1,9 +1,15 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Any
+
 from cryptography.hazmat.primitives import serialization
 from loguru import logger
 from py_vapid import Vapid
 from py_vapid.utils import b64urlencode
+from pydantic import BaseModel
 
-from lnbits.db import dict_to_model
+from lnbits.core.db import core_app_extra, db
+from lnbits.db import POSTGRES, dict_to_model
 from lnbits.settings import (
     EditableSettings,
     UpdateSettings,
@@ -11,7 +17,8 @@ from lnbits.settings import (
     settings,
 )
 
-from ..crud import update_admin_settings
+from ..crud import get_settings_version, get_super_settings, update_admin_settings
+from ..crud.settings import SETTINGS_CHANNEL
 
 
 async def check_webpush_settings():
@@ -57,3 +64,103 @@ def update_cached_settings(sets_dict: dict):
             logger.warning(f"Failed overriding setting: {key}.")
     if "super_user" in sets_dict:
         settings.super_user = sets_dict["super_user"]
+
+
+class SettingsWatcherStats(BaseModel):
+    version: int | None = None
+    # `notify` on Postgres, `poll` otherwise
+    mode: str = "poll"
+    reloads: int = 0
+    last_reload: datetime | None = None
+
+
+class SettingsWatcher:
+    """
+    Reloads the admin settings in this worker when another worker changed them,
+    which bumps the settings version in the database. On Postgres the workers are
+    notified on `SETTINGS_CHANNEL`, otherwise they poll the version every
+    `lnbits_settings_poll_seconds`. Reloading assigns the cached settings, so the
+    derived caches (templates, audit patterns) follow their `settings_version`.
+    """
+
+    def __init__(self) -> None:
+        self._stats = SettingsWatcherStats()
+        self._changed = asyncio.Event()
+        self._listener: Any = None
+
+    async def run(self) -> None:
+        while settings.lnbits_running:
+            try:
+                if db.type == POSTGRES and not self._listener:
+                    await self._listen()
+                await self.check()
+            except Exception as exc:
+                logger.warning(f"Settings watcher failed: {exc}")
+                await self.close()
+            await self._wait()
+
+    async def check(self) -> bool:
+        """Reload the settings if their version changed since the last check."""
+        version = await get_settings_version()
+        if self._stats.version is None:
+            # the settings were loaded at startup
+            self._stats.version = version
+            return False
+        if version == self._stats.version:
+            return False
+        await self.reload()
+        self._stats.version = version
+        return True
+
+    async def reload(self) -> None:
+        settings_db = await get_super_settings()
+        if not settings_db:
+            return
+        update_cached_settings(settings_db.dict())
+        core_app_extra.register_new_ratelimiter()
+        self._stats.reloads += 1
+        self._stats.last_reload = datetime.now(timezone.utc)
+        logger.debug(f"Reloaded settings of version {self._stats.version}.")
+
+    async def close(self) -> None:
+        if self._listener:
+            conn, self._listener = self._listener, None
+            self._stats.mode = "poll"
+            try:
+                await conn.close()
+            except Exception as exc:
+                logger.debug(f"closing the settings listener failed: {exc}")
+
+    def stats(self) -> SettingsWatcherStats:
+        return self._stats.copy()
+
+    async def _listen(self) -> None:
+        # not from `db.connect()`, it would hold the connection lock
+        conn = await db.engine.connect().start()
+        try:
+            raw_conn = await conn.get_raw_connection()
+            await raw_conn.driver_connection.add_listener(
+                SETTINGS_CHANNEL, self._notified
+            )
+        except Exception:
+            await conn.close()
+            raise
+        self._listener = conn
+        self._stats.mode = "notify"
+
+    def _notified(self, *_) -> None:
+        self._changed.set()
+
+    async def _wait(self) -> None:
+        timeout = settings.lnbits_settings_poll_seconds
+        if self._listener:
+            # only a fallback, in case a notification got lost
+            timeout *= 30
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+
+settings_watcher = SettingsWatcher()
@@ -1,22 +1,52 @@
+import asyncio
+import time
 from asyncio import Queue
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from fastapi import WebSocket, WebSocketDisconnect
 from loguru import logger
+from pydantic import BaseModel
 
 from lnbits.settings import settings
 
 
-@dataclass
+@dataclass(eq=False)
 class WebsocketConnection:
     item_id: str
     websocket: WebSocket
     receive_queue: Queue[str]
+    # messages waiting to be written to the socket by `writer`
+    send_queue: Queue[str] = field(default_factory=Queue)
+    writer: asyncio.Task | None = None
+    loop: asyncio.AbstractEventLoop | None = None
+    last_activity: float = field(default_factory=time.monotonic)
+    dropped: int = 0
+
+
+class WebsocketStats(BaseModel):
+    connections: int = 0
+    peak_connections: int = 0
+    items: int = 0
+    sent: int = 0
+    # messages dropped because the send queue of a connection was full
+    dropped: int = 0
+    slow_disconnects: int = 0
+    idle_disconnects: int = 0
 
 
 class WebsocketConnectionManager:
+    """
+    Connections are indexed by `item_id`. Every connection has a bounded send
+    queue and a writer task, so a slow client only delays its own messages.
+    """
+
     def __init__(self) -> None:
-        self.active_connections: list[WebsocketConnection] = []
+        self.connections: dict[str, set[WebsocketConnection]] = {}
+        self._stats = WebsocketStats()
+
+    @property
+    def active_connections(self) -> list[WebsocketConnection]:
+        return [conn for conns in self.connections.values() for conn in conns]
 
     async def connect(self, item_id: str, websocket: WebSocket) -> WebsocketConnection:
         logger.debug(f"Websocket connected to {item_id}")
@@ -25,36 +55,115 @@ class WebsocketConnectionManager:
             item_id=item_id,
             websocket=websocket,
             receive_queue=Queue(),
+            send_queue=Queue(settings.websocket_send_queue_size),
+            loop=asyncio.get_running_loop(),
+        )
+        conn.writer = asyncio.create_task(self._writer(conn))
+        self.connections.setdefault(item_id, set()).add(conn)
+        self._stats.connections += 1
+        self._stats.peak_connections = max(
+            self._stats.peak_connections, self._stats.connections
         )
-        self.active_connections.append(conn)
         return conn
 
     async def listen(self, conn: WebsocketConnection) -> None:
-        while settings.lnbits_running:
-            try:
+        try:
+            while settings.lnbits_running:
                 data = await conn.websocket.receive_text()
                 logger.debug(f"WS received data from {conn.item_id}: {data}")
+                conn.last_activity = time.monotonic()
                 conn.receive_queue.put_nowait(data)
-            except WebSocketDisconnect:
-                for _conn in self.active_connections:
-                    if _conn.websocket == conn.websocket:
-                        self.active_connections.remove(_conn)
-                        logger.debug(f"WS disconnected from {conn.item_id}")
-                break  # out of the listen and the fastapi route
+        except (WebSocketDisconnect, RuntimeError):
+            # `RuntimeError` if the writer closed the socket
+            logger.debug(f"WS disconnected from {conn.item_id}")
+        finally:
+            self.disconnect(conn)
+
+    def disconnect(self, conn: WebsocketConnection) -> None:
+        conns = self.connections.get(conn.item_id)
+        if conns is None or conn not in conns:
+            return
+        conns.discard(conn)
+        if not conns:
+            del self.connections[conn.item_id]
+        self._stats.connections -= 1
+        if conn.writer and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
 
     def get_connections(self, item_id: str) -> list[WebsocketConnection]:
-        conns = []
-        for conn in self.active_connections:
-            if conn.item_id == item_id:
-                conns.append(conn)
-        return conns
+        return list(self.connections.get(item_id, ()))
 
     def has_connection(self, item_id: str) -> bool:
-        return len(self.get_connections(item_id)) > 0
+        return item_id in self.connections
 
     async def send(self, item_id: str, data: str) -> None:
-        for conn in self.get_connections(item_id):
-            await conn.websocket.send_text(data)
+        """Queue `data` for all connections of `item_id`, never waits for them."""
+        for conn in self.connections.get(item_id, ()):
+            if conn.loop and conn.loop is not asyncio.get_running_loop():
+                conn.loop.call_soon_threadsafe(self._enqueue, conn, data)
+            else:
+                self._enqueue(conn, data)
+
+    def stats(self) -> WebsocketStats:
+        self._stats.items = len(self.connections)
+        return self._stats.copy()
+
+    def _enqueue(self, conn: WebsocketConnection, data: str) -> None:
+        try:
+            conn.send_queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self._stats.dropped += 1
+            conn.dropped += 1
+            # only once, the server log itself is sent over a websocket
+            if conn.dropped == 1:
+                logger.warning(f"WS send queue of {conn.item_id} is full, dropping")
+
+    async def _writer(self, conn: WebsocketConnection) -> None:
+        try:
+            while True:
+                data = await self._next_message(conn)
+                if data is None:
+                    self._stats.idle_disconnects += 1
+                    logger.debug(f"WS idle timeout for {conn.item_id}")
+                    break
+                try:
+                    await asyncio.wait_for(
+                        conn.websocket.send_text(data),
+                        timeout=settings.websocket_send_timeout or None,
+                    )
+                except asyncio.TimeoutError:
+                    self._stats.slow_disconnects += 1
+                    logger.warning(f"WS client of {conn.item_id} is too slow")
+                    break
+                conn.last_activity = time.monotonic()
+                self._stats.sent += 1
+        except asyncio.CancelledError:
+            return
+        except Exception as exc:
+            logger.debug(f"WS send to {conn.item_id} failed: {exc}")
+        self.disconnect(conn)
+        await self._close(conn)
+
+    async def _next_message(self, conn: WebsocketConnection) -> str | None:
+        """Next message to send, `None` once the connection has been idle too long."""
+        while True:
+            if not settings.websocket_idle_timeout:
+                return await conn.send_queue.get()
+            idle = time.monotonic() - conn.last_activity
+            remaining = settings.websocket_idle_timeout - idle
+            if remaining <= 0:
+                return None
+            try:
+                return await asyncio.wait_for(conn.send_queue.get(), remaining)
+            except asyncio.TimeoutError:
+                continue  # something might have been received meanwhile
+
+    async def _close(self, conn: WebsocketConnection) -> None:
+        try:
+            await asyncio.wait_for(conn.websocket.close(code=1001), timeout=1)
+        except Exception as exc:
+            # already closed, or the client does not read anymore
+            logger.debug(f"WS close of {conn.item_id} failed: {exc}")
 
 
 websocket_manager = WebsocketConnectionManager()
@@ -2,15 +2,12 @@ import asyncio
 
 from loguru import logger
 
-from lnbits.core.crud import (
-    create_audit_entry,
-    get_wallet,
-)
-from lnbits.core.crud.audit import delete_expired_audit_entries
+from lnbits.core.crud import get_wallet
+from lnbits.core.crud.audit import create_audit_entries, delete_expired_audit_entries
 from lnbits.core.crud.payments import get_payments_status_count
 from lnbits.core.crud.users import get_accounts
 from lnbits.core.crud.wallets import get_wallets_count
-from lnbits.core.models.audit import AuditEntry
+from lnbits.core.models.audit import AuditEntry, AuditWriterStats
 from lnbits.core.models.extensions import InstallableExtension
 from lnbits.core.models.notifications import NotificationType
 from lnbits.core.services.funding_source import (
@@ -27,7 +24,10 @@ from lnbits.db import Filters
 from lnbits.settings import settings
 from lnbits.utils.exchange_rates import btc_rates
 
-audit_queue: asyncio.Queue[AuditEntry] = asyncio.Queue()
+audit_queue: asyncio.Queue[AuditEntry] = asyncio.Queue(settings.lnbits_audit_queue_size)
+audit_writer_stats = AuditWriterStats()
+# entries taken from the queue, but not written yet
+_audit_batch: list[AuditEntry] = []
 
 
 async def run_by_the_minute_tasks() -> None:
@@ -104,15 +104,47 @@ async def wait_for_paid_invoices(invoice_paid_queue: asyncio.Queue) -> None:
 async def wait_for_audit_data() -> None:
     """
     Waits for audit entries to be pushed to the queue.
-    Then it inserts the entries into the DB.
+    Then it inserts them into the DB in batches, one query per batch.
     """
     while settings.lnbits_running:
-        data = await audit_queue.get()
-        try:
-            await create_audit_entry(data)
-        except Exception as ex:
-            logger.warning(ex)
-            await asyncio.sleep(3)
+        _audit_batch.append(await audit_queue.get())
+        if audit_queue.qsize() < settings.lnbits_audit_batch_size - 1:
+            # give the batch a moment to fill up
+            await asyncio.sleep(settings.lnbits_audit_batch_seconds)
+        _drain_audit_queue(settings.lnbits_audit_batch_size)
+        batch = _audit_batch.copy()
+        _audit_batch.clear()
+        # not interrupted by a shutdown, the entries are already dequeued
+        await asyncio.shield(_write_audit_batch(batch))
+
+
+async def flush_audit_queue() -> None:
+    """Write all queued audit entries, called on shutdown."""
+    while _audit_batch or not audit_queue.empty():
+        _drain_audit_queue(settings.lnbits_audit_batch_size)
+        batch = _audit_batch.copy()
+        _audit_batch.clear()
+        await _write_audit_batch(batch)
+
+
+def get_audit_writer_stats() -> AuditWriterStats:
+    audit_writer_stats.queued = audit_queue.qsize() + len(_audit_batch)
+    return audit_writer_stats
+
+
+def _drain_audit_queue(batch_size: int) -> None:
+    while len(_audit_batch) < batch_size and not audit_queue.empty():
+        _audit_batch.append(audit_queue.get_nowait())
+
+
+async def _write_audit_batch(batch: list[AuditEntry]) -> None:
+    try:
+        await create_audit_entries(batch)
+        audit_writer_stats.written += len(batch)
+        audit_writer_stats.batches += 1
+    except Exception as ex:
+        audit_writer_stats.failed += len(batch)
+        logger.warning(f"Could not write {len(batch)} audit entries: {ex!s}")
 
 
 async def wait_notification_messages() -> None:
@@ -6,8 +6,18 @@ from subprocess import Popen
 from urllib.parse import urlparse
 
 from fastapi import APIRouter, Depends, File
+from fastapi.exceptions import HTTPException
 from fastapi.responses import FileResponse
 
+from lnbits.core.crud.webhooks import (
+    get_webhook_deliveries,
+    replay_failed_webhook_deliveries,
+)
+from lnbits.core.models import (
+    SimpleStatus,
+    WebhookDelivery,
+    WebhookDeliveryFilters,
+)
 from lnbits.core.models.notifications import NotificationType
 from lnbits.core.models.users import Account
 from lnbits.core.services import (
@@ -15,15 +25,36 @@ from lnbits.core.services import (
     get_balance_delta,
     update_cached_settings,
 )
-from lnbits.core.services.notifications import send_email_notification
-from lnbits.core.services.settings import dict_to_settings
-from lnbits.decorators import check_admin, check_super_user
+from lnbits.core.services.funding_source import funding_source_startup
+from lnbits.core.services.notifications import (
+    notification_stats,
+    send_email_notification,
+    webhook_outbox,
+)
+from lnbits.core.services.payments import pending_payments_check
+from lnbits.core.services.settings import dict_to_settings, settings_watcher
+from lnbits.core.services.websockets import websocket_manager
+from lnbits.core.tasks import get_audit_writer_stats
+from lnbits.db import Database, Filters, Page
+from lnbits.decorators import check_admin, check_super_user, parse_filters
+from lnbits.helpers import generate_filter_params_openapi
 from lnbits.server import server_restart
 from lnbits.settings import AdminSettings, Settings, UpdateSettings, settings
-from lnbits.tasks import invoice_listeners
+from lnbits.tasks import (
+    get_invoice_dispatch_stats,
+    invoice_listeners,
+    settled_payments_relay,
+    singleton_tasks,
+)
+from lnbits.utils.cache import cache
 
 from .. import core_app_extra
-from ..crud import get_admin_settings, reset_core_settings, update_admin_settings
+from ..crud import (
+    get_admin_settings,
+    get_webhook_delivery,
+    reset_core_settings,
+    update_admin_settings,
+)
 
 admin_router = APIRouter(tags=["Admin UI"], prefix="/admin")
 file_upload = File(...)
@@ -48,9 +79,59 @@ async def api_auditor():
 async def api_monitor():
     return {
         "invoice_listeners": list(invoice_listeners.keys()),
+        "invoice_dispatch": get_invoice_dispatch_stats(),
+        "funding_source_startup": funding_source_startup,
+        "pending_payments_check": pending_payments_check,
+        "database_pools": Database.all_engine_stats(),
+        "database_connections": Database.all_pool_stats(),
+        "cache": cache.stats(),
+        "websockets": websocket_manager.stats(),
+        "payment_notifications": list(notification_stats.values()),
+        "webhook_outbox": await webhook_outbox.stats(),
+        "audit_writer": get_audit_writer_stats(),
+        "singleton_tasks": singleton_tasks.stats(),
+        "settings_watcher": settings_watcher.stats(),
+        "settled_payments_relay": settled_payments_relay.stats(),
     }
 
 
+@admin_router.get(
+    "/api/v1/webhooks",
+    name="Webhooks",
+    summary="Get paginated list of webhook deliveries",
+    dependencies=[Depends(check_admin)],
+    openapi_extra=generate_filter_params_openapi(WebhookDeliveryFilters),
+)
+async def api_get_webhooks(
+    filters: Filters = Depends(parse_filters(WebhookDeliveryFilters)),
+) -> Page[WebhookDelivery]:
+    return await get_webhook_deliveries(filters)
+
+
+@admin_router.put(
+    "/api/v1/webhooks/replay",
+    name="Replay failed webhooks",
+    description="retry all failed webhook deliveries",
+    dependencies=[Depends(check_admin)],
+)
+async def api_replay_failed_webhooks() -> SimpleStatus:
+    count = await replay_failed_webhook_deliveries()
+    return SimpleStatus(success=True, message=f"{count} webhooks scheduled.")
+
+
+@admin_router.put(
+    "/api/v1/webhooks/{delivery_id}/replay",
+    name="Replay webhook",
+    description="send a webhook delivery again, regardless of its status",
+    dependencies=[Depends(check_admin)],
+)
+async def api_replay_webhook(delivery_id: str) -> WebhookDelivery:
+    delivery = await get_webhook_delivery(delivery_id)
+    if not delivery:
+        raise HTTPException(HTTPStatus.NOT_FOUND, "Webhook delivery not found.")
+    return await webhook_outbox.replay(delivery)
+
+
 @admin_router.get(
     "/api/v1/testemail",
     name="TestEmail",
@@ -1,5 +1,7 @@
+import asyncio
 from hashlib import sha256
 from http import HTTPStatus
+from typing import Annotated
 
 from fastapi import (
     APIRouter,
@@ -8,7 +10,7 @@ from fastapi import (
     HTTPException,
     Query,
 )
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from lnurl import url_decode
 
 from lnbits import bolt11
@@ -29,6 +31,7 @@ from lnbits.core.models import (
     PaymentCountField,
     PaymentCountStat,
     PaymentDailyStats,
+    PaymentExportFormat,
     PaymentFilters,
     PaymentHistoryPoint,
     PaymentWalletStats,
@@ -51,6 +54,8 @@ from lnbits.helpers import (
     filter_dict_keys,
     generate_filter_params_openapi,
 )
+from lnbits.settings import settings
+from lnbits.tasks import register_payment_waiter, unregister_payment_waiter
 from lnbits.wallets.base import InvoiceResponse
 
 from ..crud import (
@@ -64,10 +69,12 @@ from ..crud import (
 from ..services import (
     cancel_hold_invoice,
     create_payment_request,
+    export_payments,
     fee_reserve_total,
     get_payments_daily_stats,
     pay_invoice,
     perform_withdraw,
+    poll_pending_payment,
     settle_hold_invoice,
     update_pending_payment,
 )
@@ -201,7 +208,7 @@ async def api_payments_paginated(
             else:
                 payments.append(payment)
 
-    return Page(data=payments, total=page.total)
+    return Page(data=payments, total=page.total, next_cursor=page.next_cursor)
 
 
 @payment_router.get(
@@ -311,9 +318,42 @@ async def api_payments_fee_reserve(invoice: str = Query("invoice")) -> JSONRespo
         )
 
 
+@payment_router.get(
+    "/export",
+    name="Payment Export",
+    summary="export all payments of a wallet as CSV or JSON lines",
+    response_class=StreamingResponse,
+    openapi_extra=generate_filter_params_openapi(PaymentFilters),
+)
+async def api_payments_export(
+    key_info: BaseWalletTypeInfo = Depends(require_base_invoice_key),
+    export_format: PaymentExportFormat = Query(PaymentExportFormat.CSV, alias="format"),
+    filters: Filters[PaymentFilters] = Depends(parse_filters(PaymentFilters)),
+) -> StreamingResponse:
+    filename = f"payments-{key_info.wallet.id}.{export_format.value}"
+    return StreamingResponse(
+        export_payments(export_format, wallet_id=key_info.wallet.id, filters=filters),
+        media_type=export_format.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 # TODO: refactor this route into a public and admin one
 @payment_router.get("/{payment_hash}")
-async def api_payment(payment_hash, x_api_key: str | None = Header(None)):
+async def api_payment(
+    payment_hash,
+    x_api_key: str | None = Header(None),
+    wait: Annotated[
+        int,
+        Query(
+            ge=0,
+            description=(
+                "Seconds to wait for a pending incoming payment to be paid "
+                "before answering (long polling)."
+            ),
+        ),
+    ] = 0,
+):
     # We use X_Api_Key here because we want this call to work with and without keys
     # If a valid key is given, we also return the field "details", otherwise not
     wallet = await get_wallet_for_key(x_api_key) if isinstance(x_api_key, str) else None
@@ -337,7 +377,7 @@ async def api_payment(payment_hash, x_api_key: str | None = Header(None)):
         return {"paid": False, "status": "failed"}
 
     try:
-        payment = await update_pending_payment(payment)
+        payment = await _poll_payment(payment, wait)
     except Exception:
         if wallet and wallet.id == payment.wallet_id:
             return {"paid": False, "details": payment}
@@ -353,6 +393,29 @@ async def api_payment(payment_hash, x_api_key: str | None = Header(None)):
     return {"paid": payment.success, "preimage": payment.preimage}
 
 
+async def _poll_payment(payment: Payment, wait: int) -> Payment:
+    """
+    Check a pending payment with the funding source, an incoming payment
+    waits up to `wait` seconds to be settled.
+    """
+    wait = min(wait, settings.payment_poll_max_wait) if payment.is_in else 0
+    if not wait:
+        return await poll_pending_payment(payment)
+
+    # registered before the check, so that a settlement in between is not missed
+    waiter = register_payment_waiter(payment.payment_hash)
+    try:
+        payment = await poll_pending_payment(payment)
+        if payment.pending:
+            payment = await asyncio.wait_for(waiter, timeout=wait)
+    except asyncio.TimeoutError:
+        # it might have been settled by another worker
+        payment = await get_standalone_payment(payment.checking_id) or payment
+    finally:
+        unregister_payment_waiter(payment.payment_hash, waiter)
+    return payment
+
+
 @payment_router.post("/decode", status_code=HTTPStatus.OK)
 async def api_payments_decode(data: DecodePayment) -> JSONResponse:
     payment_str = data.data
@@ -1,5 +1,4 @@
 from http import HTTPStatus
-from uuid import uuid4
 
 from fastapi import (
     APIRouter,
@@ -9,9 +8,9 @@ from fastapi import (
 )
 
 from lnbits.core.crud.wallets import (
-    clear_wallet_cache,
     create_wallet,
     get_wallets_paginated,
+    reset_wallet_keys,
 )
 from lnbits.core.models import CreateWallet, KeyType, Wallet, WalletTypeInfo
 from lnbits.core.models.lnurl import StoredPayLink, StoredPayLinks
@@ -134,12 +133,7 @@ async def api_reset_wallet_keys(
     if not wallet or wallet.user != account_id.id:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="Wallet not found")
 
-    clear_wallet_cache(wallet)
-
-    wallet.adminkey = uuid4().hex
-    wallet.inkey = uuid4().hex
-    await update_wallet(wallet)
-    return wallet
+    return await reset_wallet_keys(wallet)
 
 
 @wallet_router.put("/stored_paylinks/{wallet_id}")
@@ -1,19 +1,27 @@
 from __future__ import annotations
 
 import asyncio
+import base64
 import json
 import os
 import re
 import time
+from collections.abc import Callable, Iterator
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from enum import Enum
+from functools import cache, lru_cache
 from typing import Any, Generic, Literal, TypeVar, get_origin
 
 from loguru import logger
 from pydantic import BaseModel, ValidationError, root_validator
+from pydantic.fields import ModelField
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.sql import text
+from sqlalchemy.sql.elements import TextClause
 
 from lnbits.settings import settings
 
@@ -46,6 +54,16 @@ else:
     DB_TYPE = SQLITE
 
 
+# queries are static strings (values are bound), so the set of distinct
+# statements is small and their parsed `text()` clauses can be reused
+STATEMENT_CACHE_SIZE = 2048
+# bound values per query, the lowest limit of the supported databases
+# (SQLite before 3.32), postgres allows up to 32767
+MAX_QUERY_PARAMETERS = 999
+
+_html_regex = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
+
+
 def compat_timestamp_placeholder(key: str):
     if DB_TYPE == POSTGRES:
         return f"to_timestamp(:{key})"
@@ -127,6 +145,13 @@ class Compat:
             return "BYTEA"
         return "BLOB"
 
+    @property
+    def for_update(self) -> str:
+        """Row lock for a SELECT, SQLite locks the whole database on write."""
+        if self.type in {POSTGRES, COCKROACH}:
+            return "FOR UPDATE"
+        return ""
+
     def timestamp_placeholder(self, key: str) -> str:
         return compat_timestamp_placeholder(key)
 
@@ -137,20 +162,46 @@ class Connection(Compat):
         self.type = typ
         self.name = name
         self.schema = schema
+        self._transaction_depth = 0
+
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Group several statements into a single transaction.
+        They are committed together when the outermost block exits
+        or rolled back if it raises.
+        """
+        self._transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            if self._transaction_depth == 1:
+                await self.conn.rollback()
+            raise
+        else:
+            if self._transaction_depth == 1:
+                await self.conn.commit()
+        finally:
+            self._transaction_depth -= 1
+
+    async def commit(self) -> None:
+        """Commit, unless the statement is part of a `transaction()` block."""
+        if self._transaction_depth == 0:
+            await self.conn.commit()
 
     def rewrite_query(self, query) -> str:
-        if self.type in {POSTGRES, COCKROACH}:
-            query = query.replace("%", "%%")
-            query = query.replace("?", "%s")
-        return query
+        return _rewrite_query(query, self.type)
+
+    def statement(self, query: str) -> TextClause:
+        """The rewritten `text()` clause for `query`, cached per query string."""
+        return _statement(query, self.type)
 
     def rewrite_values(self, values: dict) -> dict:
-        # strip html
-        clean_regex = re.compile("<.*?>|&([a-z0-9]+|#[0-9]{1,6}|#x[0-9a-f]{1,6});")
         clean_values: dict = {}
         for key, raw_value in values.items():
             if isinstance(raw_value, str):
-                clean_values[key] = re.sub(clean_regex, "", raw_value)
+                # strip html
+                clean_values[key] = _html_regex.sub("", raw_value)
             elif isinstance(raw_value, datetime):
                 ts = raw_value.timestamp()
                 if self.type == SQLITE:
@@ -166,15 +217,16 @@ class Connection(Compat):
         query: str,
         values: dict | None = None,
         model: type[TModel] | None = None,
+        trusted: bool = False,
     ) -> list[TModel]:
         params = self.rewrite_values(values) if values else {}
-        result = await self.conn.execute(text(self.rewrite_query(query)), params)
+        result = await self.conn.execute(self.statement(query), params)
         row = result.mappings().all()
         result.close()
         if not row:
             return []
         if model:
-            return [dict_to_model(r, model) for r in row]
+            return [dict_to_model(r, model, trusted) for r in row]
         return row
 
     async def fetchone(
@@ -182,28 +234,36 @@ class Connection(Compat):
         query: str,
         values: dict | None = None,
         model: type[TModel] | None = None,
+        trusted: bool = False,
     ) -> TModel:
         params = self.rewrite_values(values) if values else {}
-        result = await self.conn.execute(text(self.rewrite_query(query)), params)
+        result = await self.conn.execute(self.statement(query), params)
         row = result.mappings().first()
         result.close()
         if model and row:
-            return dict_to_model(row, model)
+            return dict_to_model(row, model, trusted)
         return row
 
     async def update(
         self, table_name: str, model: BaseModel, where: str = "WHERE id = :id"
     ):
         await self.conn.execute(
-            text(update_query(table_name, model, where)), model_to_dict(model)
+            _statement(update_query(table_name, model, where)), model_to_dict(model)
         )
-        await self.conn.commit()
+        await self.commit()
 
     async def insert(self, table_name: str, model: BaseModel):
         await self.conn.execute(
-            text(insert_query(table_name, model)), model_to_dict(model)
+            _statement(insert_query(table_name, model)), model_to_dict(model)
         )
-        await self.conn.commit()
+        await self.commit()
+
+    async def insert_many(self, table_name: str, models: list[BaseModel]):
+        if not models:
+            return
+        for query, values in insert_many_queries(table_name, models):
+            await self.conn.execute(_statement(query), values)
+        await self.commit()
 
     async def fetch_page(
         self,
@@ -214,6 +274,8 @@ class Connection(Compat):
         model: type[TModel] | None = None,
         group_by: list[str] | None = None,
         table_name: str | None = None,
+        cursor_field: str | None = None,
+        trusted: bool = False,
     ) -> Page[TModel]:
         """
         Parameters:
@@ -224,6 +286,11 @@ class Connection(Compat):
             model: pydantic model type to map query results into model instances.
             group_by: list of column names to group results by in the SQL query.
             table_name: if provided some optimisations can be applied.
+            cursor_field: unique column used as tie breaker for cursor (keyset)
+                pagination. If provided, `Page.next_cursor` is returned and
+                `filters.cursor` can be used instead of `filters.offset`.
+            trusted: rows are mapped to `model` without validation,
+                see `dict_to_model`.
         """
 
         if not filters:
@@ -234,9 +301,23 @@ class Connection(Compat):
                 raise ValueError(f"Invalid table name: '{table_name}'.")
             filters.set_table_name(table_name)
 
+        if cursor_field and not _valid_sql_name(cursor_field):
+            raise ValueError(f"Invalid cursor field: '{cursor_field}'.")
+        if filters.cursor and not cursor_field:
+            raise ValueError("Cursor pagination is not supported for this query.")
+
         clause = filters.where(where)
         parsed_values = filters.values(values)
 
+        page_clause = clause
+        page_values = parsed_values
+        if filters.cursor and cursor_field:
+            cursor_stmt, cursor_values = filters.cursor_where(cursor_field)
+            page_clause = (
+                f"{clause} AND {cursor_stmt}" if clause else f"WHERE {cursor_stmt}"
+            )
+            page_values = {**parsed_values, **cursor_values}
+
         group_by_string = ""
         if group_by:
             for field in group_by:
@@ -247,53 +328,153 @@ class Connection(Compat):
         rows = await self.fetchall(
             f"""
             {query}
-            {clause}
+            {page_clause}
             {group_by_string}
-            {filters.order_by()}
+            {filters.order_by(cursor_field)}
             {filters.pagination()}
             """,
-            self.rewrite_values(parsed_values),
+            self.rewrite_values(page_values),
             model,
+            trusted,
+        )
+
+        next_cursor = filters.next_cursor(rows, cursor_field) if cursor_field else None
+
+        count = await self._count_page(
+            rows, query, clause, group_by_string, parsed_values, filters, table_name
         )
-        if rows:
-            # no need for extra query if no pagination is specified
-            if filters.offset or filters.limit:
-                if table_name:
-                    count_query = f"SELECT COUNT(*) as count FROM {table_name} {clause}"  # noqa: S608
-                else:
-                    count_query = f"""SELECT COUNT(*) as count
-                    FROM (
-                        {query}
-                        {clause}
-                        {group_by_string}
-                    ) as count"""  # noqa: S608
-
-                result = await self.execute(count_query, parsed_values)
-                row = result.mappings().first()
-                result.close()
-                count = int(row.get("count", 0))
-            else:
-                count = len(rows)
-        else:
-            count = 0
 
         return Page(
             data=rows,
             total=count,
+            next_cursor=next_cursor,
         )
 
+    async def _count_page(
+        self,
+        rows: list,
+        query: str,
+        clause: str,
+        group_by_string: str,
+        values: dict,
+        filters: Filters,
+        table_name: str | None = None,
+    ) -> int:
+        if not rows:
+            return 0
+        if filters.count == "none":
+            # rows seen so far, the client has to follow `next_cursor`
+            return len(rows) if filters.cursor else (filters.offset or 0) + len(rows)
+        # no need for extra query if no pagination is specified
+        if not filters.offset and not filters.limit:
+            return len(rows)
+
+        count_limit = (
+            f"LIMIT {COUNT_ESTIMATE_LIMIT}" if filters.count == "estimate" else ""
+        )
+        if table_name and not count_limit:
+            count_query = (
+                f"SELECT COUNT(*) as count FROM {table_name} {clause}"  # noqa: S608
+            )
+        else:
+            count_query = f"""SELECT COUNT(*) as count
+            FROM (
+                {query}
+                {clause}
+                {group_by_string}
+                {count_limit}
+            ) as count"""  # noqa: S608
+
+        result = await self.execute(count_query, values)
+        row = result.mappings().first()
+        result.close()
+        return int(row.get("count", 0))
+
     async def execute(self, query: str, values: dict | None = None):
         params = self.rewrite_values(values) if values else {}
-        result = await self.conn.execute(text(self.rewrite_query(query)), params)
-        await self.conn.commit()
+        result = await self.conn.execute(self.statement(query), params)
+        await self.commit()
         return result
 
 
+class DatabasePoolStats(BaseModel):
+    """Connection wait timings of a single `Database`."""
+
+    name: str
+    concurrency: str
+    checked_out: int = 0
+    peak_checked_out: int = 0
+    waiting: int = 0
+    peak_waiting: int = 0
+    acquired: int = 0
+    timeouts: int = 0
+    # seconds spent waiting for a connection (lock + pool checkout)
+    wait_time_total: float = 0
+    wait_time_max: float = 0
+    wait_time_avg: float = 0
+
+
+class EnginePoolStats(BaseModel):
+    """Usage of a connection pool, which can be shared by several databases."""
+
+    databases: list[str]
+    pool_size: int
+    max_overflow: int
+    checked_out: int = 0
+    overflow: int = 0
+    # ratio of checked out connections to the maximum number of connections
+    saturation: float = 0
+
+
+class _PoolMonitor:
+    """Keeps track of connection checkouts and waits for a `Database`."""
+
+    def __init__(self):
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def wait_started(self) -> float:
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        return time.monotonic()
+
+    def wait_finished(self, started: float) -> None:
+        wait_time = time.monotonic() - started
+        self.waiting -= 1
+        self.acquired += 1
+        self.checked_out += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+        self.wait_time_total += wait_time
+        self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def wait_aborted(self, timeout: bool = False) -> None:
+        self.waiting -= 1
+        if timeout:
+            self.timeouts += 1
+
+    def released(self) -> None:
+        self.checked_out -= 1
+
+
+# engines are shared by all databases with the same URI in "pool" mode,
+# so that the pool size is the upper bound for the whole instance
+_pooled_engines: dict[str, AsyncEngine] = {}
+
+
 class Database(Compat):
-    def __init__(self, db_name: str):
+    _databases: dict[str, Database] = {}
+
+    def __init__(self, db_name: str, concurrency: str | None = None):
         self.name = db_name
         self.schema = self.name
         self.type = DB_TYPE
+        self.concurrency = concurrency or settings.lnbits_database_concurrency
 
         if self.type == POSTGRES and settings.lnbits_database_url:
             database_uri = settings.lnbits_database_url.replace(
@@ -314,56 +495,189 @@ class Database(Compat):
         else:
             self.schema = None
 
-        self.engine: AsyncEngine = create_async_engine(
-            database_uri, echo=settings.debug_database
-        )
+        if self.pooled:
+            self.engine: AsyncEngine = self._create_pooled_engine(database_uri)
+        else:
+            self.engine = create_async_engine(
+                database_uri, echo=settings.debug_database
+            )
+        # in "lock" mode it serializes all connections,
+        # in "pool" mode it serializes the SQLite writers
         self.lock = asyncio.Lock()
+        self._monitor = _PoolMonitor()
+        self._schema_created = False
+        Database._databases[self.name] = self
         logger.trace(f"database {self.type} added for {self.name}")
 
+    @property
+    def pooled(self) -> bool:
+        return self.concurrency == "pool"
+
     @asynccontextmanager
-    async def connect(self):
-        await self.lock.acquire()
+    async def connect(self, readonly: bool = False):
+        """
+        Open a connection to the database.
+        In "pool" mode `readonly` connections to SQLite do not wait for the writer.
+        """
+        lock = self._connection_lock(readonly)
+        conn = await self._checkout(lock)
         try:
-            async with self.engine.connect() as conn:
-                if not conn:
-                    raise Exception("Could not connect to the database")
+            wconn = Connection(conn, self.type, self.name, self.schema)
+
+            if self.schema:
+                if self.type in {POSTGRES, COCKROACH} and not self._schema_created:
+                    await wconn.execute(f"CREATE SCHEMA IF NOT EXISTS {self.schema}")
+                    # the shared pool outlives the connection, create it only once
+                    self._schema_created = self.pooled
+                elif self.type == SQLITE and not self.pooled:
+                    # pooled connections are attached once, when they are created
+                    await wconn.execute(f"ATTACH '{self.path}' AS {self.schema}")
+
+            yield wconn
+        finally:
+            try:
+                await asyncio.shield(conn.close())
+            finally:
+                self._monitor.released()
+                if lock:
+                    lock.release()
+
+    def pool_stats(self) -> DatabasePoolStats:
+        monitor = self._monitor
+        wait_time_avg = monitor.wait_time_total / max(1, monitor.acquired)
+        return DatabasePoolStats(
+            name=self.name,
+            concurrency=self.concurrency,
+            checked_out=monitor.checked_out,
+            peak_checked_out=monitor.peak_checked_out,
+            waiting=monitor.waiting,
+            peak_waiting=monitor.peak_waiting,
+            acquired=monitor.acquired,
+            timeouts=monitor.timeouts,
+            wait_time_total=round(monitor.wait_time_total, 6),
+            wait_time_max=round(monitor.wait_time_max, 6),
+            wait_time_avg=round(wait_time_avg, 6),
+        )
 
-                wconn = Connection(conn, self.type, self.name, self.schema)
+    @classmethod
+    def all_pool_stats(cls) -> list[DatabasePoolStats]:
+        return [database.pool_stats() for database in cls._databases.values()]
 
-                if self.schema:
-                    if self.type in {POSTGRES, COCKROACH}:
-                        await wconn.execute(
-                            f"CREATE SCHEMA IF NOT EXISTS {self.schema}"
-                        )
-                    elif self.type == SQLITE:
-                        await wconn.execute(f"ATTACH '{self.path}' AS {self.schema}")
+    @classmethod
+    def all_engine_stats(cls) -> list[EnginePoolStats]:
+        """Report every engine once, even if it is shared by several databases."""
+        engines: dict[int, list[Database]] = {}
+        for database in cls._databases.values():
+            engines.setdefault(id(database.engine), []).append(database)
+        return [_engine_stats(databases) for databases in engines.values()]
+
+    async def close(self) -> None:
+        """Close the pooled connections (and their worker threads for SQLite)."""
+        Database._databases.pop(self.name, None)
+        await self.engine.dispose()
 
-                yield wconn
-        finally:
-            self.lock.release()
+    @classmethod
+    async def close_all(cls) -> None:
+        engines = {id(d.engine): d.engine for d in cls._databases.values()}
+        for engine in engines.values():
+            await engine.dispose()
+
+    def _connection_lock(self, readonly: bool) -> asyncio.Lock | None:
+        if not self.pooled:
+            return self.lock
+        if self.type == SQLITE and not readonly:
+            return self.lock
+        return None
+
+    async def _checkout(self, lock: asyncio.Lock | None) -> AsyncConnection:
+        wait_started = self._monitor.wait_started()
+        try:
+            if lock:
+                await self._acquire_lock(lock)
+            try:
+                conn = await self.engine.connect().start()
+            except BaseException:
+                if lock:
+                    lock.release()
+                raise
+        except (asyncio.TimeoutError, SQLAlchemyTimeoutError) as exc:
+            self._monitor.wait_aborted(timeout=True)
+            raise TimeoutError(
+                f"Timed out waiting for a '{self.name}' database connection."
+            ) from exc
+        except BaseException:
+            self._monitor.wait_aborted()
+            raise
+        self._monitor.wait_finished(wait_started)
+        return conn
+
+    async def _acquire_lock(self, lock: asyncio.Lock) -> None:
+        if not self.pooled:
+            await lock.acquire()
+            return
+        await asyncio.wait_for(
+            lock.acquire(), timeout=settings.lnbits_database_pool_timeout
+        )
+
+    def _create_pooled_engine(self, database_uri: str) -> AsyncEngine:
+        if self.type != SQLITE and database_uri in _pooled_engines:
+            return _pooled_engines[database_uri]
+
+        # every SQLite file has its own pool and every aiosqlite connection runs in
+        # its own thread, so SQLite pools are not allowed to overflow
+        engine = create_async_engine(
+            database_uri,
+            echo=settings.debug_database,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=settings.lnbits_database_pool_size,
+            max_overflow=_max_overflow(self.type),
+            pool_timeout=settings.lnbits_database_pool_timeout,
+            pool_pre_ping=self.type != SQLITE,
+        )
+        if self.type == SQLITE:
+            event.listen(engine.sync_engine, "connect", self._on_sqlite_connect)
+        else:
+            _pooled_engines[database_uri] = engine
+        return engine
+
+    def _on_sqlite_connect(self, dbapi_connection, _) -> None:
+        cursor = dbapi_connection.cursor()
+        # WAL allows readers to run concurrently with the (single) writer
+        cursor.execute("PRAGMA journal_mode=WAL")
+        busy_timeout = int(settings.lnbits_database_pool_timeout * 1000)
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        if self.schema:
+            cursor.execute(f"ATTACH '{self.path}' AS {self.schema}")
+        cursor.close()
 
     async def fetchall(
         self,
         query: str,
         values: dict | None = None,
         model: type[TModel] | None = None,
+        trusted: bool = False,
     ) -> list[TModel]:
-        async with self.connect() as conn:
-            return await conn.fetchall(query, values, model)
+        async with self.connect(readonly=True) as conn:
+            return await conn.fetchall(query, values, model, trusted)
 
     async def fetchone(
         self,
         query: str,
         values: dict | None = None,
         model: type[TModel] | None = None,
+        trusted: bool = False,
     ) -> TModel:
-        async with self.connect() as conn:
-            return await conn.fetchone(query, values, model)
+        async with self.connect(readonly=True) as conn:
+            return await conn.fetchone(query, values, model, trusted)
 
     async def insert(self, table_name: str, model: BaseModel) -> None:
         async with self.connect() as conn:
             await conn.insert(table_name, model)
 
+    async def insert_many(self, table_name: str, models: list[BaseModel]) -> None:
+        async with self.connect() as conn:
+            await conn.insert_many(table_name, models)
+
     async def update(
         self, table_name: str, model: BaseModel, where: str = "WHERE id = :id"
     ) -> None:
@@ -379,10 +693,20 @@ class Database(Compat):
         model: type[TModel] | None = None,
         group_by: list[str] | None = None,
         table_name: str | None = None,
+        cursor_field: str | None = None,
+        trusted: bool = False,
     ) -> Page[TModel]:
-        async with self.connect() as conn:
+        async with self.connect(readonly=True) as conn:
             return await conn.fetch_page(
-                query, where, values, filters, model, group_by, table_name
+                query,
+                where,
+                values,
+                filters,
+                model,
+                group_by,
+                table_name,
+                cursor_field,
+                trusted,
             )
 
     async def execute(self, query: str, values: dict | None = None):
@@ -409,6 +733,34 @@ class Database(Compat):
         return False
 
 
+def _max_overflow(db_type: str) -> int:
+    if db_type == SQLITE:
+        return 0
+    return settings.lnbits_database_pool_max_overflow
+
+
+def _engine_stats(databases: list[Database]) -> EnginePoolStats:
+    database = databases[0]
+    if database.pooled:
+        pool = database.engine.pool
+        pool_size = settings.lnbits_database_pool_size
+        max_overflow = _max_overflow(database.type)
+        checked_out = pool.checkedout()  # type: ignore[attr-defined]
+        overflow = max(0, pool.overflow())  # type: ignore[attr-defined]
+    else:
+        # in "lock" mode only one connection is used at a time
+        pool_size, max_overflow, overflow = 1, 0, 0
+        checked_out = database.pool_stats().checked_out
+    return EnginePoolStats(
+        databases=[d.name for d in databases],
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        checked_out=checked_out,
+        overflow=overflow,
+        saturation=round(checked_out / (pool_size + max_overflow), 3),
+    )
+
+
 class Operator(Enum):
     GT = "gt"
     LT = "lt"
@@ -456,9 +808,14 @@ TModel = TypeVar("TModel", bound=BaseModel)
 TFilterModel = TypeVar("TFilterModel", bound=FilterModel)
 
 
+# `count=estimate` stops counting after this many rows
+COUNT_ESTIMATE_LIMIT = 10_000
+
+
 class Page(BaseModel, Generic[T]):
     data: list[T]
     total: int
+    next_cursor: str | None = None
 
 
 class Filter(BaseModel, Generic[TFilterModel]):
@@ -541,6 +898,10 @@ class Filters(BaseModel, Generic[TFilterModel]):
     limit: int | None = 10
     sortby: str | None = None
     direction: Literal["asc", "desc"] | None = None
+    # opaque token from `Page.next_cursor`, replaces `offset`
+    cursor: str | None = None
+    # `estimate` caps the count at COUNT_ESTIMATE_LIMIT, `none` skips it
+    count: Literal["exact", "estimate", "none"] = "exact"
 
     model: type[TFilterModel] | None = None
 
@@ -562,10 +923,50 @@ class Filters(BaseModel, Generic[TFilterModel]):
         stmt = ""
         self.limit = self.limit or 10
         stmt += f"LIMIT {min(1000, self.limit)} "
-        if self.offset:
+        if self.offset and not self.cursor:
             stmt += f"OFFSET {self.offset}"
         return stmt
 
+    def cursor_where(self, cursor_field: str) -> tuple[str, dict]:
+        """
+        Keyset condition that selects the rows after `self.cursor`.
+        Returns the statement and its values.
+        """
+        sort_value, last_id = _decode_cursor(self.cursor or "")
+        sortby = self.sortby or cursor_field
+        prefix = f"{self.table_name}." if self.table_name else ""
+        op = "<" if self.direction == "desc" else ">"
+        values = {"cursor__id": last_id}
+        if sortby == cursor_field:
+            return f"{prefix}{cursor_field} {op} :cursor__id", values
+
+        if sort_value is None:
+            raise ValueError("Invalid cursor.")
+        values["cursor__value"] = sort_value
+        placeholder = ":cursor__value"
+        if self.model and sortby in self.model.__fields__:
+            if self.model.__fields__[sortby].type_ == datetime:
+                placeholder = compat_timestamp_placeholder("cursor__value")
+        return (
+            f"({prefix}{sortby} {op} {placeholder} OR "
+            f"({prefix}{sortby} = {placeholder} "
+            f"AND {prefix}{cursor_field} {op} :cursor__id))"
+        ), values
+
+    def next_cursor(self, rows: list, cursor_field: str) -> str | None:
+        """Cursor for the page after `rows`, None if this is the last page."""
+        if not rows or len(rows) < min(1000, self.limit or 10):
+            return None
+        sortby = self.sortby or cursor_field
+        last_row = rows[-1]
+        sort_value = _row_value(last_row, sortby)
+        if sort_value is None:
+            # keyset pagination does not work over NULL values
+            return None
+        if isinstance(sort_value, datetime):
+            sort_value = sort_value.timestamp()
+        return _encode_cursor(sort_value, _row_value(last_row, cursor_field))
+
     def where(self, where_stmts: list[str] | None = None) -> str:
         if not where_stmts:
             where_stmts = []
@@ -585,11 +986,18 @@ class Filters(BaseModel, Generic[TFilterModel]):
             return "WHERE " + " AND ".join(where_stmts)
         return ""
 
-    def order_by(self) -> str:
-        if self.sortby:
-            prefix = f"{self.table_name}." if self.table_name else ""
-            return f"ORDER BY {prefix}{self.sortby} {self.direction or 'asc'}"
-        return ""
+    def order_by(self, cursor_field: str | None = None) -> str:
+        # the first page has to be in cursor order too, `next_cursor` is its last row
+        sortby = self.sortby or cursor_field
+        if not sortby:
+            return ""
+        prefix = f"{self.table_name}." if self.table_name else ""
+        direction = self.direction or "asc"
+        stmt = f"ORDER BY {prefix}{sortby} {direction}"
+        if cursor_field and cursor_field != sortby:
+            # tie breaker, the order has to be unique for cursor pagination
+            stmt += f", {prefix}{cursor_field} {direction}"
+        return stmt
 
     def values(self, values: dict | None = None) -> dict:
         if not values:
@@ -621,6 +1029,23 @@ class DbJsonEncoder(json.JSONEncoder):
         return super().default(o)
 
 
+def _rewrite_query(query: str, typ: str | None) -> str:
+    if typ in {POSTGRES, COCKROACH}:
+        query = query.replace("%", "%%")
+        query = query.replace("?", "%s")
+    return query
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def _statement(query: str, typ: str | None = None) -> TextClause:
+    """
+    Parsing a `text()` clause (bind parameter regex) is the costly part of a
+    statement, it is done once per distinct query and database type.
+    Without `typ` the query is not rewritten (generated insert/update queries).
+    """
+    return text(_rewrite_query(query, typ))
+
+
 def insert_query(table_name: str, model: BaseModel) -> str:
     """
     Generate an insert query with placeholders for a given table and model
@@ -654,39 +1079,71 @@ def update_query(
     return f"UPDATE {table_name} SET {query} {where}"  # noqa: S608
 
 
+def insert_many_query(table_name: str, models: list[BaseModel]) -> tuple[str, dict]:
+    """
+    Generate a single multi-row insert query and its values for a list of models
+    of the same type. The placeholders of every row are suffixed with its index.
+    :param table_name: Name of the table
+    :param models: Pydantic models
+    """
+    rows = [model_to_dict(model) for model in models]
+    keys = list(rows[0].keys())
+    values: dict = {}
+    placeholders = []
+    for i, row in enumerate(rows):
+        placeholders.append(", ".join([f":{key}_{i}" for key in keys]))
+        values.update({f"{key}_{i}": row[key] for key in keys})
+    # add quotes to keys to avoid SQL conflicts (e.g. `user` is a reserved keyword)
+    fields = ", ".join([f'"{key}"' for key in keys])
+    rows_values = ", ".join([f"({row})" for row in placeholders])
+    query = f"INSERT INTO {table_name} ({fields}) VALUES {rows_values}"  # noqa: S608
+    return query, values
+
+
+def insert_many_queries(
+    table_name: str,
+    models: list[BaseModel],
+    max_parameters: int = MAX_QUERY_PARAMETERS,
+) -> Iterator[tuple[str, dict]]:
+    """
+    Like `insert_many_query`, but split into as many queries as needed to
+    stay within `max_parameters` bound values per query.
+    """
+    columns = len(model_to_dict(models[0]))
+    rows = max(max_parameters // columns, 1)
+    for i in range(0, len(models), rows):
+        yield insert_many_query(table_name, models[i : i + rows])
+
+
 def model_to_dict(model: BaseModel) -> dict:
     """
     Convert a Pydantic model to a dictionary with JSON-encoded nested models
     private fields starting with _ are ignored
     :param model: Pydantic model
     """
+    no_database, json_fields = _model_to_dict_plan(type(model))
     _dict: dict = {}
     for key, value in model.dict().items():
-        type_ = model.__fields__[key].type_
-        outertype_ = model.__fields__[key].outer_type_
-        if model.__fields__[key].field_info.extra.get("no_database", False):
+        if key in no_database:
             continue
-        if isinstance(value, datetime):
+        if key in json_fields:
+            _dict[key] = json.dumps(value, cls=DbJsonEncoder)
+        elif isinstance(value, datetime):
             if DB_TYPE == SQLITE:
                 _dict[key] = value.timestamp()
             else:
                 # remove tz. postgres and cockroach TIMESTAMP is not tz aware
                 # so it will throw if we dont remove the UTC.
                 _dict[key] = value.replace(tzinfo=None)
-            continue
-        if (
-            type(type_) is type(BaseModel)
-            or type_ is dict
-            or get_origin(outertype_) is list
-        ):
-            _dict[key] = json.dumps(value, cls=DbJsonEncoder)
-            continue
-        _dict[key] = value
+        else:
+            _dict[key] = value
 
     return _dict
 
 
-def dict_to_submodel(model: type[TModel], value: dict | str) -> TModel | None:
+def dict_to_submodel(
+    model: type[TModel], value: dict | str, trusted: bool = False
+) -> TModel | None:
     """convert a dictionary or JSON string to a Pydantic model"""
     if isinstance(value, str):
         if value == "null" or value == "":
@@ -696,56 +1153,128 @@ def dict_to_submodel(model: type[TModel], value: dict | str) -> TModel | None:
         _subdict = value
 
     # recursively convert nested models
-    return dict_to_model(_subdict, model)
+    return dict_to_model(_subdict, model, trusted)
 
 
-def dict_to_model(_row: dict, model: type[TModel]) -> TModel:  # noqa: C901
+def dict_to_model(_row: dict, model: type[TModel], trusted: bool = False) -> TModel:
     """
     Convert a dictionary with JSON-encoded nested models to a Pydantic model
     :param _dict: Dictionary from database
     :param model: Pydantic model
+    :param trusted: the row was written by LNbits itself, so the converted values
+        are assigned without running the pydantic validation (`model.construct`).
+        Models that derive fields in `__init__` do so in a `post_construct` method.
     """
+    plan = _dict_to_model_plan(model)
     _dict: dict = {}
     for key, value in _row.items():
         if value is None:
             continue
-        if key not in model.__fields__:
+        if key not in plan:
             # Somethimes an SQL JOIN will create additional column
             continue
-        type_ = model.__fields__[key].type_
-        outertype_ = model.__fields__[key].outer_type_
-        if get_origin(outertype_) is list:
-            _items = _safe_load_json(value) if isinstance(value, str) else value
-            _dict[key] = [
-                dict_to_submodel(type_, v) if issubclass(type_, BaseModel) else v
-                for v in _items
-            ]
-            continue
-        if issubclass(type_, bool):
-            _dict[key] = bool(value)
-            continue
-        if issubclass(type_, datetime):
-            if DB_TYPE == SQLITE:
-                _dict[key] = datetime.fromtimestamp(value, timezone.utc)
-            else:
-                _dict[key] = value.replace(tzinfo=timezone.utc)
-            continue
-        if issubclass(type_, BaseModel):
-            _dict[key] = dict_to_submodel(type_, value)
-            continue
-        # TODO: remove this when all sub models are migrated to Pydantic
-        # NOTE: this is for type dict on BaseModel, (used in Payment class)
-        if type_ is dict and value:
-            _dict[key] = _safe_load_json(value)
-            continue
-        _dict[key] = value
-        continue
+        convert = plan[key]
+        _dict[key] = convert(value, trusted) if convert else value
+    if not trusted:
+        return model(**_dict)
     _model = model.construct(**_dict)
-    if isinstance(_model, BaseModel):
-        _model.__init__(**_dict)  # type: ignore
+    post_construct = getattr(_model, "post_construct", None)
+    if post_construct:
+        post_construct()
     return _model
 
 
+@cache
+def _model_to_dict_plan(
+    model: type[BaseModel],
+) -> tuple[frozenset[str], frozenset[str]]:
+    """Skipped and JSON-encoded fields for `model_to_dict`, once per model class."""
+    no_database = set()
+    json_fields = set()
+    for key, field in model.__fields__.items():
+        if field.field_info.extra.get("no_database", False):
+            no_database.add(key)
+        elif (
+            type(field.type_) is type(BaseModel)
+            or field.type_ is dict
+            or get_origin(field.outer_type_) is list
+        ):
+            json_fields.add(key)
+    return frozenset(no_database), frozenset(json_fields)
+
+
+_Converter = Callable[[Any, bool], Any]
+
+
+@cache
+def _dict_to_model_plan(model: type[BaseModel]) -> dict[str, _Converter | None]:
+    """Column converters for `dict_to_model`, computed once per model class."""
+    return {key: _field_converter(field) for key, field in model.__fields__.items()}
+
+
+def _field_converter(field: ModelField) -> _Converter | None:  # noqa: C901
+    type_ = field.type_
+    if get_origin(field.outer_type_) is list:
+        item = _field_converter(field.sub_fields[0]) if field.sub_fields else None
+
+        def _list(value, trusted):
+            _items = _safe_load_json(value) if isinstance(value, str) else value
+            if not item:
+                return _items
+            return [item(v, trusted) for v in _items]
+
+        return _list
+    if not isinstance(type_, type):
+        return None
+    if issubclass(type_, Enum):
+        return lambda value, trusted: type_(value) if trusted else value
+    if issubclass(type_, bool):
+        return lambda value, _: bool(value)
+    if issubclass(type_, datetime):
+        if DB_TYPE == SQLITE:
+            return lambda value, _: datetime.fromtimestamp(value, timezone.utc)
+        return lambda value, _: value.replace(tzinfo=timezone.utc)
+    if issubclass(type_, BaseModel):
+        return lambda value, trusted: dict_to_submodel(type_, value, trusted)
+    # TODO: remove this when all sub models are migrated to Pydantic
+    # NOTE: this is for type dict on BaseModel, (used in Payment class)
+    if type_ is dict:
+        return lambda value, _: (
+            _safe_load_json(value) if value and isinstance(value, str) else value
+        )
+    if type_ is int:
+        # validation would coerce it, e.g. `Decimal` sums on postgres
+        return lambda value, trusted: (
+            int(value) if trusted and type(value) is not int else value
+        )
+    return None
+
+
+def _encode_cursor(sort_value: Any, last_id: Any) -> str:
+    token = json.dumps([sort_value, last_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[Any, Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor.") from exc
+    scalar = (str, int, float)
+    if not isinstance(last_id, scalar) or not (
+        sort_value is None or isinstance(sort_value, scalar)
+    ):
+        raise ValueError("Invalid cursor.")
+    return sort_value, last_id
+
+
+def _row_value(row: Any, field: str) -> Any:
+    if isinstance(row, dict):
+        return row.get(field)
+    return getattr(row, field, None)
+
+
 def _safe_load_json(value: str) -> dict:
     try:
         return json.loads(value)
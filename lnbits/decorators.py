@@ -16,10 +16,9 @@ from lnbits.core.crud import (
     get_account_by_username,
     get_user_active_extensions_ids,
     get_user_from_account,
-    get_wallet_for_key,
 )
 from lnbits.core.crud.users import get_user_access_control_lists
-from lnbits.core.crud.wallets import get_base_wallet_for_key
+from lnbits.core.crud.wallets import get_wallet_auth_for_key, wallet_cache_tags
 from lnbits.core.db import db
 from lnbits.core.models import (
     AccessTokenPayload,
@@ -30,7 +29,7 @@ from lnbits.core.models import (
     WalletTypeInfo,
 )
 from lnbits.core.models.users import AccountId
-from lnbits.core.models.wallets import BaseWallet, BaseWalletTypeInfo
+from lnbits.core.models.wallets import BaseWallet, BaseWalletTypeInfo, WalletAuth
 from lnbits.db import Connection, Filter, Filters, TFilterModel
 from lnbits.helpers import normalize_path, path_segments, sha256s
 from lnbits.settings import AuthMethods, settings
@@ -114,26 +113,22 @@ class KeyChecker(BaseKeyChecker):
         self,
         api_key: str | None = None,
         expected_key_type: KeyType | None = None,
+        with_balance: bool = True,
     ):
         super().__init__(api_key, expected_key_type)
+        self.with_balance = with_balance
 
     async def __call__(self, request: Request) -> WalletTypeInfo:
         key_value = self._extract_key_value(request)
-
-        async with db.connect() as conn:
-            wallet = await get_wallet_for_key(key_value, conn=conn)
-
-            if not wallet:
-                raise HTTPException(
-                    status_code=HTTPStatus.NOT_FOUND,
-                    detail="Wallet not found.",
-                )
-
-            request.scope["user_id"] = wallet.user
-            await _check_user_access(request, wallet.user, conn=conn)
-
-        key_type = await self._extract_key_type(key_value, wallet)
-        return WalletTypeInfo(key_type, wallet)
+        # the balance changes with every payment, only cached if configured
+        wallet_auth = await _get_wallet_auth(
+            request,
+            key_value,
+            with_balance=self.with_balance,
+            cache_time=settings.lnbits_crud_cache_seconds,
+        )
+        key_type = await self._extract_key_type(key_value, wallet_auth.wallet)
+        return WalletTypeInfo(key_type, wallet_auth.wallet)
 
 
 class LightKeyChecker(BaseKeyChecker):
@@ -147,34 +142,14 @@ class LightKeyChecker(BaseKeyChecker):
 
     async def __call__(self, request: Request) -> BaseWalletTypeInfo:
         key_value = self._extract_key_value(request)
-        cache_key = f"auth:x-api-key:{key_value}"
-        cache_time = settings.auth_authentication_cache_minutes * 60
-
-        async with db.connect() as conn:
-            if cache_time > 0:
-                key_info: BaseWalletTypeInfo | None = cache.get(cache_key)
-                if key_info:
-                    request.scope["user_id"] = key_info.wallet.user
-                    await _check_user_access(request, key_info.wallet.user, conn=conn)
-                    return key_info
-
-            wallet = await get_base_wallet_for_key(key_value, conn=conn)
-
-            if not wallet:
-                raise HTTPException(
-                    status_code=HTTPStatus.NOT_FOUND,
-                    detail="Wallet not found.",
-                )
-            request.scope["user_id"] = wallet.user
-            await _check_user_access(request, wallet.user, conn=conn)
-
-        key_type = await self._extract_key_type(key_value, wallet)
-        key_info = BaseWalletTypeInfo(key_type, wallet)
-
-        if cache_time > 0:
-            cache.set(cache_key, key_info, expiry=cache_time)
-            cache.set(f"auth:wallet:{wallet.id}", wallet, expiry=cache_time)
-        return key_info
+        wallet_auth = await _get_wallet_auth(
+            request,
+            key_value,
+            with_balance=False,
+            cache_time=settings.auth_authentication_cache_minutes * 60,
+        )
+        key_type = await self._extract_key_type(key_value, wallet_auth.wallet)
+        return BaseWalletTypeInfo(key_type, wallet_auth.wallet)
 
 
 async def require_admin_key(
@@ -246,7 +221,7 @@ async def check_account_id_exists(
 
     async with db.connect() as conn:
         if cache_key and settings.auth_authentication_cache_minutes > 0:
-            account_id = cache.get(cache_key)
+            account_id = await cache.aget(cache_key)
             if account_id:
                 r.scope["user_id"] = account_id.id
                 await _check_user_access(r, account_id.id, conn=conn)
@@ -256,10 +231,11 @@ async def check_account_id_exists(
         account_id = AccountId(id=account.id)
 
     if cache_key and settings.auth_authentication_cache_minutes > 0:
-        cache.set(
+        await cache.aset(
             cache_key,
             account_id,
             expiry=settings.auth_authentication_cache_minutes * 60,
+            tags=[f"user:{account.id}"],
         )
         cache.set(f"auth:user:cache_key:{sha256s(account.id)}", cache_key)
 
@@ -395,6 +371,12 @@ def parse_filters(model: type[TFilterModel]):
         sortby: str | None = None,
         direction: Literal["asc", "desc"] | None = None,
         search: str | None = Query(None, description="Text based search"),
+        cursor: str | None = Query(
+            None, description="Cursor from `next_cursor`, replaces `offset`"
+        ),
+        count: Literal["exact", "estimate", "none"] = Query(
+            "exact", description="How to count the total, `none` skips the count"
+        ),
     ):
         params = request.query_params
         filters = []
@@ -411,6 +393,8 @@ def parse_filters(model: type[TFilterModel]):
             sortby=sortby,
             direction=direction,
             search=search,
+            cursor=cursor,
+            count=count,
             model=model,
         )
 
@@ -418,11 +402,15 @@ def parse_filters(model: type[TFilterModel]):
 
 
 async def check_user_extension_access(
-    user_id: str, ext_id: str, conn: Connection | None = None
+    user_id: str,
+    ext_id: str,
+    conn: Connection | None = None,
+    active_extensions: list[str] | None = None,
 ) -> SimpleStatus:
     """
     Check if the user has access to a particular extension.
     Raises HTTP Forbidden if the user is not allowed.
+    `active_extensions` of the user are looked up if not given.
     """
     if settings.is_admin_extension(ext_id) and not settings.is_admin_user(user_id):
         return SimpleStatus(
@@ -430,7 +418,9 @@ async def check_user_extension_access(
         )
 
     if settings.is_installed_extension_id(ext_id):
-        ext_ids = await get_user_active_extensions_ids(user_id, conn=conn)
+        ext_ids = active_extensions
+        if ext_ids is None:
+            ext_ids = await get_user_active_extensions_ids(user_id, conn=conn)
         if ext_id not in ext_ids:
             return SimpleStatus(
                 success=False, message=f"Extension '{ext_id}' not enabled."
@@ -439,17 +429,63 @@ async def check_user_extension_access(
     return SimpleStatus(success=True, message="OK")
 
 
-async def _check_user_access(r: Request, user_id: str, conn: Connection | None = None):
+async def _get_wallet_auth(
+    request: Request, key_value: str, with_balance: bool, cache_time: float
+) -> WalletAuth:
+    """Resolve and authorize a wallet key, cached for `cache_time` seconds."""
+    cache_key = f"auth:wallet-key:{with_balance}:{key_value}"
+    wallet_auth: WalletAuth | None = None
+    if cache_time > 0:
+        wallet_auth = await cache.aget(cache_key)
+    if not wallet_auth:
+        wallet_auth = await get_wallet_auth_for_key(key_value, with_balance)
+        if not wallet_auth:
+            raise HTTPException(
+                status_code=HTTPStatus.NOT_FOUND,
+                detail="Wallet not found.",
+            )
+        if cache_time > 0:
+            # dropped on key reset, wallet deletion and account changes
+            tags = wallet_cache_tags(wallet_auth.wallet)
+            await cache.aset(cache_key, wallet_auth, expiry=cache_time, tags=tags)
+
+    user_id = wallet_auth.wallet.user
+    request.scope["user_id"] = user_id
+    await _check_user_access(
+        request, user_id, active_extensions=wallet_auth.active_extensions
+    )
+    if cache_time > 0:
+        # the endpoints may change their wallet, but not the cached one
+        return WalletAuth(
+            wallet=wallet_auth.wallet.copy(deep=True),
+            active_extensions=wallet_auth.active_extensions,
+        )
+    return wallet_auth
+
+
+async def _check_user_access(
+    r: Request,
+    user_id: str,
+    conn: Connection | None = None,
+    active_extensions: list[str] | None = None,
+):
     if not settings.is_user_allowed(user_id):
         raise HTTPException(HTTPStatus.FORBIDDEN, "User not allowed.")
-    await _check_user_extension_access(user_id, r["path"], conn=conn)
+    await _check_user_extension_access(
+        user_id, r["path"], conn=conn, active_extensions=active_extensions
+    )
 
 
 async def _check_user_extension_access(
-    user_id: str, path: str, conn: Connection | None = None
+    user_id: str,
+    path: str,
+    conn: Connection | None = None,
+    active_extensions: list[str] | None = None,
 ):
     ext_id = path_segments(path)[0]
-    status = await check_user_extension_access(user_id, ext_id, conn=conn)
+    status = await check_user_extension_access(
+        user_id, ext_id, conn=conn, active_extensions=active_extensions
+    )
     if not status.success:
         raise HTTPException(
             HTTPStatus.FORBIDDEN,
@@ -7,6 +7,7 @@ from typing import Any
 from urllib import request
 from urllib.parse import urlparse
 
+import jinja2
 import jwt
 import shortuuid
 from fastapi.routing import APIRoute
@@ -52,6 +53,12 @@ def static_url_for(static: str, path: str) -> str:
     return f"/{static}/{path}?v={settings.server_startup_time}"
 
 
+# one environment per set of template folders, keeps the compiled templates
+_template_renderers: dict[tuple[str, ...], Jinja2Templates] = {}
+# globals of the current settings version
+_template_globals: dict[int, dict[str, Any]] = {}
+
+
 def template_renderer(additional_folders: list | None = None) -> Jinja2Templates:
     folders = [
         "lnbits/templates",
@@ -60,37 +67,74 @@ def template_renderer(additional_folders: list | None = None) -> Jinja2Templates
     ]
 
     if additional_folders:
-        additional_folders += [
-            Path(settings.lnbits_extensions_path, "extensions", f)
-            for f in additional_folders
-        ]
         folders.extend(additional_folders)
-    t = Jinja2Templates(directory=folders)
-    t.env.globals["static_url_for"] = static_url_for
-    t.env.globals["normalize_path"] = normalize_path
+        folders.extend(
+            Path(settings.lnbits_extensions_path, "extensions", f).as_posix()
+            for f in additional_folders
+        )
+    key = tuple(str(folder) for folder in folders)
+
+    t = _template_renderers.get(key)
+    if not t:
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(list(key)),
+            autoescape=True,
+            bytecode_cache=_template_bytecode_cache(),
+        )
+        t = Jinja2Templates(env=env)
+        t.env.globals["static_url_for"] = static_url_for
+        t.env.globals["normalize_path"] = normalize_path
+        _template_renderers[key] = t
+
+    template_globals = _get_template_globals()
+    if t.env.globals.get("SETTINGS") is not template_globals["SETTINGS"]:
+        t.env.globals.update(template_globals)
+
+    return t
+
+
+def _template_bytecode_cache() -> jinja2.BytecodeCache | None:
+    """Compiled templates survive restarts and are shared between workers."""
+    cache_dir = Path(settings.lnbits_data_folder, "templates_cache")
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+    except OSError as exc:
+        logger.warning(f"Template bytecode cache disabled: {exc}")
+        return None
+    return jinja2.FileSystemBytecodeCache(cache_dir.as_posix())
+
 
+def _get_template_globals() -> dict[str, Any]:
+    """Recomputed only after the settings have changed."""
+    version = settings.settings_version
+    if version in _template_globals:
+        return _template_globals[version]
+
+    t_globals: dict[str, Any] = {}
     # used in base.html
-    t.env.globals["SITE_TITLE"] = settings.lnbits_site_title
-    t.env.globals["LNBITS_APPLE_TOUCH_ICON"] = settings.lnbits_apple_touch_icon
-    t.env.globals["SETTINGS"] = settings.to_public().dict(by_alias=True)
-    t.env.globals["CURRENCIES"] = list(currencies.keys())
+    t_globals["SITE_TITLE"] = settings.lnbits_site_title
+    t_globals["LNBITS_APPLE_TOUCH_ICON"] = settings.lnbits_apple_touch_icon
+    t_globals["SETTINGS"] = settings.to_public().dict(by_alias=True)
+    t_globals["CURRENCIES"] = list(currencies.keys())
 
     if settings.bundle_assets:
-        t.env.globals["INCLUDED_JS"] = ["bundle.min.js"]
-        t.env.globals["INCLUDED_CSS"] = ["bundle.min.css"]
-        t.env.globals["INCLUDED_COMPONENTS"] = ["bundle-components.min.js"]
+        t_globals["INCLUDED_JS"] = ["bundle.min.js"]
+        t_globals["INCLUDED_CSS"] = ["bundle.min.css"]
+        t_globals["INCLUDED_COMPONENTS"] = ["bundle-components.min.js"]
     else:
         vendor_filepath = Path(settings.lnbits_path, "static", "vendor.json")
         with open(vendor_filepath) as vendor_file:
             vendor_files = json.loads(vendor_file.read())
-            t.env.globals["INCLUDED_JS"] = vendor_files["js"]
-            t.env.globals["INCLUDED_CSS"] = vendor_files["css"]
-            t.env.globals["INCLUDED_COMPONENTS"] = vendor_files["components"]
+            t_globals["INCLUDED_JS"] = vendor_files["js"]
+            t_globals["INCLUDED_CSS"] = vendor_files["css"]
+            t_globals["INCLUDED_COMPONENTS"] = vendor_files["components"]
 
     # backwards compatibility for extensions (tpos)
-    t.env.globals["LNBITS_DENOMINATION"] = settings.lnbits_denomination
+    t_globals["LNBITS_DENOMINATION"] = settings.lnbits_denomination
 
-    return t
+    _template_globals.clear()
+    _template_globals[version] = t_globals
+    return t_globals
 
 
 def get_current_extension_name() -> str:
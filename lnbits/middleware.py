@@ -1,62 +1,71 @@
 import asyncio
 import json
-from datetime import datetime, timezone
+import time
 from http import HTTPStatus
 from typing import Any
+from urllib.parse import parse_qsl
 
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, Request
 from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
 from loguru import logger
 from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.middleware import SlowAPIMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from lnbits.core.db import core_app_extra
 from lnbits.core.models import AuditEntry
+from lnbits.core.models.audit import AuditWriterStats
 from lnbits.helpers import normalize_path, template_renderer
 from lnbits.settings import settings
 
 
 class InstalledExtensionMiddleware:
     # This middleware class intercepts calls made to the extensions API and:
+    #  - it redirects the calls to the extension paths if an extension has asked
+    #    for it. Eg: redirect `GET /.well-known` to `GET /lnurlp/api/v1/well-known`
     #  - it blocks the calls if the extension has been disabled or uninstalled.
     #  - it redirects the calls to the latest version of the extension
     #    if the extension has been upgraded.
     #  - otherwise it has no effect
+    # The rules are precompiled by `settings.extension_route_matcher()`.
     def __init__(self, app: ASGIApp) -> None:
         self.app = app
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
-        full_path = scope.get("path", "/")
-        if full_path == "/":
+        if "path" not in scope:
             await self.app(scope, receive, send)
             return
 
-        top_path, *rest = (p for p in full_path.split("/") if p)
+        matcher = settings.extension_route_matcher()
         headers = scope.get("headers", [])
+        redirect = matcher.find_redirect(scope["path"], headers)
+        if redirect:
+            scope["path"] = redirect.new_path_from(scope["path"])
+
+        full_path = scope["path"]
+        top_path, _, tail = full_path.lstrip("/").partition("/")
+        if top_path not in matcher.deactivated and top_path not in matcher.upgraded:
+            await self.app(scope, receive, send)
+            return
 
         # block path for all users if the extension is disabled
-        if top_path in settings.lnbits_deactivated_extensions:
+        if top_path in matcher.deactivated:
             response = self._response_by_accepted_type(
                 scope, headers, f"Extension '{top_path}' disabled", HTTPStatus.NOT_FOUND
             )
             await response(scope, receive, send)
             return
 
+        rest = [p for p in tail.split("/") if p]
         # static resources do not require redirect
         if rest[0:1] == ["static"]:
             await self.app(scope, receive, send)
             return
 
         # re-route all trafic if the extension has been upgraded
-        if top_path in settings.lnbits_upgraded_extensions:
-            upgrade_path = (
-                f"""{settings.lnbits_upgraded_extensions[top_path]}/{top_path}"""
-            )
-            tail = "/".join(rest)
-            scope["path"] = f"/upgrades/{upgrade_path}/{tail}"
+        upgrade_path = f"{matcher.upgraded[top_path]}/{top_path}"
+        scope["path"] = f"/upgrades/{upgrade_path}/{'/'.join(rest)}"
 
         await self.app(scope, receive, send)
 
@@ -96,66 +105,74 @@ class InstalledExtensionMiddleware:
         )
 
 
-class ExtensionsRedirectMiddleware:
-    # Extensions are allowed to specify redirect paths. A call to a path outside the
-    # scope of the extension can be redirected to one of the extension's endpoints.
-    # Eg: redirect `GET /.well-known` to `GET /lnurlp/api/v1/well-known`
+class AuditMiddleware:
+    """
+    Pure ASGI middleware, `receive` and `send` are wrapped to capture the request
+    body and the response status without buffering or extra tasks.
+    """
 
-    def __init__(self, app: ASGIApp) -> None:
+    def __init__(
+        self,
+        app: ASGIApp,
+        audit_queue: asyncio.Queue,
+        audit_stats: AuditWriterStats | None = None,
+    ) -> None:
         self.app = app
+        self.audit_queue = audit_queue
+        self.audit_stats = audit_stats or AuditWriterStats()
 
     async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
-        if "path" not in scope:
+        if scope["type"] != "http" or not self._is_auditable(scope):
             await self.app(scope, receive, send)
             return
 
-        req_headers = scope["headers"] if "headers" in scope else []
-        redirect = settings.find_extension_redirect(scope["path"], req_headers)
-        if redirect:
-            scope["path"] = redirect.new_path_from(scope["path"])
-
-        await self.app(scope, receive, send)
-
+        start_time = time.perf_counter()
+        response_code: str | None = None
+        body = bytearray()
+        max_body_size = settings.lnbits_audit_max_body_size
+        log_body = settings.lnbits_audit_log_request_body and max_body_size > 0
 
-class AuditMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp, audit_queue: asyncio.Queue) -> None:
-        super().__init__(app)
-        self.audit_queue = audit_queue
-        # delete_time purge after X days
-        # time, # include pats, exclude paths (regex)
+        async def _receive() -> Message:
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < max_body_size:
+                body.extend(message.get("body", b"")[: max_body_size - len(body)])
+            return message
 
-    async def dispatch(self, request: Request, call_next) -> Response:
-        start_time = datetime.now(timezone.utc)
-        request_details = await self._request_details(request)
-        response: Response | None = None
+        async def _send(message: Message) -> None:
+            nonlocal response_code
+            if message["type"] == "http.response.start":
+                response_code = str(message["status"])
+            await send(message)
 
         try:
-            response = await call_next(request)
-            return response
+            await self.app(scope, _receive if log_body else receive, _send)
         finally:
-            if request_details:
-                duration = (datetime.now(timezone.utc) - start_time).total_seconds()
-                await self._log_audit(request, response, duration, request_details)
+            duration = time.perf_counter() - start_time
+            request_details = self._request_details(scope, bytes(body))
+            self._log_audit(scope, response_code, duration, request_details)
 
-    async def _log_audit(
+    def _is_auditable(self, scope: Scope) -> bool:
+        if not settings.audit_http_request_details():
+            return False
+        return settings.audit_http_request(scope.get("method"), scope.get("path"))
+
+    def _log_audit(
         self,
-        request: Request,
-        response: Response | None,
+        scope: Scope,
+        response_code: str | None,
         duration: float,
         request_details: str | None,
     ):
         try:
-            http_method = request.scope.get("method", None)
-            path: str | None = getattr(request.scope.get("route", {}), "path", None)
-            response_code = str(response.status_code) if response else None
+            http_method = scope.get("method", None)
+            path: str | None = getattr(scope.get("route", {}), "path", None)
             if not settings.audit_http_request(http_method, path, response_code):
                 return None
+            client = scope.get("client")
             ip_address = (
-                request.client.host
-                if settings.lnbits_audit_log_ip_address and request.client
-                else None
+                client[0] if settings.lnbits_audit_log_ip_address and client else None
             )
-            user_id = request.scope.get("user_id", None)
+            user_id = scope.get("user_id", None)
             if settings.is_super_user(user_id):
                 user_id = "super_user"
             component = "core"
@@ -168,36 +185,40 @@ class AuditMiddleware(BaseHTTPMiddleware):
                 ip_address=ip_address,
                 user_id=user_id,
                 path=path,
-                request_type=request.scope.get("type", None),
+                request_type=scope.get("type", None),
                 request_method=http_method,
                 request_details=request_details,
                 response_code=response_code,
                 duration=duration,
             )
-            await self.audit_queue.put(data)
+            self._enqueue(data)
         except Exception as ex:
             logger.warning(ex)
 
-    async def _request_details(self, request: Request) -> str | None:
-        if not settings.audit_http_request_details():
-            return None
-
+    def _enqueue(self, data: AuditEntry) -> None:
+        try:
+            self.audit_queue.put_nowait(data)
+        except asyncio.QueueFull:
+            # never hold up a request because the audit writer falls behind
+            self.audit_stats.dropped += 1
+            if self.audit_stats.dropped == 1:
+                logger.warning("Audit queue is full, dropping audit entries.")
+
+    def _request_details(self, scope: Scope, body: bytes) -> str | None:
         try:
-            http_method = request.scope.get("method", None)
-            path = request.scope.get("path", None)
-
-            if not settings.audit_http_request(http_method, path):
-                return None
-
             details: dict = {}
             if settings.lnbits_audit_log_path_params:
-                details["path_params"] = request.path_params
+                details["path_params"] = scope.get("path_params", {})
             if settings.lnbits_audit_log_query_params:
-                details["query_params"] = dict(request.query_params)
+                query_string = scope.get("query_string", b"").decode("latin-1")
+                details["query_params"] = dict(
+                    parse_qsl(query_string, keep_blank_values=True)
+                )
             if settings.lnbits_audit_log_request_body:
-                _body = await request.body()
-                details["body"] = _body.decode("utf-8")
+                details["body"] = body.decode("utf-8", errors="replace")
             details_str = json.dumps(details)
+            if not settings.super_user:
+                return details_str
             # Make sure the super_user id is not leaked
             return details_str.replace(settings.super_user, "super_user")
         except Exception as e:
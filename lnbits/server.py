@@ -58,6 +58,8 @@ def main(
             ssl_keyfile=ssl_keyfile,
             ssl_certfile=ssl_certfile,
             reload=reload or False,
+            ws_ping_interval=settings.websocket_ping_interval or None,
+            ws_ping_timeout=settings.websocket_ping_timeout or None,
         )
 
         server = uvicorn.Server(config=config)
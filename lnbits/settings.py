@@ -8,6 +8,7 @@ import os
 import re
 from datetime import datetime, timezone
 from enum import Enum
+from functools import lru_cache
 from os import path
 from pathlib import Path
 from time import gmtime, strftime, time
@@ -15,7 +16,7 @@ from typing import Any
 from uuid import uuid4
 
 from loguru import logger
-from pydantic import BaseModel, BaseSettings, Extra, Field, validator
+from pydantic import BaseModel, BaseSettings, Extra, Field, PrivateAttr, validator
 
 
 def list_parse_fallback(v: str):
@@ -30,6 +31,23 @@ def list_parse_fallback(v: str):
 
 
 class LNbitsSettings(BaseModel):
+    # incremented on every change, values derived from the settings
+    # (e.g. the template globals) can be cached until it changes
+    _settings_version: int = PrivateAttr(0)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if name in self.__fields__:
+            self.settings_changed()
+
+    @property
+    def settings_version(self) -> int:
+        return self._settings_version
+
+    def settings_changed(self) -> None:
+        """Call after mutating a settings value in place."""
+        self._settings_version += 1
+
     @classmethod
     def validate_list(cls, val):
         if isinstance(val, str):
@@ -143,6 +161,50 @@ class RedirectPath(BaseModel):
         return False
 
 
+class ExtensionRouteMatcher:
+    """
+    Compiled form of the installed extensions settings, used for every request.
+    Redirects are indexed by their `from_path`, a request path is looked up once
+    for every distinct `from_path` length instead of checking all the rules.
+    """
+
+    def __init__(
+        self,
+        deactivated: set[str],
+        upgraded: dict[str, str],
+        redirects: list[RedirectPath],
+    ) -> None:
+        self.deactivated = frozenset(deactivated)
+        self.upgraded = dict(upgraded)
+        self._redirects: dict[str, list[tuple[int, RedirectPath]]] = {}
+        for index, redirect in enumerate(redirects):
+            self._redirects.setdefault(redirect.from_path, []).append((index, redirect))
+        self._segment_counts = sorted(
+            {len(from_path.split("/")) for from_path in self._redirects}
+        )
+
+    def find_redirect(
+        self, path: str, req_headers: list[tuple[bytes, bytes]]
+    ) -> RedirectPath | None:
+        if not self._redirects:
+            return None
+        segments = path.split("/")
+        candidates: list[tuple[int, RedirectPath]] = []
+        for count in self._segment_counts:
+            # same as `RedirectPath._has_common_path`
+            rules = self._redirects.get("/".join(segments[:count]))
+            if rules:
+                candidates += rules
+        if not candidates:
+            return None
+        # the first matching rule wins, as in `lnbits_extensions_redirects`
+        headers = [(k.decode(), v.decode()) for k, v in req_headers]
+        return next(
+            (r for _, r in sorted(candidates) if r.redirect_matches(path, headers)),
+            None,
+        )
+
+
 class ExchangeRateProvider(BaseModel):
     name: str
     api_url: str
@@ -174,18 +236,29 @@ class InstalledExtensionsSettings(LNbitsSettings):
     # list of all extension ids
     lnbits_installed_extensions_ids: set[str] = Field(default=set())
 
+    _extension_route_matcher: ExtensionRouteMatcher | None = PrivateAttr(None)
+
+    def extension_route_matcher(self) -> ExtensionRouteMatcher:
+        """Rebuilt only after extensions are activated, deactivated or upgraded."""
+        if self._extension_route_matcher is None:
+            self._extension_route_matcher = ExtensionRouteMatcher(
+                self.lnbits_deactivated_extensions,
+                self.lnbits_upgraded_extensions,
+                self.lnbits_extensions_redirects,
+            )
+        return self._extension_route_matcher
+
+    def extension_routes_changed(self) -> None:
+        self._extension_route_matcher = None
+
     def find_extension_redirect(
         self, path: str, req_headers: list[tuple[bytes, bytes]]
     ) -> RedirectPath | None:
-        headers = [(k.decode(), v.decode()) for k, v in req_headers]
-        return next(
-            (
-                r
-                for r in self.lnbits_extensions_redirects
-                if r.redirect_matches(path, headers)
-            ),
-            None,
-        )
+        return self.extension_route_matcher().find_redirect(path, req_headers)
+
+    def deactivate_extensions(self, ext_ids: list[str]) -> None:
+        self.extension_routes_changed()
+        self.lnbits_deactivated_extensions.update(ext_ids)
 
     def activate_extension_paths(
         self,
@@ -193,6 +266,7 @@ class InstalledExtensionsSettings(LNbitsSettings):
         upgrade_hash: str | None = None,
         ext_redirects: list[dict] | None = None,
     ):
+        self.extension_routes_changed()
         self.lnbits_deactivated_extensions.discard(ext_id)
 
         """
@@ -206,8 +280,10 @@ class InstalledExtensionsSettings(LNbitsSettings):
             self._activate_extension_redirects(ext_id, ext_redirects)
 
         self.lnbits_installed_extensions_ids.add(ext_id)
+        self.settings_changed()
 
     def deactivate_extension_paths(self, ext_id: str):
+        self.extension_routes_changed()
         self.lnbits_deactivated_extensions.add(ext_id)
         self._remove_extension_redirects(ext_id)
 
@@ -861,6 +937,8 @@ class AuditSettings(LNbitsSettings):
     lnbits_audit_log_path_params: bool = Field(default=True)
     lnbits_audit_log_query_params: bool = Field(default=True)
     lnbits_audit_log_request_body: bool = Field(default=False)
+    # bytes of the request body to record, longer bodies are truncated
+    lnbits_audit_max_body_size: int = Field(default=4096, ge=0)
 
     # List of paths to be included (regex match). Empty list means all.
     lnbits_audit_include_paths: list[str] = Field(default=[".*api/v1/.*"])
@@ -907,8 +985,10 @@ class AuditSettings(LNbitsSettings):
 
     def _is_http_request_path_auditable(self, path: str | None):
         if len(self.lnbits_audit_exclude_paths) != 0 and path:
-            for exclude_path in self.lnbits_audit_exclude_paths:
-                if _re_fullmatch_safe(exclude_path, path):
+            for exclude_path in _compile_patterns(
+                tuple(self.lnbits_audit_exclude_paths)
+            ):
+                if exclude_path.fullmatch(path):
                     return False
 
         if len(self.lnbits_audit_include_paths) == 0:
@@ -916,8 +996,8 @@ class AuditSettings(LNbitsSettings):
 
         if not path:
             return False
-        for include_path in self.lnbits_audit_include_paths:
-            if _re_fullmatch_safe(include_path, path):
+        for include_path in _compile_patterns(tuple(self.lnbits_audit_include_paths)):
+            if include_path.fullmatch(path):
                 return True
 
         return False
@@ -930,8 +1010,10 @@ class AuditSettings(LNbitsSettings):
         if len(self.lnbits_audit_http_response_codes) == 0:
             return True
 
-        for response_code in self.lnbits_audit_http_response_codes:
-            if _re_fullmatch_safe(response_code, http_response_code):
+        for response_code in _compile_patterns(
+            tuple(self.lnbits_audit_http_response_codes)
+        ):
+            if response_code.fullmatch(http_response_code):
                 return True
 
         return False
@@ -1011,6 +1093,75 @@ class EnvSettings(LNbitsSettings):
     cleanup_wallets_days: int = Field(default=90, ge=0)
     funding_source_max_retries: int = Field(default=4, ge=0)
 
+    # paid invoices are dispatched in batches of up to this size,
+    # waiting at most `invoice_dispatch_batch_wait` seconds to fill a batch
+    invoice_dispatch_batch_size: int = Field(default=100, ge=1)
+    invoice_dispatch_batch_wait: float = Field(default=0.05, ge=0)
+    # payments queued for a single invoice listener before new ones are dropped
+    invoice_listener_max_queue: int = Field(default=10000, ge=1)
+
+    # websockets: messages queued per connection before new ones are dropped,
+    # seconds a client may take to receive one before it is disconnected,
+    # seconds without any traffic before it is disconnected (0 disables both)
+    websocket_send_queue_size: int = Field(default=100, ge=1)
+    websocket_send_timeout: float = Field(default=10, ge=0)
+    websocket_idle_timeout: float = Field(default=0, ge=0)
+    # protocol level pings to detect dead clients, see uvicorn `ws_ping_*`
+    websocket_ping_interval: float = Field(default=20, ge=0)
+    websocket_ping_timeout: float = Field(default=20, ge=0)
+
+    # payment notifications: connections of the shared http client for
+    # webhooks and chat messages, threads sending web push notifications
+    notification_http_max_connections: int = Field(default=100, ge=1)
+    notification_webpush_workers: int = Field(default=4, ge=1)
+    # webhooks are delivered from a persisted outbox: concurrent requests per
+    # destination host, attempts before a delivery is marked failed, the first
+    # retry delay (doubled on every attempt up to the max), seconds per request,
+    # due deliveries loaded at once and days sent deliveries are kept
+    webhook_max_concurrency_per_host: int = Field(default=4, ge=1)
+    webhook_max_attempts: int = Field(default=10, ge=1)
+    webhook_retry_base_seconds: float = Field(default=30, ge=0)
+    webhook_retry_max_seconds: float = Field(default=3600, ge=0)
+    webhook_timeout: float = Field(default=40, gt=0)
+    webhook_outbox_batch_size: int = Field(default=100, ge=1)
+    webhook_outbox_retention_days: int = Field(default=7, ge=0)
+
+    # workers checking pending payments (on startup and every 30 minutes)
+    pending_check_concurrency: int = Field(default=10, ge=1)
+    # status requests per second to the funding source, 0 means no limit
+    pending_check_rate_limit: float = Field(default=20, ge=0)
+    # clients polling a pending payment share one status check with the
+    # funding source per payment and this many seconds
+    payment_poll_interval: float = Field(default=1, ge=0)
+    # longest `?wait=` of a long-polling payment status request
+    payment_poll_max_wait: int = Field(default=60, ge=0)
+
+    # audit entries waiting to be written, new ones are dropped when it is full.
+    # Entries are inserted in batches of up to this size, waiting this many
+    # seconds for a batch to fill up.
+    lnbits_audit_queue_size: int = Field(default=10000, ge=1)
+    lnbits_audit_batch_size: int = Field(default=100, ge=1)
+    lnbits_audit_batch_seconds: float = Field(default=1, ge=0)
+
+    # in-memory cache bounds, least recently used entries are evicted first
+    # (0 means unbounded)
+    lnbits_cache_max_entries: int = Field(default=10000, ge=0)
+    lnbits_cache_max_bytes: int = Field(default=0, ge=0)
+    # seconds to cache wallet and user lookups, 0 disables it.
+    # Changes are invalidated within this process only.
+    lnbits_crud_cache_seconds: float = Field(default=0, ge=0)
+    # shared cache for all workers, e.g. redis://localhost:6379/0
+    lnbits_cache_url: str = Field(default="")
+
+    # singleton background tasks (funding source listener, pending payment checks,
+    # exchange rates...) run in one worker only, the lease is renewed every
+    # third of this time and taken over by another worker when it expires.
+    # Only on Postgres the other workers are notified of settled payments.
+    lnbits_task_lease_seconds: int = Field(default=15, ge=3)
+    # how often the workers check for admin settings changed by another worker,
+    # on Postgres they are notified right away and only check as a fallback
+    lnbits_settings_poll_seconds: float = Field(default=1, gt=0)
+
     @property
     def has_default_extension_path(self) -> bool:
         return self.lnbits_extensions_path == "lnbits"
@@ -1034,6 +1185,22 @@ class PersistenceSettings(LNbitsSettings):
     lnbits_data_folder: str = Field(default="./data")
     lnbits_database_url: str | None = Field(default=None)
 
+    # "lock": every connection is serialized by a per-database lock (legacy).
+    # "pool": connections are drawn from a pool without a global lock.
+    #   SQLite runs in WAL mode with a single writer and concurrent readers.
+    lnbits_database_concurrency: str = Field(default="lock")
+    lnbits_database_pool_size: int = Field(default=10, ge=1)
+    lnbits_database_pool_max_overflow: int = Field(default=10, ge=0)
+    # seconds to wait for a free connection before giving up
+    lnbits_database_pool_timeout: float = Field(default=30, gt=0)
+
+    @validator("lnbits_database_concurrency")
+    @classmethod
+    def validate_database_concurrency(cls, val):
+        if val not in {"lock", "pool"}:
+            raise ValueError("Database concurrency must be 'lock' or 'pool'.")
+        return val
+
 
 class SuperUserSettings(LNbitsSettings):
     lnbits_allowed_funding_sources: list[str] = Field(
@@ -1299,12 +1466,16 @@ class SettingsField(BaseModel):
     tag: str = "core"
 
 
-def _re_fullmatch_safe(pattern: str, string: str):
-    try:
-        return re.fullmatch(pattern, string) is not None
-    except Exception as _:
-        logger.warning(f"Regex error for pattern {pattern}")
-        return False
+@lru_cache(maxsize=32)
+def _compile_patterns(patterns: tuple[str, ...]) -> tuple[re.Pattern, ...]:
+    """Compiled once per list of patterns, invalid ones are skipped."""
+    compiled = []
+    for pattern in patterns:
+        try:
+            compiled.append(re.compile(pattern))
+        except re.error:
+            logger.warning(f"Regex error for pattern {pattern}")
+    return tuple(compiled)
 
 
 def set_cli_settings(**kwargs):
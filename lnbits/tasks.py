@@ -1,18 +1,31 @@
 import asyncio
+import hashlib
+import json
+import os
+import socket
+import time
 import traceback
 import uuid
 from collections.abc import Callable, Coroutine
+from typing import Any
 
 from loguru import logger
+from pydantic import BaseModel
 
 from lnbits.core.crud import (
-    get_standalone_payment,
-    update_payment,
+    get_standalone_payments,
+    get_wallet,
+    settle_incoming_payments,
 )
-from lnbits.core.models import Payment, PaymentState
+from lnbits.core.crud.settings import get_settings_field, set_settings_field
+from lnbits.core.crud.tasks import acquire_task_lease, release_task_leases
+from lnbits.core.db import db as core_db
+from lnbits.core.models import Payment, PaymentState, SingletonTasksStats
 from lnbits.core.services.fiat_providers import handle_fiat_payment_confirmation
+from lnbits.db import POSTGRES, Connection
 from lnbits.settings import settings
 from lnbits.wallets import get_funding_source
+from lnbits.wallets.base import Wallet
 
 tasks: list[asyncio.Task] = []
 unique_tasks: dict[str, asyncio.Task] = {}
@@ -75,7 +88,192 @@ async def catch_everything_and_restart(
         return await catch_everything_and_restart(func, name)
 
 
+class _RowLease:
+    """Lease rows in `task_leases`, taken over by another worker once expired."""
+
+    kind = "row"
+    # still held until it expires, even if renewing it failed
+    expires = True
+
+    def __init__(self, owner: str) -> None:
+        self.owner = owner
+
+    async def acquire(self, name: str) -> bool:
+        return await acquire_task_lease(
+            name, self.owner, settings.lnbits_task_lease_seconds
+        )
+
+    async def release(self) -> None:
+        await release_task_leases(self.owner)
+
+
+class _AdvisoryLease:
+    """
+    Postgres advisory locks, held by a dedicated connection of the worker.
+    The database releases them as soon as that connection is gone.
+    """
+
+    kind = "advisory"
+    # all locks are gone together with the connection
+    expires = False
+
+    def __init__(self) -> None:
+        self._conn: Connection | None = None
+        self._locked: set[str] = set()
+
+    async def acquire(self, name: str) -> bool:
+        try:
+            conn = await self._connection()
+            if name in self._locked:
+                # the locks are only held while the connection is alive
+                await conn.fetchone("SELECT 1")
+                return True
+            row: dict = await conn.fetchone(
+                "SELECT pg_try_advisory_lock(:key) AS locked", {"key": _lock_key(name)}
+            )
+        except Exception:
+            await self.release()
+            raise
+        if row["locked"]:
+            self._locked.add(name)
+        return row["locked"]
+
+    async def release(self) -> None:
+        self._locked.clear()
+        if self._conn:
+            conn, self._conn = self._conn, None
+            try:
+                await conn.conn.close()
+            except Exception as exc:
+                logger.debug(f"closing the task lease connection failed: {exc}")
+
+    async def _connection(self) -> Connection:
+        if not self._conn:
+            # not from `db.connect()`, it would hold the connection lock
+            raw_conn = await core_db.engine.connect().start()
+            await raw_conn.execution_options(isolation_level="AUTOCOMMIT")
+            self._conn = Connection(raw_conn, core_db.type, core_db.name, None)
+        return self._conn
+
+
+def _lock_key(name: str) -> int:
+    digest = hashlib.sha256(f"lnbits_task:{name}".encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+class SingletonTasks:
+    """
+    Runs every registered task in only one of the worker processes that share the
+    database. Each worker tries to take or renew a lease per task every third of
+    `lnbits_task_lease_seconds`, and runs the tasks whose lease it holds.
+    """
+
+    def __init__(self) -> None:
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._funcs: dict[str, Callable[[], Coroutine]] = {}
+        self._running: dict[str, asyncio.Task] = {}
+        self._renewed: dict[str, float] = {}
+        self._lease: _RowLease | _AdvisoryLease | None = None
+        self._stats = SingletonTasksStats(owner=self.owner, lease="")
+
+    def register(self, name: str, func: Callable[[], Coroutine]) -> None:
+        self._funcs[name] = func
+
+    async def run(self) -> None:
+        while settings.lnbits_running:
+            await self.elect()
+            await asyncio.sleep(settings.lnbits_task_lease_seconds / 3)
+
+    async def elect(self) -> None:
+        """Start the tasks this worker leads now, stop the ones it lost."""
+        lease = self._get_lease()
+        self._stats.elections += 1
+        for name, func in self._funcs.items():
+            try:
+                leader = await lease.acquire(name)
+            except Exception as exc:
+                logger.warning(f"renewing the lease of task `{name}` failed: {exc}")
+                if not lease.expires:
+                    # another worker can take over all of them right away
+                    for running in list(self._running):
+                        self._stop(running)
+                    continue
+                # keep running until the lease would have expired
+                renewed = self._renewed.get(name, 0)
+                leader = time.monotonic() - renewed < settings.lnbits_task_lease_seconds
+            else:
+                if leader:
+                    self._renewed[name] = time.monotonic()
+
+            if leader and name not in self._running:
+                logger.info(f"leading task `{name}` ({self.owner})")
+                self._stats.acquired += 1
+                self._running[name] = create_task(
+                    catch_everything_and_restart(func, name)
+                )
+            elif not leader and name in self._running:
+                self._stop(name)
+
+    async def release(self) -> None:
+        """Stop the tasks and free the leases, other workers take over right away."""
+        for task in self._running.values():
+            task.cancel()
+        self._running.clear()
+        self._renewed.clear()
+        if self._lease:
+            try:
+                await self._lease.release()
+            except Exception as exc:
+                logger.warning(f"releasing the task leases failed: {exc}")
+
+    def stats(self) -> SingletonTasksStats:
+        self._stats.tasks = list(self._funcs.keys())
+        self._stats.leading = list(self._running.keys())
+        return self._stats.copy()
+
+    def _stop(self, name: str) -> None:
+        logger.warning(f"lease of task `{name}` lost, stopping it")
+        self._stats.lost += 1
+        self._running.pop(name).cancel()
+        self._renewed.pop(name, None)
+
+    def _get_lease(self) -> _RowLease | _AdvisoryLease:
+        if not self._lease:
+            if core_db.type == POSTGRES:
+                self._lease = _AdvisoryLease()
+            else:
+                # SQLite, and CockroachDB has no advisory locks
+                self._lease = _RowLease(self.owner)
+            self._stats.lease = self._lease.kind
+        return self._lease
+
+
+singleton_tasks = SingletonTasks()
+
+
+def create_singleton_task(name: str, func: Callable[[], Coroutine]) -> None:
+    """Like `create_permanent_task`, but runs in one worker process only."""
+    singleton_tasks.register(name, func)
+
+
+class InvoiceListenerStats(BaseModel):
+    name: str
+    queued: int = 0
+    peak_queued: int = 0
+    delivered: int = 0
+    dropped: int = 0
+
+
+class InvoiceDispatchStats(BaseModel):
+    batches: int = 0
+    payments: int = 0
+    largest_batch: int = 0
+    listeners: list[InvoiceListenerStats] = []
+
+
 invoice_listeners: dict[str, asyncio.Queue] = {}
+invoice_listener_stats: dict[str, InvoiceListenerStats] = {}
+invoice_dispatch_stats = InvoiceDispatchStats()
 
 
 # TODO: name should not be optional
@@ -94,9 +292,23 @@ def register_invoice_listener(send_chan: asyncio.Queue, name: str | None = None)
 
     logger.trace(f"registering invoice listener `{name}`")
     invoice_listeners[name] = send_chan
+    invoice_listener_stats.setdefault(name, InvoiceListenerStats(name=name))
+
+
+def get_invoice_dispatch_stats() -> InvoiceDispatchStats:
+    for name, send_chan in invoice_listeners.items():
+        stats = invoice_listener_stats.setdefault(name, InvoiceListenerStats(name=name))
+        stats.queued = send_chan.qsize()
+    invoice_dispatch_stats.listeners = list(invoice_listener_stats.values())
+    return invoice_dispatch_stats
 
 
 internal_invoice_queue: asyncio.Queue = asyncio.Queue(0)
+paid_invoice_queue: asyncio.Queue = asyncio.Queue(0)
+# funding source stream cursor of the queued, not yet settled, paid invoices
+invoice_stream_cursors: dict[str, str] = {}
+# long-polling requests waiting for an incoming payment, by payment_hash
+payment_waiters: dict[str, set[asyncio.Future]] = {}
 
 
 async def internal_invoice_queue_put(checking_id: str) -> None:
@@ -114,9 +326,9 @@ async def internal_invoice_listener() -> None:
     Called by the app startup sequence.
     """
     while settings.lnbits_running:
-        checking_id = await internal_invoice_queue.get()
-        logger.info(f"got an internal payment notification {checking_id}")
-        await invoice_callback_dispatcher(checking_id, is_internal=True)
+        checking_ids = await _next_invoice_batch(internal_invoice_queue)
+        logger.info(f"got internal payment notifications {', '.join(checking_ids)}")
+        await invoice_callback_batch_dispatcher(checking_ids, is_internal=True)
 
 
 async def invoice_listener() -> None:
@@ -129,7 +341,80 @@ async def invoice_listener() -> None:
     funding_source = get_funding_source()
     async for checking_id in funding_source.paid_invoices_stream():
         logger.info(f"got a payment notification {checking_id}")
-        await invoice_callback_dispatcher(checking_id)
+        stream_cursor = funding_source.invoice_stream_cursor()
+        if stream_cursor:
+            invoice_stream_cursors[checking_id] = stream_cursor
+        # settled by `paid_invoice_dispatcher`, so a slow batch
+        # does not hold up reading the stream
+        paid_invoice_queue.put_nowait(checking_id)
+
+
+async def paid_invoice_dispatcher() -> None:
+    """
+    Settles and dispatches the invoices collected by `invoice_listener` in batches.
+
+    Called by the app startup sequence.
+    """
+    while settings.lnbits_running:
+        checking_ids = await _next_invoice_batch(paid_invoice_queue)
+        await invoice_callback_batch_dispatcher(checking_ids)
+        await _save_invoice_stream_cursor(checking_ids)
+
+
+async def restore_invoice_stream_cursor(funding_source: Wallet) -> None:
+    """
+    Resume the invoice stream from the persisted cursor. Called by the app
+    startup sequence before the funding source starts up.
+    """
+    if not funding_source.resumable_invoice_stream:
+        return
+    cursor = await get_settings_field(
+        funding_source.__class__.__name__, tag="invoice_stream"
+    )
+    if cursor and cursor.value:
+        logger.info(f"Resuming the invoice stream after '{cursor.value}'.")
+        funding_source.resume_invoice_stream(cursor.value)
+
+
+async def _save_invoice_stream_cursor(checking_ids: list[str]) -> None:
+    """
+    Persist the stream cursor once the invoices up to it are settled,
+    so that `invoice_listener` replays the rest after a restart.
+    """
+    cursors = [
+        invoice_stream_cursors.pop(checking_id)
+        for checking_id in checking_ids
+        if checking_id in invoice_stream_cursors
+    ]
+    if not cursors:
+        return
+    funding_source = get_funding_source()
+    await set_settings_field(
+        funding_source.__class__.__name__, cursors[-1], tag="invoice_stream"
+    )
+
+
+async def _next_invoice_batch(queue: asyncio.Queue) -> list[str]:
+    """
+    Wait for the next checking_id and collect more until the batch is full
+    or `invoice_dispatch_batch_wait` seconds have passed.
+    """
+    batch = [await queue.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.invoice_dispatch_batch_wait
+    while len(batch) < settings.invoice_dispatch_batch_size:
+        if queue.empty():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        else:
+            batch.append(queue.get_nowait())
+    # the same invoice can be reported more than once
+    return list(dict.fromkeys(batch))
 
 
 def wait_for_paid_invoices(
@@ -170,28 +455,221 @@ async def invoice_callback_dispatcher(checking_id: str, is_internal: bool = Fals
     Takes an incoming payment, checks its status, and dispatches it to
     invoice_listeners from core and extensions.
     """
-    payment = await get_standalone_payment(checking_id, incoming=True)
-    if not payment:
-        logger.warning(f"No payment found for '{checking_id}'.")
-        return
-    if not payment.is_in:
-        logger.warning(f"Payment '{checking_id}' is not incoming, skipping.")
+    await invoice_callback_batch_dispatcher([checking_id], is_internal)
+
+
+async def invoice_callback_batch_dispatcher(
+    checking_ids: list[str], is_internal: bool = False
+):
+    """
+    Takes a batch of incoming payments, checks their status, settles them
+    in one statement and dispatches them to the invoice_listeners.
+    """
+    payments: dict[str, Payment] = {}
+    for payment in await get_standalone_payments(checking_ids, incoming=True):
+        payments.setdefault(payment.checking_id, payment)
+    found = {key for p in payments.values() for key in (p.checking_id, p.payment_hash)}
+    for checking_id in checking_ids:
+        if checking_id not in found:
+            logger.warning(f"No payment found for '{checking_id}'.")
+    if not payments:
         return
 
     from lnbits.core.services.payments import check_payment_status
 
-    status = await check_payment_status(
-        payment, skip_internal_payment_notifications=True
+    statuses = await asyncio.gather(
+        *[
+            check_payment_status(payment, skip_internal_payment_notifications=True)
+            for payment in payments.values()
+        ],
+        return_exceptions=True,
     )
-    payment.fee = status.fee_msat or payment.fee
-    # only overwrite preimage if status.preimage provides it
-    payment.preimage = status.preimage or payment.preimage
-    payment.status = PaymentState.SUCCESS
-    await update_payment(payment)
-    if payment.fiat_provider:
-        await handle_fiat_payment_confirmation(payment)
+    for payment, status in zip(payments.values(), statuses, strict=True):
+        if isinstance(status, BaseException):
+            # the funding source reported it as paid, settle it anyway
+            logger.warning(f"Could not check status of '{payment.checking_id}'.")
+        else:
+            payment.fee = status.fee_msat or payment.fee
+            # only overwrite preimage if status.preimage provides it
+            payment.preimage = status.preimage or payment.preimage
+        payment.status = PaymentState.SUCCESS
+    await settle_incoming_payments(list(payments.values()))
+
+    invoice_dispatch_stats.batches += 1
+    invoice_dispatch_stats.payments += len(payments)
+    invoice_dispatch_stats.largest_batch = max(
+        invoice_dispatch_stats.largest_batch, len(payments)
+    )
+
     internal = "internal" if is_internal else ""
-    logger.success(f"{internal} invoice {checking_id} settled")
-    for name, send_chan in invoice_listeners.items():
+    for payment in payments.values():
+        if payment.fiat_provider:
+            await handle_fiat_payment_confirmation(payment)
+        logger.success(f"{internal} invoice {payment.checking_id} settled")
+        _wake_payment_waiters(payment)
+        _send_to_invoice_listeners(payment)
+    await settled_payments_relay.publish(list(payments.values()))
+
+
+class SettledPaymentsRelayStats(BaseModel):
+    # `notify` on Postgres, `off` otherwise
+    mode: str = "off"
+    published: int = 0
+    relayed: int = 0
+
+
+SETTLED_PAYMENTS_CHANNEL = "lnbits_settled_payments"
+# payment hashes per notification, the payload is limited to 8000 bytes
+SETTLED_PAYMENTS_PER_NOTIFY = 50
+
+
+class SettledPaymentsRelay:
+    """
+    Incoming payments are settled and dispatched to the invoice listeners in
+    one worker only, e.g. the leader of `invoice_listener`. On Postgres that
+    worker notifies the others on `SETTLED_PAYMENTS_CHANNEL`, so that they wake
+    their long-polling requests and send the websocket notifications of their
+    clients. Other databases have no notifications, long-polling requests to
+    other workers then only see the payment when they time out.
+    """
+
+    def __init__(self) -> None:
+        self.origin = uuid.uuid4().hex
+        self._listener: Any = None
+        self._tasks: set[asyncio.Task] = set()
+        self._stats = SettledPaymentsRelayStats()
+
+    async def run(self) -> None:
+        while settings.lnbits_running and core_db.type == POSTGRES:
+            try:
+                if not self._listener:
+                    await self._listen()
+                await asyncio.sleep(30)
+                # notifications stop without an error when the connection is gone
+                await self._listener.exec_driver_sql("SELECT 1")
+            except Exception as exc:
+                logger.warning(f"Settled payments listener failed: {exc}")
+                await self.close()
+                await asyncio.sleep(5)
+
+    async def publish(self, payments: list[Payment]) -> None:
+        if core_db.type != POSTGRES:
+            return
+        hashes = [payment.payment_hash for payment in payments]
+        try:
+            for i in range(0, len(hashes), SETTLED_PAYMENTS_PER_NOTIFY):
+                payload = {
+                    "origin": self.origin,
+                    "payment_hashes": hashes[i : i + SETTLED_PAYMENTS_PER_NOTIFY],
+                }
+                await core_db.execute(
+                    "SELECT pg_notify(:channel, :payload)",
+                    {
+                        "channel": SETTLED_PAYMENTS_CHANNEL,
+                        "payload": json.dumps(payload),
+                    },
+                )
+        except Exception as exc:
+            logger.warning(f"Could not notify the workers of settled payments: {exc}")
+            return
+        self._stats.published += len(hashes)
+
+    async def relay(self, payment_hashes: list[str]) -> None:
+        """Notify the clients of this worker of payments settled by another one."""
+        from lnbits.core.services.notifications import send_payment_ws_notifications
+
+        for payment in await get_standalone_payments(payment_hashes, incoming=True):
+            if not payment.success:
+                continue
+            self._stats.relayed += 1
+            _wake_payment_waiters(payment)
+            wallet = await get_wallet(payment.wallet_id)
+            if wallet:
+                await send_payment_ws_notifications(wallet, payment)
+
+    async def close(self) -> None:
+        if self._listener:
+            conn, self._listener = self._listener, None
+            self._stats.mode = "off"
+            try:
+                await conn.close()
+            except Exception as exc:
+                logger.debug(f"closing the settled payments listener failed: {exc}")
+
+    def stats(self) -> SettledPaymentsRelayStats:
+        return self._stats.copy()
+
+    async def _listen(self) -> None:
+        # not from `db.connect()`, it would hold the connection lock
+        conn = await core_db.engine.connect().start()
+        try:
+            raw_conn = await conn.get_raw_connection()
+            await raw_conn.driver_connection.add_listener(
+                SETTLED_PAYMENTS_CHANNEL, self._notified
+            )
+        except Exception:
+            await conn.close()
+            raise
+        self._listener = conn
+        self._stats.mode = "notify"
+
+    def _notified(self, _conn, _pid, _channel, payload: str) -> None:
+        data = json.loads(payload)
+        if data.get("origin") == self.origin:
+            return
+        task = asyncio.create_task(self.relay(data.get("payment_hashes", [])))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+settled_payments_relay = SettledPaymentsRelay()
+
+
+def register_payment_waiter(payment_hash: str) -> asyncio.Future:
+    """
+    Future resolved with the payment once `invoice_callback_batch_dispatcher`
+    settles it. Register it before checking the payment status, so that a
+    settlement in between is not missed, and unregister it when done.
+    """
+    waiter = asyncio.get_running_loop().create_future()
+    payment_waiters.setdefault(payment_hash, set()).add(waiter)
+    return waiter
+
+
+def unregister_payment_waiter(payment_hash: str, waiter: asyncio.Future) -> None:
+    waiters = payment_waiters.get(payment_hash)
+    if waiters is None:
+        return
+    waiters.discard(waiter)
+    if not waiters:
+        del payment_waiters[payment_hash]
+
+
+def _wake_payment_waiters(payment: Payment) -> None:
+    for waiter in payment_waiters.pop(payment.payment_hash, ()):
+        if not waiter.done():
+            waiter.set_result(payment)
+
+
+def _send_to_invoice_listeners(payment: Payment) -> None:
+    """
+    Never waits for a listener, so one slow listener can not stall the others.
+    Payments for a listener that has too many queued payments are dropped.
+    """
+    for name, send_chan in list(invoice_listeners.items()):
+        stats = invoice_listener_stats.setdefault(name, InvoiceListenerStats(name=name))
         logger.trace(f"invoice listeners: sending to `{name}`")
-        await send_chan.put(payment)
+        try:
+            if send_chan.qsize() >= settings.invoice_listener_max_queue:
+                raise asyncio.QueueFull()
+            send_chan.put_nowait(payment)
+        except asyncio.QueueFull:
+            stats.dropped += 1
+            logger.error(
+                f"invoice listener `{name}` is full, "
+                f"dropping payment {payment.checking_id}"
+            )
+            continue
+        stats.delivered += 1
+        stats.queued = send_chan.qsize()
+        stats.peak_queued = max(stats.peak_queued, stats.queued)
@@ -1,63 +1,247 @@
 from __future__ import annotations
 
 import asyncio
+import hmac
+import inspect
+import json
+import pickle
+import sys
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from functools import wraps
+from hashlib import sha256
 from time import time
 from typing import Any, NamedTuple
+from uuid import uuid4
 
 from loguru import logger
+from pydantic import BaseModel
 
 from lnbits.settings import settings
+from lnbits.utils.cache_backend import CacheBackend, MemoryCacheBackend
 
 
 class Cached(NamedTuple):
     value: Any
     expiry: float
+    size: int = 0
+    tags: tuple[str, ...] = ()
 
     def older_than(self, seconds: float) -> bool:
         return time() - self.expiry > seconds
 
 
+class CacheStats(BaseModel):
+    entries: int = 0
+    size_bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    # concurrent misses that waited for the same `save_result` call
+    coalesced: int = 0
+
+
 class Cache:
     """
     Small caching utility providing simple get/set interface (very much like redis)
+    Bounded by `max_entries` and `max_bytes` (0 means unbounded), the least
+    recently used entries are evicted first.
+    With a shared `backend` the async methods (`aget`, `aset`, `save_result`,
+    `memoize`) also read and write the backend, and invalidations (`pop`,
+    `invalidate_tag`) are broadcast to the other workers. Until the backend
+    confirmed the deletion, invalidated entries are not read back from it,
+    `apop` and `ainvalidate_tag` wait for that confirmation.
     """
 
-    def __init__(self, interval: float = 10) -> None:
+    def __init__(
+        self, interval: float = 10, max_entries: int = 0, max_bytes: int = 0
+    ) -> None:
         self.interval = interval
-        self._values: dict[Any, Cached] = {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._values: OrderedDict[Any, Cached] = OrderedDict()
+        self._tags: dict[str, set[Any]] = {}
+        self._inflight: dict[Any, asyncio.Future] = {}
+        self._size = 0
+        self._stats = CacheStats()
+        self.backend: CacheBackend = MemoryCacheBackend()
+        # seconds to wait for the shared backend before using the local cache only
+        self.backend_timeout = 1.0
+        # seconds to ignore shared entries whose deletion could not be confirmed
+        self.tombstone_expiry = 3600.0
+        self._tombstones: dict[str, float] = {}
+        self._origin = uuid4().hex
+        self._background: set[asyncio.Task] = set()
 
     def value(self, key: str) -> Cached | None:
         return self._values.get(key)
 
     def get(self, key: str, default=None) -> Any | None:
-        cached = self._values.get(key)
+        cached = self._lookup(key)
         if cached is not None:
-            if cached.expiry > time():
-                return cached.value
-            else:
-                self._values.pop(key)
+            return cached.value
         return default
 
-    def set(self, key: str, value: Any, expiry: float = 10):
-        self._values[key] = Cached(value, time() + expiry)
+    def set(self, key: str, value: Any, expiry: float = 10, tags: Iterable[str] = ()):
+        self._remove(key)
+        size = _approx_size(value) if self.max_bytes else 0
+        cached = Cached(value, time() + expiry, size, tuple(tags))
+        self._values[key] = cached
+        self._size += size
+        for tag in cached.tags:
+            self._tags.setdefault(tag, set()).add(key)
+        self._evict()
 
     def pop(self, key: str, default=None) -> Any | None:
-        cached = self._values.pop(key, None)
+        cached = self._remove(key)
+        self._broadcast(keys=[key])
+        if cached and cached.expiry > time():
+            return cached.value
+        return default
+
+    def invalidate_tag(self, tag: str) -> None:
+        """Remove all entries that were set with `tag`."""
+        self._remove_tag(tag)
+        self._broadcast(tags=[tag])
+
+    async def apop(self, key: str, default=None) -> Any | None:
+        """Like `pop`, but waits until the shared backend dropped the entry."""
+        cached = self._remove(key)
+        await self._invalidate_shared(keys=[key], tags=[])
         if cached and cached.expiry > time():
             return cached.value
         return default
 
-    async def save_result(self, coro, key: str, expiry: float = 10):
+    async def ainvalidate_tag(self, tag: str) -> None:
+        """Like `invalidate_tag`, but waits until the shared backend dropped it."""
+        self._remove_tag(tag)
+        await self._invalidate_shared(keys=[], tags=[tag])
+
+    async def aget(self, key: str, default=None) -> Any | None:
+        """Like `get`, but falls back to the shared backend."""
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached.value
+        found, value = await self._shared_get(key)
+        return value if found else default
+
+    async def aset(
+        self, key: str, value: Any, expiry: float = 10, tags: Iterable[str] = ()
+    ) -> None:
+        """Like `set`, but also stores the value in the shared backend."""
+        tags = tuple(tags)
+        self.set(key, value, expiry=expiry, tags=tags)
+        await self._shared_set(key, value, expiry, tags)
+
+    async def listen_invalidations(self) -> None:
+        """Drop local entries that were invalidated by other workers."""
+        while settings.lnbits_running:
+            try:
+                async for message in self.backend.listen():
+                    self._apply_invalidation(message)
+            except Exception as exc:
+                logger.warning(f"Cache invalidation listener failed: {exc}")
+                await asyncio.sleep(5)
+
+    def stats(self) -> CacheStats:
+        self._stats.entries = len(self._values)
+        self._stats.size_bytes = self._size
+        return self._stats.copy()
+
+    async def save_result(
+        self,
+        coro,
+        key: str,
+        expiry: float = 10,
+        negative_expiry: float | None = None,
+        tags: Callable[[Any], Iterable[str]] | None = None,
+    ):
         """
-        If `key` exists, return its value, otherwise call coro and cache its result
+        If `key` exists, return its value, otherwise call coro and cache its result.
+        Concurrent calls for the same missing key share one call of `coro`.
+        A `None` result is only cached if `negative_expiry` is set.
         """
-        cached = self.get(key)
-        if cached:
-            return cached
-        else:
-            value = await coro()
-            self.set(key, value, expiry=expiry)
-            return value
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached.value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._stats.coalesced += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # the call we were waiting for was cancelled, try on our own
+                return await self.save_result(coro, key, expiry, negative_expiry, tags)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(coro, key, expiry, negative_expiry, tags)
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()  # mark as retrieved if nobody is waiting
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        future.set_result(value)
+        return value
+
+    def memoize(
+        self,
+        prefix: str,
+        expiry: float | Callable[[], float] = 10,
+        negative_expiry: float | None = None,
+        tags: Callable[[Any], Iterable[str]] | None = None,
+    ):
+        """
+        Cache the results of an async function, keyed by its arguments.
+        Calls with a `conn` argument are not cached, they might run inside a
+        transaction. `expiry` can be a callable, a value of 0 disables the cache.
+        The decorated function gets an `invalidate(*args, **kwargs)` method.
+        """
+
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            def cache_key(args, kwargs) -> str | None:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                arguments = dict(bound.arguments)
+                if arguments.pop("conn", None) is not None:
+                    return None
+                return f"{prefix}:{arguments!r}"
+
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                seconds = expiry() if callable(expiry) else expiry
+                key = cache_key(args, kwargs) if seconds > 0 else None
+                if key is None:
+                    return await func(*args, **kwargs)
+                return await self.save_result(
+                    lambda: func(*args, **kwargs),
+                    key,
+                    expiry=seconds,
+                    negative_expiry=negative_expiry,
+                    tags=tags,
+                )
+
+            def invalidate(*args, **kwargs) -> None:
+                key = cache_key(args, kwargs)
+                if key:
+                    self.pop(key)
+
+            wrapper.invalidate = invalidate  # type: ignore[attr-defined]
+            return wrapper
+
+        return decorator
 
     async def invalidate_forever(self):
         while settings.lnbits_running:
@@ -66,9 +250,207 @@ class Cache:
                 ts = time()
                 expired = [k for k, v in self._values.items() if v.expiry < ts]
                 for k in expired:
-                    self._values.pop(k)
+                    self._remove(k)
+                self._stats.expirations += len(expired)
+                self._tombstones = {k: v for k, v in self._tombstones.items() if v > ts}
             except Exception:
                 logger.error("Error invalidating cache")
 
+    def _lookup(self, key: str) -> Cached | None:
+        cached = self._values.get(key)
+        if cached is not None:
+            if cached.expiry > time():
+                self._values.move_to_end(key)
+                self._stats.hits += 1
+                return cached
+            self._remove(key)
+            self._stats.expirations += 1
+        self._stats.misses += 1
+        return None
+
+    async def _load(
+        self,
+        coro,
+        key: str,
+        expiry: float,
+        negative_expiry: float | None,
+        tags: Callable[[Any], Iterable[str]] | None,
+    ):
+        found, value = await self._shared_get(key)
+        if found:
+            # already stored locally by `_shared_get`
+            return value
+        value = await coro()
+        if value is not None:
+            value_tags = tuple(tags(value)) if tags else ()
+            self.set(key, value, expiry=expiry, tags=value_tags)
+            await self._shared_set(key, value, expiry, value_tags)
+        elif negative_expiry:
+            self.set(key, None, expiry=negative_expiry)
+            await self._shared_set(key, None, negative_expiry, ())
+        return value
+
+    def _remove_tag(self, tag: str) -> None:
+        for key in self._tags.pop(tag, set()):
+            self._remove(key)
+
+    async def _shared_get(self, key: str) -> tuple[bool, Any]:
+        if not self.backend.shared or self._tombstoned(f"key:{key}"):
+            return False, None
+        try:
+            raw = await asyncio.wait_for(self.backend.get(key), self.backend_timeout)
+            entry = _loads(raw) if raw else None
+        except Exception as exc:
+            logger.debug(f"Shared cache get failed: {exc}")
+            return False, None
+        if entry is None:
+            return False, None
+        expiry, tags, value = entry
+        if expiry <= time() or any(self._tombstoned(f"tag:{t}") for t in tags):
+            return False, None
+        self.set(key, value, expiry=expiry - time(), tags=tags)
+        return True, value
+
+    async def _shared_set(
+        self, key: str, value: Any, expiry: float, tags: tuple[str, ...]
+    ) -> None:
+        if not self.backend.shared:
+            return
+        try:
+            raw = _dumps((time() + expiry, tags, value))
+            await asyncio.wait_for(
+                self._shared_store(key, raw, expiry, tags), self.backend_timeout
+            )
+        except Exception as exc:
+            logger.debug(f"Shared cache set failed: {exc}")
+
+    async def _shared_store(
+        self, key: str, raw: bytes, expiry: float, tags: tuple[str, ...]
+    ) -> None:
+        await self.backend.set(key, raw, expiry)
+        for tag in tags:
+            await self.backend.add_to_tag(tag, key, expiry)
+
+    def _broadcast(self, keys: list[str] | None = None, tags: list[str] | None = None):
+        if not self.backend.shared:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(
+                self._invalidate_shared(keys or [], tags or [])
+            )
+        except RuntimeError:
+            logger.warning("Cannot broadcast cache invalidation without event loop.")
+            return
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _invalidate_shared(self, keys: list[str], tags: list[str]) -> None:
+        if not self.backend.shared:
+            return
+        # set before the first await, `aget` must not read the old entries back
+        deadline = time() + self.tombstone_expiry
+        markers = [f"key:{key}" for key in keys] + [f"tag:{tag}" for tag in tags]
+        for marker in markers:
+            self._tombstones[marker] = deadline
+        message = json.dumps({"origin": self._origin, "keys": keys, "tags": tags})
+        try:
+            await asyncio.wait_for(
+                self.backend.delete(keys, tags), self.backend_timeout
+            )
+        except Exception as exc:
+            # the tombstones stay until `tombstone_expiry`
+            logger.warning(f"Could not delete shared cache entries: {exc}")
+            return
+        for marker in markers:
+            # unless the entry was invalidated again in the meantime
+            if self._tombstones.get(marker) == deadline:
+                self._tombstones.pop(marker)
+        try:
+            await self.backend.publish(message)
+        except Exception as exc:
+            logger.warning(f"Could not broadcast cache invalidation: {exc}")
+
+    def _tombstoned(self, marker: str) -> bool:
+        deadline = self._tombstones.get(marker)
+        if deadline is None:
+            return False
+        if deadline > time():
+            return True
+        self._tombstones.pop(marker)
+        return False
+
+    def _apply_invalidation(self, message: str) -> None:
+        try:
+            data = json.loads(message)
+        except json.JSONDecodeError:
+            return
+        if data.get("origin") == self._origin:
+            return
+        for key in data.get("keys", []):
+            self._remove(key)
+        for tag in data.get("tags", []):
+            self._remove_tag(tag)
+
+    def _remove(self, key: str) -> Cached | None:
+        cached = self._values.pop(key, None)
+        if cached is None:
+            return None
+        self._size -= cached.size
+        for tag in cached.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    self._tags.pop(tag)
+        return cached
+
+    def _evict(self) -> None:
+        while self._values and (
+            (self.max_entries and len(self._values) > self.max_entries)
+            or (self.max_bytes and self._size > self.max_bytes)
+        ):
+            oldest = next(iter(self._values))
+            self._remove(oldest)
+            self._stats.evictions += 1
+
+
+def _signing_key() -> bytes:
+    return sha256(f"lnbits-cache:{settings.auth_secret_key}".encode()).digest()
+
+
+def _dumps(entry: tuple) -> bytes:
+    data = pickle.dumps(entry)
+    return hmac.new(_signing_key(), data, sha256).digest() + data
+
+
+def _loads(raw: bytes) -> tuple | None:
+    signature, data = raw[:32], raw[32:]
+    expected = hmac.new(_signing_key(), data, sha256).digest()
+    if not hmac.compare_digest(signature, expected):
+        logger.warning("Ignoring shared cache entry with an invalid signature.")
+        return None
+    # only entries signed with our secret key are unpickled
+    return pickle.loads(data)  # noqa: S301
+
+
+def _approx_size(value: Any, depth: int = 0) -> int:
+    """Rough memory size of a value, following containers a few levels deep."""
+    size = sys.getsizeof(value)
+    if depth > 3:
+        return size
+    if isinstance(value, BaseModel):
+        return size + _approx_size(value.__dict__, depth + 1)
+    if isinstance(value, dict):
+        return size + sum(
+            _approx_size(k, depth + 1) + _approx_size(v, depth + 1)
+            for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(_approx_size(v, depth + 1) for v in value)
+    return size
+
 
-cache = Cache()
+cache = Cache(
+    max_entries=settings.lnbits_cache_max_entries,
+    max_bytes=settings.lnbits_cache_max_bytes,
+)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from urllib.parse import unquote, urlparse
+
+from loguru import logger
+
+
+class CacheBackend:
+    """
+    Shared second level for `lnbits.utils.cache.Cache`.
+    Values are opaque bytes, invalidations are broadcast as messages so that
+    every worker can drop its local copies.
+    """
+
+    shared: bool = False
+
+    async def get(self, key: str) -> bytes | None:
+        return None
+
+    async def set(self, key: str, value: bytes, expiry: float) -> None:
+        pass
+
+    async def add_to_tag(self, tag: str, key: str, expiry: float) -> None:
+        pass
+
+    async def delete(self, keys: list[str], tags: list[str]) -> None:
+        pass
+
+    async def publish(self, message: str) -> None:
+        pass
+
+    async def listen(self) -> AsyncIterator[str]:
+        # nothing is ever published to a process-local cache
+        await asyncio.Event().wait()
+        yield ""  # pragma: no cover
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local: values only live in the local cache of each worker."""
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Minimal client for the Redis protocol (RESP), enough for caching and
+    pub/sub, so no extra dependency is needed.
+    """
+
+    shared = True
+    channel = "lnbits:cache:invalidate"
+
+    def __init__(self, url: str, prefix: str = "lnbits:cache:") -> None:
+        parsed = urlparse(url)
+        if parsed.scheme not in {"redis", "rediss"}:
+            raise ValueError(f"Invalid cache url: '{url}'.")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.ssl = parsed.scheme == "rediss"
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.strip("/") or 0)
+        self.prefix = prefix
+        self._lock = asyncio.Lock()
+        self._connection: tuple[asyncio.StreamReader, asyncio.StreamWriter] | None = (
+            None
+        )
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.command("GET", self.prefix + key)
+
+    async def set(self, key: str, value: bytes, expiry: float) -> None:
+        await self.command(
+            "SET", self.prefix + key, value, "PX", max(1, int(expiry * 1000))
+        )
+
+    async def add_to_tag(self, tag: str, key: str, expiry: float) -> None:
+        tag_key = f"{self.prefix}tag:{tag}"
+        await self.command("SADD", tag_key, self.prefix + key)
+        await self.command("PEXPIRE", tag_key, max(1, int(expiry * 1000)))
+
+    async def delete(self, keys: list[str], tags: list[str]) -> None:
+        names = [self.prefix + key for key in keys]
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            names.extend(k.decode() for k in await self.command("SMEMBERS", tag_key))
+            names.append(tag_key)
+        if names:
+            await self.command("DEL", *names)
+
+    async def publish(self, message: str) -> None:
+        await self.command("PUBLISH", self.channel, message)
+
+    async def listen(self) -> AsyncIterator[str]:
+        reader, writer = await self._connect()
+        try:
+            writer.write(_encode_command("SUBSCRIBE", self.channel))
+            await writer.drain()
+            while True:
+                reply = await _read_reply(reader)
+                if isinstance(reply, list) and reply and reply[0] == b"message":
+                    yield reply[2].decode()
+        finally:
+            writer.close()
+
+    async def command(self, *args: str | bytes | int):
+        async with self._lock:
+            if not self._connection:
+                self._connection = await self._connect()
+            reader, writer = self._connection
+            try:
+                writer.write(_encode_command(*args))
+                await writer.drain()
+                return await _read_reply(reader)
+            except RedisError:
+                raise
+            except BaseException:
+                # the reply might still be pending, reconnect on the next command
+                writer.close()
+                self._connection = None
+                raise
+
+    async def close(self) -> None:
+        if self._connection:
+            self._connection[1].close()
+            self._connection = None
+
+    async def _connect(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl or None
+        )
+        if self.password:
+            auth = [self.username, self.password] if self.username else [self.password]
+            writer.write(_encode_command("AUTH", *auth))
+            await writer.drain()
+            await _read_reply(reader)
+        if self.db:
+            writer.write(_encode_command("SELECT", self.db))
+            await writer.drain()
+            await _read_reply(reader)
+        return reader, writer
+
+
+def create_cache_backend(url: str) -> CacheBackend:
+    if not url:
+        return MemoryCacheBackend()
+    logger.info("Using a shared cache backend.")
+    return RedisCacheBackend(url)
+
+
+def _encode_command(*args: str | bytes | int) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readuntil(b"\r\n")
+    kind, data = line[:1], line[1:-2]
+    if kind == b"+":
+        return data.decode()
+    if kind == b"-":
+        raise RedisError(data.decode())
+    if kind == b":":
+        return int(data)
+    if kind == b"$":
+        length = int(data)
+        if length == -1:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(data)
+        if length == -1:
+            return None
+        return [await _read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unexpected reply: {line!r}")
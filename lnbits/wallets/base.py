@@ -3,12 +3,13 @@ from __future__ import annotations
 import asyncio
 from abc import ABC, abstractmethod
 from collections.abc import AsyncGenerator, Coroutine
+from datetime import datetime
 from enum import Enum
 from typing import TYPE_CHECKING, NamedTuple
 
 from loguru import logger
 
-from lnbits.exceptions import InvoiceError
+from lnbits.exceptions import InvoiceError, UnsupportedError
 from lnbits.settings import settings
 
 if TYPE_CHECKING:
@@ -109,6 +110,11 @@ class Wallet(ABC):
 
     __node_cls__: type[Node] | None = None
     features: list[Feature] | None = None
+    # limit for the status checks of pending payments, None uses the global setting
+    status_requests_per_second: float | None = None
+    # `paid_invoices_stream` can replay the settlements after a cursor,
+    # see `invoice_stream_cursor` and `resume_invoice_stream`
+    resumable_invoice_stream: bool = False
 
     def has_feature(self, feature: Feature) -> bool:
         return self.features is not None and feature in self.features
@@ -116,6 +122,12 @@ class Wallet(ABC):
     def __init__(self) -> None:
         self.pending_invoices: list[str] = []
 
+    async def startup(self) -> None:  # noqa: B027
+        """
+        Slow initialization, e.g. requests to the node, awaited once before the
+        funding source is used, so that `__init__` does not block the event loop.
+        """
+
     @abstractmethod
     async def cleanup(self):
         pass
@@ -153,6 +165,17 @@ class Wallet(ABC):
     ) -> Coroutine[None, None, PaymentStatus]:
         pass
 
+    async def get_payment_statuses(
+        self, checking_ids: list[str], created_after: datetime | None = None
+    ) -> dict[str, PaymentStatus]:
+        """
+        Status of many outgoing payments with one request, for funding sources
+        that have a batch API. `created_after` is the creation time of the oldest
+        payment, the search can stop there. Checking ids missing in the result
+        are checked one by one with `get_payment_status`.
+        """
+        return {}
+
     async def create_hold_invoice(
         self,
         amount: int,
@@ -176,6 +199,17 @@ class Wallet(ABC):
             message="Hold invoices are not supported by this wallet.", status="failed"
         )
 
+    def invoice_stream_cursor(self) -> str | None:
+        """
+        Cursor of the last invoice yielded by `paid_invoices_stream`,
+        e.g. the LND `settle_index` or the CLN `pay_index`.
+        """
+        return None
+
+    def resume_invoice_stream(self, cursor: str) -> None:
+        """Replay the settlements after `cursor` when the stream (re)connects."""
+        raise UnsupportedError("Resuming the invoice stream is not supported.")
+
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         while settings.lnbits_running:
             for invoice in self.pending_invoices:
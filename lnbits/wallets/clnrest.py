@@ -29,6 +29,8 @@ from .base import (
 
 
 class CLNRestWallet(Wallet):
+    resumable_invoice_stream = True
+
     def __init__(self):
         if not settings.clnrest_url:
             raise ValueError("Cannot initialize CLNRestWallet: missing CLNREST_URL")
@@ -388,6 +390,12 @@ class CLNRestWallet(Wallet):
 
         return PaymentPendingStatus()
 
+    def invoice_stream_cursor(self) -> str | None:
+        return str(self.last_pay_index) if self.last_pay_index else None
+
+    def resume_invoice_stream(self, cursor: str) -> None:
+        self.last_pay_index = int(cursor)
+
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         while settings.lnbits_running:
             try:
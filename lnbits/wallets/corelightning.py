@@ -1,5 +1,7 @@
 import asyncio
 from collections.abc import AsyncGenerator
+from datetime import datetime
+from functools import partial
 from secrets import token_urlsafe
 from typing import Any
 
@@ -36,6 +38,9 @@ class CoreLightningWallet(Wallet):
 
     __node_cls__ = CoreLightningNode
     features = [Feature.nodemanager]
+    resumable_invoice_stream = True
+    # invoices per `listinvoices` request while looking for the last pay_index
+    pay_index_page_size = 1000
 
     async def cleanup(self):
         pass
@@ -49,9 +54,8 @@ class CoreLightningWallet(Wallet):
             )
         self.pay = settings.corelightning_pay_command
         self.ln = LightningRpc(rpc)
-        # check if description_hash is supported (from corelightning>=v0.11.0)
-        command = self.ln.help("invoice")["help"][0]["command"]  # type: ignore
-        self.supports_description_hash = "deschashonly" in command
+        # set by `startup`, requests to the node are too slow for `__init__`
+        self.supports_description_hash = False
 
         # https://docs.corelightning.org/reference/lightning-pay
         # -32602: Invalid bolt11: Prefix bc is not for regtest
@@ -64,13 +68,45 @@ class CoreLightningWallet(Wallet):
         # 210: Payment timed out without a payment in progress.
         self.pay_failure_error_codes = [-32602, 201, 203, 205, 206, 207, 210]
 
-        # check last payindex so we can listen from that point on
         self.last_pay_index = 0
-        invoices: dict = self.ln.listinvoices()  # type: ignore
-        for inv in invoices["invoices"][::-1]:
-            if "pay_index" in inv:
-                self.last_pay_index = inv["pay_index"]
-                break
+
+    async def startup(self) -> None:
+        # check if description_hash is supported (from corelightning>=v0.11.0)
+        r: dict = await run_sync(lambda: self.ln.help("invoice"))
+        self.supports_description_hash = "deschashonly" in r["help"][0]["command"]
+
+        # check last payindex so we can listen from that point on,
+        # unless the invoice stream is resumed from a persisted cursor
+        if not self.last_pay_index:
+            self.last_pay_index = await self._latest_pay_index()
+
+    async def _latest_pay_index(self) -> int:
+        """
+        Page backwards through the most recently updated invoices until one is
+        paid, instead of listing all invoices of the node.
+        """
+        try:
+            r: dict = await run_sync(
+                lambda: self.ln.call(
+                    "wait",
+                    {"subsystem": "invoices", "indexname": "updated", "nextvalue": 0},
+                )
+            )
+        except RpcError:
+            # `wait` and paginated `listinvoices` need corelightning>=v23.08
+            invoices: dict = await run_sync(lambda: self.ln.listinvoices())
+            return _latest_pay_index(invoices["invoices"])
+
+        end = int(r.get("updated") or 0)
+        while end > 0:
+            start = max(end - self.pay_index_page_size + 1, 1)
+            page = {"index": "updated", "start": start, "limit": end - start + 1}
+            invoices = await run_sync(partial(self.ln.call, "listinvoices", page))
+            pay_index = _latest_pay_index(invoices["invoices"])
+            if pay_index:
+                return pay_index
+            end = start - 1
+        return 0
 
     async def status(self) -> StatusResponse:
         try:
@@ -244,19 +280,7 @@ class CoreLightningWallet(Wallet):
             payment_resp = r["pays"][-1]
 
             if payment_resp["payment_hash"] == checking_id:
-                status = payment_resp["status"]
-                if status == "complete":
-                    fee_msat = -int(
-                        payment_resp["amount_sent_msat"] - payment_resp["amount_msat"]
-                    )
-
-                    return PaymentSuccessStatus(
-                        fee_msat=fee_msat, preimage=payment_resp["preimage"]
-                    )
-                elif status == "failed":
-                    return PaymentFailedStatus()
-                else:
-                    return PaymentPendingStatus()
+                return self._pay_status(payment_resp)
             else:
                 logger.warning(f"supplied an invalid checking_id: {checking_id}")
             return PaymentPendingStatus()
@@ -265,6 +289,43 @@ class CoreLightningWallet(Wallet):
             logger.warning(exc)
             return PaymentPendingStatus()
 
+    async def get_payment_statuses(
+        self, checking_ids: list[str], created_after: datetime | None = None
+    ) -> dict[str, PaymentStatus]:
+        try:
+            r: dict = await run_sync(lambda: self.ln.listpays())
+        except Exception as exc:
+            logger.warning(exc)
+            return {}
+        wanted = set(checking_ids)
+        statuses: dict[str, PaymentStatus] = {}
+        # like `get_payment_status`, the last attempt for a payment_hash counts
+        for payment_resp in r.get("pays", []):
+            if payment_resp.get("payment_hash") in wanted:
+                statuses[payment_resp["payment_hash"]] = self._pay_status(payment_resp)
+        return statuses
+
+    def _pay_status(self, payment_resp: dict) -> PaymentStatus:
+        status = payment_resp["status"]
+        if status == "complete":
+            fee_msat = -int(
+                payment_resp["amount_sent_msat"] - payment_resp["amount_msat"]
+            )
+
+            return PaymentSuccessStatus(
+                fee_msat=fee_msat, preimage=payment_resp["preimage"]
+            )
+        elif status == "failed":
+            return PaymentFailedStatus()
+        else:
+            return PaymentPendingStatus()
+
+    def invoice_stream_cursor(self) -> str | None:
+        return str(self.last_pay_index) if self.last_pay_index else None
+
+    def resume_invoice_stream(self, cursor: str) -> None:
+        self.last_pay_index = int(cursor)
+
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         while settings.lnbits_running:
             try:
@@ -283,3 +344,7 @@ class CoreLightningWallet(Wallet):
                     "retrying in 5 seconds"
                 )
                 await asyncio.sleep(5)
+
+
+def _latest_pay_index(invoices: list[dict]) -> int:
+    return max((int(inv.get("pay_index") or 0) for inv in invoices), default=0)
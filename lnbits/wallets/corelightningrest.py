@@ -25,6 +25,8 @@ from .macaroon import load_macaroon
 
 
 class CoreLightningRestWallet(Wallet):
+    resumable_invoice_stream = True
+
     def __init__(self):
         if not settings.corelightning_rest_url:
             raise ValueError(
@@ -282,6 +284,12 @@ class CoreLightningRestWallet(Wallet):
             logger.error(f"Error getting payment status: {e}")
             return PaymentPendingStatus()
 
+    def invoice_stream_cursor(self) -> str | None:
+        return str(self.last_pay_index) if self.last_pay_index else None
+
+    def resume_invoice_stream(self, cursor: str) -> None:
+        self.last_pay_index = int(cursor)
+
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         while settings.lnbits_running:
             try:
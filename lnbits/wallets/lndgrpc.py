@@ -89,6 +89,7 @@ class LndWallet(Wallet):
     invoices_rpc: InvoicesStub
 
     features = [Feature.holdinvoice]
+    resumable_invoice_stream = True
 
     def __init__(self):
         if not settings.lnd_grpc_endpoint:
@@ -126,6 +127,8 @@ class LndWallet(Wallet):
         self.rpc = LightningStub(channel)
         self.router_rpc = RouterStub(channel)
         self.invoices_rpc = InvoicesStub(channel)
+        # settle index of the last paid invoice seen, replayed from on reconnect
+        self.settle_index = 0
 
     def metadata_callback(self, _, callback):
         callback([("macaroon", self.macaroon)], None)
@@ -298,14 +301,21 @@ class LndWallet(Wallet):
         logger.info(f"LND Payment non-existent: {checking_id}")
         return PaymentPendingStatus()
 
+    def invoice_stream_cursor(self) -> str | None:
+        return str(self.settle_index) if self.settle_index else None
+
+    def resume_invoice_stream(self, cursor: str) -> None:
+        self.settle_index = int(cursor)
+
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         while settings.lnbits_running:
             try:
-                req = InvoiceSubscription()
+                req = InvoiceSubscription(settle_index=self.settle_index)
                 async for i in self.rpc.SubscribeInvoices(req):
                     if not i.settled:
                         continue
                     checking_id = bytes_to_hex(i.r_hash)
+                    self.settle_index = i.settle_index or self.settle_index
                     yield checking_id
             except Exception as exc:
                 logger.error(
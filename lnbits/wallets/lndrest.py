@@ -3,6 +3,7 @@ import base64
 import hashlib
 import json
 from collections.abc import AsyncGenerator
+from datetime import datetime
 
 import httpx
 from loguru import logger
@@ -31,6 +32,10 @@ class LndRestWallet(Wallet):
 
     __node_cls__ = LndRestNode
     features = [Feature.nodemanager, Feature.holdinvoice]
+    resumable_invoice_stream = True
+    # bounds of the ListPayments scan in `get_payment_statuses`
+    list_payments_max_pages = 10
+    list_payments_clock_skew = 3600
 
     def __init__(self):
         if not settings.lnd_rest_endpoint:
@@ -73,6 +78,8 @@ class LndRestWallet(Wallet):
         self.client = httpx.AsyncClient(
             base_url=self.endpoint, headers=headers, verify=cert
         )
+        # settle index of the last paid invoice seen, replayed from on reconnect
+        self.settle_index = 0
 
     async def cleanup(self):
         try:
@@ -303,11 +310,78 @@ class LndRestWallet(Wallet):
         logger.info(f"LNDRest Payment non-existent: {checking_id}")
         return PaymentPendingStatus()
 
+    async def get_payment_statuses(
+        self, checking_ids: list[str], created_after: datetime | None = None
+    ) -> dict[str, PaymentStatus]:
+        """
+        Pages backwards through ListPayments until all checking ids are found,
+        at most `list_payments_max_pages` pages and only back to `created_after`.
+        Payments LND never saw are left to the single checks.
+        """
+        wanted = set(checking_ids)
+        statuses: dict[str, PaymentStatus] = {}
+        index_offset = 0
+        for _ in range(self.list_payments_max_pages):
+            params = {
+                "include_incomplete": "true",
+                "reversed": "true",
+                "max_payments": 1000,
+                "index_offset": index_offset,
+            }
+            if created_after:
+                # LND creates the payment after LNbits, allow for clock skew
+                start = created_after.timestamp() - self.list_payments_clock_skew
+                params["creation_date_start"] = max(int(start), 0)
+            try:
+                r = await self.client.get("/v1/payments", params=params)
+                r.raise_for_status()
+                data = r.json()
+            except Exception as exc:
+                logger.warning(f"LNDRest ListPayments failed: {exc}")
+                break
+
+            for payment in data.get("payments", []):
+                payment_hash = payment.get("payment_hash")
+                if payment_hash not in wanted:
+                    continue
+                statuses[payment_hash] = self._list_payment_status(payment)
+                wanted.discard(payment_hash)
+
+            if not wanted:
+                break
+            first_index_offset = int(data.get("first_index_offset", 0))
+            if not data.get("payments") or first_index_offset <= 1:
+                break
+            if index_offset and first_index_offset >= index_offset:
+                break
+            index_offset = first_index_offset
+        return statuses
+
+    def _list_payment_status(self, payment: dict) -> PaymentStatus:
+        status = payment.get("status")
+        if status == "SUCCEEDED":
+            return PaymentSuccessStatus(
+                fee_msat=abs(int(payment.get("fee_msat", 0))),
+                preimage=payment.get("payment_preimage"),
+            )
+        if status == "FAILED":
+            return PaymentFailedStatus()
+        return PaymentPendingStatus()
+
+    def invoice_stream_cursor(self) -> str | None:
+        return str(self.settle_index) if self.settle_index else None
+
+    def resume_invoice_stream(self, cursor: str) -> None:
+        self.settle_index = int(cursor)
+
     async def paid_invoices_stream(self) -> AsyncGenerator[str, None]:
         while settings.lnbits_running:
             try:
                 url = "/v1/invoices/subscribe"
-                async with self.client.stream("GET", url, timeout=None) as r:
+                params = {"settle_index": self.settle_index}
+                async with self.client.stream(
+                    "GET", url, params=params, timeout=None
+                ) as r:
                     async for line in r.aiter_lines():
                         try:
                             inv = json.loads(line)["result"]
@@ -318,6 +392,9 @@ class LndRestWallet(Wallet):
                             continue
 
                         payment_hash = base64.b64decode(inv["r_hash"]).hex()
+                        self.settle_index = int(
+                            inv.get("settle_index") or self.settle_index
+                        )
                         yield payment_hash
             except Exception as exc:
                 logger.warning(
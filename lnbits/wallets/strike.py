@@ -76,6 +76,9 @@ class StrikeWallet(Wallet):
     A minimal LNbits wallet backend for Strike.
     """
 
+    # payment operations are limited to 250 requests / 1 minute
+    status_requests_per_second = 4
+
     # --------------------------------------------------------------------- #
     # construction / teardown                                               #
     # --------------------------------------------------------------------- #
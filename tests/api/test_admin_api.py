@@ -49,3 +49,20 @@ async def test_admin_update_noneditable_settings(
         headers={"Authorization": f"Bearer {superuser_token}"},
     )
     assert response.status_code == 400
+
+
+@pytest.mark.anyio
+async def test_admin_webhook_deliveries(client: AsyncClient, superuser_token: str):
+    headers = {"Authorization": f"Bearer {superuser_token}"}
+    response = await client.get("/admin/api/v1/webhooks?status=failed", headers=headers)
+    assert response.status_code == 200
+    assert "data" in response.json()
+
+    response = await client.put("/admin/api/v1/webhooks/replay", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["success"] is True
+
+    response = await client.put(
+        "/admin/api/v1/webhooks/missing/replay", headers=headers
+    )
+    assert response.status_code == 404
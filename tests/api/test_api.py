@@ -1,4 +1,9 @@
+import asyncio
+import csv
 import hashlib
+import io
+import json
+import time
 from json import JSONDecodeError
 from unittest.mock import AsyncMock, Mock
 from uuid import uuid4
@@ -337,6 +342,41 @@ async def test_check_payment_with_key(client, invoice: Payment, inkey_headers_fr
     assert "details" in response.json()
 
 
+# check GET /api/v1/payments/<hash>?wait=<seconds>: long polling payment status
+@pytest.mark.anyio
+async def test_check_payment_long_poll(client, inkey_headers_to, adminkey_headers_from):
+    data = await get_random_invoice_data()
+    response = await client.post(
+        "/api/v1/payments", json=data, headers=inkey_headers_to
+    )
+    invoice = response.json()
+    url = f"/api/v1/payments/{invoice['payment_hash']}"
+
+    # nobody pays, the request gives up after waiting
+    response = await client.get(url, params={"wait": 1})
+    assert response.status_code == 200
+    assert response.json()["paid"] is False
+
+    poll = asyncio.create_task(
+        client.get(url, params={"wait": 10}, headers=inkey_headers_to)
+    )
+    await asyncio.sleep(0.2)
+    assert not poll.done()
+
+    start = time.monotonic()
+    response = await client.post(
+        "/api/v1/payments",
+        json={"out": True, "bolt11": invoice["bolt11"]},
+        headers=adminkey_headers_from,
+    )
+    assert response.status_code < 300
+    response = await asyncio.wait_for(poll, timeout=5)
+    # woken by the settlement, not by the timeout
+    assert time.monotonic() - start < 5
+    assert response.json()["paid"] is True
+    assert response.json()["details"]["status"] == "success"
+
+
 # check POST /api/v1/payments: payment with wrong key type
 @pytest.mark.anyio
 async def test_pay_invoice_wrong_key(client, invoice, adminkey_headers_from):
@@ -453,6 +493,74 @@ async def test_get_payments_paginated(client, inkey_fresh_headers_to, fake_payme
         assert payment["checking_id"] in checking_id_list
 
 
+@pytest.mark.anyio
+async def test_export_payments(client, inkey_fresh_headers_to, fake_payments):
+    fake_data, filters = fake_payments
+
+    response = await client.get(
+        "/api/v1/payments/export",
+        params=filters | {"format": "csv", "direction": "asc"},
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["memo"] for row in rows] == [invoice.memo for invoice in fake_data]
+    assert rows[0]["status"] == "success"
+    assert json.loads(rows[0]["extra"]) is not None
+
+    response = await client.get(
+        "/api/v1/payments/export",
+        params=filters | {"format": "jsonl", "memo[eq]": "yyyy"},
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert len(lines) == 1
+    assert Payment.parse_raw(lines[0]).amount == 100_000
+
+
+@pytest.mark.anyio
+async def test_get_payments_paginated_cursor(
+    client, inkey_fresh_headers_to, fake_payments
+):
+    fake_data, filters = fake_payments
+    params = filters | {"limit": 2, "sortby": "time", "direction": "desc"}
+
+    response = await client.get(
+        "/api/v1/payments/paginated",
+        params=params,
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page["data"]) == 2
+    assert first_page["next_cursor"]
+
+    response = await client.get(
+        "/api/v1/payments/paginated",
+        params=params | {"cursor": first_page["next_cursor"], "count": "none"},
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 200
+    second_page = response.json()
+    assert len(second_page["data"]) == len(fake_data) - 2
+    assert second_page["next_cursor"] is None
+
+    checking_ids = [p["checking_id"] for p in first_page["data"]]
+    checking_ids += [p["checking_id"] for p in second_page["data"]]
+    assert len(set(checking_ids)) == len(fake_data)
+
+    response = await client.get(
+        "/api/v1/payments/paginated",
+        params={"cursor": "bad"},
+        headers=inkey_fresh_headers_to,
+    )
+    assert response.status_code == 400
+
+
 @pytest.mark.anyio
 async def test_get_payments_history(client, inkey_fresh_headers_to, fake_payments):
     fake_data, filters = fake_payments
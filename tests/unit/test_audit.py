@@ -0,0 +1,71 @@
+import asyncio
+from uuid import uuid4
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core import tasks
+from lnbits.core.db import db
+from lnbits.core.models import AuditEntry
+from lnbits.core.models.audit import AuditWriterStats
+from lnbits.core.tasks import flush_audit_queue, wait_for_audit_data
+from lnbits.middleware import AuditMiddleware
+from lnbits.settings import Settings
+
+
+def _entries(count: int) -> list[AuditEntry]:
+    path = f"/api/v1/{uuid4().hex}"
+    return [AuditEntry(path=path, duration=0.1) for _ in range(count)]
+
+
+async def _written(path: str | None) -> int:
+    row: dict = await db.fetchone(
+        "SELECT COUNT(*) AS total FROM audit WHERE path = :path", {"path": path}
+    )
+    return row["total"]
+
+
+@pytest.mark.anyio
+async def test_audit_writer_batches(app, settings: Settings, mocker: MockerFixture):
+    mocker.patch.object(settings, "lnbits_audit_batch_size", 10)
+    mocker.patch.object(settings, "lnbits_audit_batch_seconds", 0.1)
+    queue: asyncio.Queue = asyncio.Queue()
+    mocker.patch.object(tasks, "audit_queue", queue)
+    stats = AuditWriterStats()
+    mocker.patch.object(tasks, "audit_writer_stats", stats)
+    insert = mocker.spy(tasks, "create_audit_entries")
+
+    entries = _entries(25)
+    for entry in entries:
+        queue.put_nowait(entry)
+    writer = asyncio.create_task(wait_for_audit_data())
+    # other background tasks can hold the database for a moment
+    for _ in range(50):
+        await asyncio.sleep(0.1)
+        if stats.written == 25:
+            break
+    writer.cancel()
+
+    assert [len(call.args[0]) for call in insert.call_args_list] == [10, 10, 5]
+    assert stats.written == 25
+    assert stats.batches == 3
+    assert await _written(entries[0].path) == 25
+
+
+@pytest.mark.anyio
+async def test_audit_queue_overflow_and_flush(app, mocker: MockerFixture):
+    queue: asyncio.Queue = asyncio.Queue(3)
+    mocker.patch.object(tasks, "audit_queue", queue)
+    stats = AuditWriterStats()
+    mocker.patch.object(tasks, "audit_writer_stats", stats)
+    middleware = AuditMiddleware(app, audit_queue=queue, audit_stats=stats)
+
+    entries = _entries(5)
+    for entry in entries:
+        middleware._enqueue(entry)
+    assert stats.dropped == 2
+
+    await flush_audit_queue()
+    assert queue.empty()
+    assert stats.written == 3
+    assert await _written(entries[0].path) == 3
@@ -1,7 +1,11 @@
 import asyncio
 
 import pytest
+from pytest_mock.plugin import MockerFixture
 
+from lnbits.core.crud import create_wallet, get_user, get_wallet_for_key, update_wallet
+from lnbits.core.services import create_user_account, update_wallet_balance
+from lnbits.settings import Settings
 from lnbits.utils.cache import Cache
 
 key = "foo"
@@ -59,3 +63,139 @@ async def test_cache_coro(cache):
     await cache.save_result(test, key="test")
     result = await cache.save_result(test, key="test")
     assert result == called == 1
+
+
+@pytest.mark.anyio
+async def test_cache_lru_eviction():
+    cache = Cache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats().evictions == 1
+
+    sized = Cache(max_bytes=1000)
+    sized.set("small", "x")
+    sized.set("big", "x" * 2000)
+    assert sized.get("big") is None
+    assert sized.stats().size_bytes < 1000
+
+
+@pytest.mark.anyio
+async def test_cache_single_flight():
+    cache = Cache()
+    called = 0
+
+    async def slow():
+        nonlocal called
+        called += 1
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(
+        *[cache.save_result(slow, key="slow") for _ in range(5)]
+    )
+    assert results == ["value"] * 5
+    assert called == 1
+    assert cache.stats().coalesced == 4
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        *[cache.save_result(failing, key="failing") for _ in range(3)],
+        return_exceptions=True,
+    )
+    assert all(isinstance(r, ValueError) for r in results)
+    assert "failing" not in cache._values
+    assert not cache._inflight
+
+
+@pytest.mark.anyio
+async def test_cache_negative():
+    cache = Cache()
+    called = 0
+
+    async def missing():
+        nonlocal called
+        called += 1
+        return None
+
+    await cache.save_result(missing, key="missing")
+    await cache.save_result(missing, key="missing")
+    assert called == 2
+
+    await cache.save_result(missing, key="negative", negative_expiry=10)
+    await cache.save_result(missing, key="negative", negative_expiry=10)
+    assert called == 3
+    assert cache.stats().hits == 1
+
+
+@pytest.mark.anyio
+async def test_cache_memoize():
+    cache = Cache()
+    calls: list[str] = []
+
+    @cache.memoize("test", expiry=10, tags=lambda value: [f"tag:{value}"])
+    async def lookup(key: str, conn=None):
+        calls.append(key)
+        return key.upper()
+
+    assert await lookup("a") == "A"
+    assert await lookup(key="a") == "A"
+    assert calls == ["a"]
+
+    # calls inside a transaction are never cached
+    assert await lookup("a", conn=object()) == "A"
+    assert calls == ["a", "a"]
+
+    lookup.invalidate("a")
+    await lookup("a")
+    assert calls == ["a", "a", "a"]
+
+    cache.invalidate_tag("tag:A")
+    await lookup("a")
+    assert calls == ["a", "a", "a", "a"]
+    assert cache._tags["tag:A"] <= set(cache._values)
+
+    @cache.memoize("disabled", expiry=lambda: 0)
+    async def disabled():
+        calls.append("disabled")
+        return 1
+
+    await disabled()
+    await disabled()
+    assert calls.count("disabled") == 2
+
+
+@pytest.mark.anyio
+async def test_wallet_for_key_cache_invalidation(
+    app, settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "lnbits_crud_cache_seconds", 60)
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+
+    cached = await get_wallet_for_key(wallet.inkey)
+    assert cached
+    assert await get_wallet_for_key(wallet.inkey) is cached
+
+    await update_wallet_balance(wallet, 100)
+    updated = await get_wallet_for_key(wallet.inkey)
+    assert updated
+    assert updated.balance == 100
+
+    updated.name = "renamed"
+    await update_wallet(updated)
+    assert await get_wallet_for_key(wallet.inkey) is not updated
+
+    cached_user = await get_user(user.id)
+    assert cached_user
+    await create_wallet(user_id=user.id)
+    fresh_user = await get_user(user.id)
+    assert fresh_user
+    assert len(fresh_user.wallets) == len(cached_user.wallets) + 1
@@ -0,0 +1,276 @@
+import asyncio
+import time
+
+import pytest
+
+from lnbits.core.models import Wallet
+from lnbits.utils.cache import Cache
+from lnbits.utils.cache_backend import (
+    CacheBackend,
+    MemoryCacheBackend,
+    RedisCacheBackend,
+    _encode_command,
+    _read_reply,
+    create_cache_backend,
+)
+
+
+def _bulk(data: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedisServer:
+    """In-memory server for the subset of the Redis protocol used by the cache."""
+
+    def __init__(self):
+        self.values: dict[bytes, tuple[bytes, float]] = {}
+        self.sets: dict[bytes, set[bytes]] = {}
+        self.subscribers: list[asyncio.StreamWriter] = []
+        self.server: asyncio.Server | None = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"redis://127.0.0.1:{port}/0"
+
+    async def stop(self):
+        for writer in self.subscribers:
+            writer.close()
+        assert self.server
+        self.server.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                command = await _read_reply(reader)
+                writer.write(self._reply(command, writer))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    def _reply(self, command: list[bytes], writer) -> bytes:
+        name, args = command[0].decode().lower(), command[1:]
+        if name == "subscribe":
+            self.subscribers.append(writer)
+            return b"*3\r\n" + _bulk(b"subscribe") + _bulk(args[0]) + b":1\r\n"
+        handler = getattr(self, f"_{name}", None)
+        if not handler:
+            return b"-ERR unknown command\r\n"
+        return handler(*args)
+
+    def _get(self, key: bytes) -> bytes:
+        value, expiry = self.values.get(key, (None, 0))
+        if value is None or expiry < time.time():
+            return b"$-1\r\n"
+        return _bulk(value)
+
+    def _set(self, key: bytes, value: bytes, _px: bytes, ms: bytes) -> bytes:
+        self.values[key] = (value, time.time() + int(ms) / 1000)
+        return b"+OK\r\n"
+
+    def _sadd(self, key: bytes, member: bytes) -> bytes:
+        self.sets.setdefault(key, set()).add(member)
+        return b":1\r\n"
+
+    def _pexpire(self, key: bytes, ms: bytes) -> bytes:
+        return b":1\r\n"
+
+    def _smembers(self, key: bytes) -> bytes:
+        members = self.sets.get(key, set())
+        return b"*%d\r\n" % len(members) + b"".join(map(_bulk, members))
+
+    def _del(self, *keys: bytes) -> bytes:
+        for key in keys:
+            self.values.pop(key, None)
+            self.sets.pop(key, None)
+        return b":%d\r\n" % len(keys)
+
+    def _publish(self, channel: bytes, data: bytes) -> bytes:
+        message = _encode_command("message", channel, data)
+        for subscriber in self.subscribers:
+            subscriber.write(message)
+        return b":%d\r\n" % len(self.subscribers)
+
+
+@pytest.fixture
+async def redis_url():
+    server = FakeRedisServer()
+    url = await server.start()
+    yield url
+    await server.stop()
+
+
+async def _shared_cache(url: str) -> tuple[Cache, asyncio.Task]:
+    cache = Cache()
+    cache.backend = RedisCacheBackend(url)
+    task = asyncio.create_task(cache.listen_invalidations())
+    await asyncio.sleep(0.05)  # wait for the subscription
+    return cache, task
+
+
+def test_create_cache_backend():
+    assert isinstance(create_cache_backend(""), MemoryCacheBackend)
+    backend = create_cache_backend("redis://:secret@cache.local:6380/2")
+    assert isinstance(backend, RedisCacheBackend)
+    assert (backend.host, backend.port, backend.db) == ("cache.local", 6380, 2)
+    assert backend.password == "secret"
+    with pytest.raises(ValueError, match="Invalid cache url"):
+        create_cache_backend("http://cache.local")
+
+
+@pytest.mark.anyio
+async def test_shared_cache_values(redis_url):
+    first, first_task = await _shared_cache(redis_url)
+    second, second_task = await _shared_cache(redis_url)
+    wallet = Wallet(id="w1", user="u1", name="shared", adminkey="a", inkey="i")
+    try:
+        await first.aset("wallet", wallet, expiry=10, tags=["wallet:w1"])
+        cached = await second.aget("wallet")
+        assert cached == wallet
+        # now also in the local cache of the second worker
+        assert second.get("wallet") == wallet
+
+        called = 0
+
+        async def load():
+            nonlocal called
+            called += 1
+            return "value"
+
+        assert await first.save_result(load, key="shared") == "value"
+        assert await second.save_result(load, key="shared") == "value"
+        assert called == 1
+    finally:
+        first_task.cancel()
+        second_task.cancel()
+        await first.backend.close()
+        await second.backend.close()
+
+
+@pytest.mark.anyio
+async def test_shared_cache_invalidation(redis_url):
+    first, first_task = await _shared_cache(redis_url)
+    second, second_task = await _shared_cache(redis_url)
+    try:
+        await first.aset("a", 1, tags=["tag"])
+        await first.aset("b", 2)
+        assert await second.aget("a") == 1
+        assert await second.aget("b") == 2
+
+        first.invalidate_tag("tag")
+        first.pop("b")
+        await asyncio.sleep(0.1)
+
+        assert second.get("a") is None
+        assert second.get("b") is None
+        assert await second.aget("a") is None
+        assert await second.aget("b") is None
+    finally:
+        first_task.cancel()
+        second_task.cancel()
+        await first.backend.close()
+        await second.backend.close()
+
+
+class SlowDeleteBackend(CacheBackend):
+    """Shared backend whose deletions take a while or fail."""
+
+    shared = True
+
+    def __init__(self, fail: bool = False):
+        self.values: dict[str, bytes] = {}
+        self.tags: dict[str, set[str]] = {}
+        self.fail = fail
+        self.deleting = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def get(self, key: str) -> bytes | None:
+        return self.values.get(key)
+
+    async def set(self, key: str, value: bytes, expiry: float) -> None:
+        self.values[key] = value
+
+    async def add_to_tag(self, tag: str, key: str, expiry: float) -> None:
+        self.tags.setdefault(tag, set()).add(key)
+
+    async def delete(self, keys: list[str], tags: list[str]) -> None:
+        self.deleting.set()
+        await self.release.wait()
+        if self.fail:
+            raise ConnectionError("gone")
+        for tag in tags:
+            keys = keys + list(self.tags.pop(tag, set()))
+        for key in keys:
+            self.values.pop(key, None)
+
+
+@pytest.mark.anyio
+async def test_shared_cache_invalidation_is_not_read_back():
+    cache = Cache()
+    cache.backend = backend = SlowDeleteBackend()
+    await cache.aset("auth:wallet-key:old", "wallet", tags=["wallet:w1"])
+    await cache.aset("other", "value")
+
+    cache.invalidate_tag("wallet:w1")
+    cache.pop("other")
+    await backend.deleting.wait()
+    # still in the shared backend, but already invalidated here
+    assert "auth:wallet-key:old" in backend.values
+    assert await cache.aget("auth:wallet-key:old") is None
+    assert await cache.aget("other") is None
+
+    backend.release.set()
+    await asyncio.gather(*cache._background)
+    assert backend.values == {}
+    assert cache._tombstones == {}
+
+    # a value stored after the invalidation is shared again
+    await cache.aset("other", "new")
+    cache._remove("other")
+    assert await cache.aget("other") == "new"
+
+
+@pytest.mark.anyio
+async def test_shared_cache_awaitable_invalidation():
+    cache = Cache()
+    cache.backend = backend = SlowDeleteBackend()
+    await cache.aset("a", 1, tags=["tag"])
+    await cache.aset("b", 2)
+
+    task = asyncio.create_task(cache.ainvalidate_tag("tag"))
+    await backend.deleting.wait()
+    assert not task.done()
+    backend.release.set()
+    await task
+    assert await cache.apop("b") == 2
+    assert backend.values == {}
+
+    # a failed deletion keeps ignoring the shared entry
+    cache = Cache()
+    cache.backend = backend = SlowDeleteBackend(fail=True)
+    backend.release.set()
+    await cache.aset("a", 1)
+    await cache.apop("a")
+    assert "a" in backend.values
+    assert await cache.aget("a") is None
+
+
+@pytest.mark.anyio
+async def test_shared_cache_rejects_unsigned_values(redis_url):
+    cache, task = await _shared_cache(redis_url)
+    try:
+        await cache.backend.set("forged", b"x" * 40, expiry=10)
+        assert await cache.aget("forged", default="default") == "default"
+    finally:
+        task.cancel()
+        await cache.backend.close()
+
+
+@pytest.mark.anyio
+async def test_shared_cache_unavailable():
+    cache = Cache()
+    cache.backend = RedisCacheBackend("redis://127.0.0.1:1/0")
+    # the local cache keeps working without the shared backend
+    await cache.aset("key", "value")
+    assert await cache.aget("key") == "value"
+    assert await cache.aget("missing") is None
@@ -0,0 +1,75 @@
+import pytest
+
+from lnbits.core.crud import (
+    create_wallet,
+    delete_wallet_payment,
+    get_payments,
+    get_wallet,
+    get_wallet_balance_mismatches,
+    rebuild_wallet_balances,
+    update_payment,
+)
+from lnbits.core.crud.balances import increment_wallet_balance
+from lnbits.core.db import db
+from lnbits.core.models import PaymentState
+from lnbits.core.services import create_user_account, update_wallet_balance
+
+
+async def _wallet_mismatches(wallet_id: str):
+    return [
+        m for m in await get_wallet_balance_mismatches() if m.wallet_id == wallet_id
+    ]
+
+
+@pytest.mark.anyio
+async def test_balance_follows_payments(app):
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+
+    await update_wallet_balance(wallet, 100)
+    wallet = await get_wallet(wallet.id)
+    assert wallet
+    assert wallet.balance == 100
+
+    await update_wallet_balance(wallet, -30)
+    wallet = await get_wallet(wallet.id)
+    assert wallet
+    assert wallet.balance == 70
+
+    outgoing = await get_payments(wallet_id=wallet.id, outgoing=True)
+    assert len(outgoing) == 1
+    outgoing[0].status = PaymentState.FAILED
+    await update_payment(outgoing[0])
+    wallet = await get_wallet(wallet.id)
+    assert wallet
+    assert wallet.balance == 100
+
+    await delete_wallet_payment(outgoing[0].checking_id, wallet.id)
+    incoming = await get_payments(wallet_id=wallet.id, incoming=True)
+    await delete_wallet_payment(incoming[0].checking_id, wallet.id)
+    wallet = await get_wallet(wallet.id)
+    assert wallet
+    assert wallet.balance == 0
+
+    assert await _wallet_mismatches(wallet.id) == []
+
+
+@pytest.mark.anyio
+async def test_reconcile_wallet_balances(app):
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    await update_wallet_balance(wallet, 100)
+
+    await increment_wallet_balance(wallet.id, 5000)
+    mismatches = await _wallet_mismatches(wallet.id)
+    assert len(mismatches) == 1
+    assert mismatches[0].ledger_balance_msat == 105_000
+    assert mismatches[0].expected_balance_msat == 100_000
+
+    async with db.connect() as conn:
+        await rebuild_wallet_balances(conn)
+
+    assert await _wallet_mismatches(wallet.id) == []
+    wallet = await get_wallet(wallet.id)
+    assert wallet
+    assert wallet.balance == 100
@@ -6,6 +6,7 @@ from lnbits.core.crud import (
     create_wallet,
     get_payments,
     get_payments_paginated,
+    stream_payments,
     update_payment,
 )
 from lnbits.core.crud.payments import get_standalone_payment
@@ -150,3 +151,23 @@ async def test_crud_search_payments():
         filters=filters,
     )
     assert page.total == 31
+
+
+@pytest.mark.anyio
+async def test_crud_stream_payments():
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    for i in range(7):
+        await create_invoice(wallet_id=wallet.id, amount=10 + i, memo=f"stream {i}")
+    await create_invoice(wallet_id=wallet.id, amount=100, memo="other")
+
+    filters = Filters(search="stream", model=PaymentFilters)
+    chunks = [
+        chunk
+        async for chunk in stream_payments(
+            wallet_id=wallet.id, filters=filters, chunk_size=3
+        )
+    ]
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    checking_ids = [payment.checking_id for chunk in chunks for payment in chunk]
+    assert len(set(checking_ids)) == 7
@@ -0,0 +1,92 @@
+import pytest
+
+from lnbits.core.crud import (
+    create_wallet,
+    force_delete_wallet,
+    get_wallet_for_key,
+    reset_wallet_keys,
+)
+from lnbits.core.crud.wallets import get_base_wallet_for_key, wallet_key_hash
+from lnbits.core.db import db
+from lnbits.core.migrations import m049_create_wallet_keys
+from lnbits.core.models import Wallet
+from lnbits.core.services import create_user_account
+
+
+async def _wallet_keys(wallet_id: str) -> dict[str, str]:
+    rows: list[dict] = await db.fetchall(
+        "SELECT key_hash, key_type FROM wallet_keys WHERE wallet_id = :wallet",
+        {"wallet": wallet_id},
+    )
+    return {row["key_type"]: row["key_hash"] for row in rows}
+
+
+async def _new_wallet() -> Wallet:
+    user = await create_user_account()
+    return await create_wallet(user_id=user.id)
+
+
+@pytest.mark.anyio
+async def test_wallet_keys_are_indexed_by_hash(app):
+    wallet = await _new_wallet()
+    assert await _wallet_keys(wallet.id) == {
+        "admin": wallet_key_hash(wallet.adminkey),
+        "invoice": wallet_key_hash(wallet.inkey),
+    }
+    for key in [wallet.adminkey, wallet.inkey]:
+        found = await get_wallet_for_key(key)
+        assert found
+        assert found.id == wallet.id
+        base_wallet = await get_base_wallet_for_key(key)
+        assert base_wallet
+        assert base_wallet.id == wallet.id
+
+
+@pytest.mark.anyio
+async def test_wallet_keys_follow_reset_and_delete(app):
+    wallet = await _new_wallet()
+    old_keys = [wallet.adminkey, wallet.inkey]
+
+    wallet = await reset_wallet_keys(wallet)
+    assert wallet.adminkey not in old_keys
+    for key in old_keys:
+        assert await get_wallet_for_key(key) is None
+    found = await get_wallet_for_key(wallet.adminkey)
+    assert found
+    assert found.inkey == wallet.inkey
+    assert len(await _wallet_keys(wallet.id)) == 2
+
+    await force_delete_wallet(wallet.id)
+    assert await _wallet_keys(wallet.id) == {}
+
+
+@pytest.mark.anyio
+async def test_wallet_keys_backfill(app):
+    user = await create_user_account()
+    # more than one page of wallets for the migration
+    wallets = [await create_wallet(user_id=user.id) for _ in range(160)]
+    await db.execute(
+        """
+        DELETE FROM wallet_keys
+        WHERE wallet_id IN (SELECT id FROM wallets WHERE "user" = :user)
+        """,
+        {"user": user.id},
+    )
+    assert await get_wallet_for_key(wallets[0].inkey) is None
+
+    async with db.connect() as conn:
+        await m049_create_wallet_keys(conn)
+    rows: list[dict] = await db.fetchall(
+        """
+        SELECT COUNT(*) AS total FROM wallet_keys
+        WHERE wallet_id IN (SELECT id FROM wallets WHERE "user" = :user)
+        """,
+        {"user": user.id},
+    )
+    # and the default wallet of the account
+    assert rows[0]["total"] == 2 * (len(wallets) + 1)
+    for wallet in (wallets[0], wallets[-1]):
+        assert len(await _wallet_keys(wallet.id)) == 2
+        found = await get_wallet_for_key(wallet.inkey)
+        assert found
+        assert found.id == wallet.id
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import date, timezone
 
 import pytest
@@ -11,7 +12,8 @@ from lnbits.core.crud import (
 from lnbits.core.crud.payments import get_payment
 from lnbits.core.models import CreateInvoice
 from lnbits.core.services.payments import create_wallet_invoice
-from lnbits.db import POSTGRES
+from lnbits.db import POSTGRES, SQLITE, Database
+from lnbits.settings import Settings
 
 
 @pytest.mark.anyio
@@ -67,3 +69,105 @@ async def test_create_wallet_and_delete_wallet(app, to_user):
 
     del_wallet = await get_wallet_for_key(wallet.inkey)
     assert del_wallet is None
+
+
+@pytest.fixture
+async def new_database(settings: Settings, tmp_path):
+    """Create databases in a temporary folder and close them after the test."""
+    databases: list[Database] = []
+
+    def _new_database(name: str, concurrency: str) -> Database:
+        data_folder = settings.lnbits_data_folder
+        settings.lnbits_data_folder = str(tmp_path)
+        try:
+            database = Database(name, concurrency=concurrency)
+        finally:
+            settings.lnbits_data_folder = data_folder
+        databases.append(database)
+        return database
+
+    yield _new_database
+    for database in databases:
+        await database.close()
+
+
+@pytest.mark.anyio
+async def test_pooled_database_concurrent_readers(new_database):
+    pooled_db = new_database("test_pooled_readers", "pool")
+    async with pooled_db.connect(readonly=True) as conn_one:
+        async with pooled_db.connect(readonly=True) as conn_two:
+            row_one = await conn_one.fetchone("SELECT 1 as one")
+            row_two = await conn_two.fetchone("SELECT 2 as two")
+            assert row_one["one"] == 1
+            assert row_two["two"] == 2
+            assert pooled_db.pool_stats().checked_out == 2
+
+            engine_stats = next(
+                stats
+                for stats in Database.all_engine_stats()
+                if pooled_db.name in stats.databases
+            )
+            assert engine_stats.checked_out >= 2
+            assert engine_stats.saturation > 0
+
+    stats = pooled_db.pool_stats()
+    assert stats.concurrency == "pool"
+    assert stats.checked_out == 0
+    assert stats.peak_checked_out == 2
+    assert stats.acquired == 2
+    assert stats.waiting == 0
+
+
+@pytest.mark.anyio
+async def test_pooled_database_reader_does_not_wait_for_writer(new_database):
+    pooled_db = new_database("test_pooled_writer", "pool")
+    await pooled_db.execute("DROP TABLE IF EXISTS test_pooled_writer")
+    await pooled_db.execute("CREATE TABLE test_pooled_writer (id TEXT PRIMARY KEY)")
+
+    async with pooled_db.connect() as writer:
+        await writer.execute("INSERT INTO test_pooled_writer (id) VALUES ('1')")
+        row = await asyncio.wait_for(
+            pooled_db.fetchone("SELECT COUNT(*) as count FROM test_pooled_writer"),
+            timeout=5,
+        )
+        assert row["count"] == 1
+
+    await pooled_db.execute("DROP TABLE test_pooled_writer")
+
+
+@pytest.mark.anyio
+async def test_pooled_database_writer_timeout(settings: Settings, new_database):
+    pooled_db = new_database("test_pooled_timeout", "pool")
+    if pooled_db.type != SQLITE:
+        pytest.skip("only SQLite serializes the writers")
+
+    timeout = settings.lnbits_database_pool_timeout
+    settings.lnbits_database_pool_timeout = 0.1
+    try:
+        async with pooled_db.connect():
+            with pytest.raises(TimeoutError):
+                async with pooled_db.connect():
+                    pass
+    finally:
+        settings.lnbits_database_pool_timeout = timeout
+
+    stats = pooled_db.pool_stats()
+    assert stats.timeouts == 1
+    assert stats.waiting == 0
+    assert stats.checked_out == 0
+
+
+@pytest.mark.anyio
+async def test_locked_database_reports_waiting(new_database):
+    locked_db = new_database("test_locked_waiting", "lock")
+    async with locked_db.connect():
+        task = asyncio.create_task(locked_db.fetchone("SELECT 1 as one"))
+        await asyncio.sleep(0.1)
+        assert locked_db.pool_stats().waiting == 1
+
+    row = await task
+    assert row["one"] == 1
+    stats = locked_db.pool_stats()
+    assert stats.acquired == 2
+    assert stats.peak_waiting == 1
+    assert stats.wait_time_max > 0
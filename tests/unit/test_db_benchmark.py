@@ -0,0 +1,136 @@
+import gc
+from datetime import datetime, timezone
+from time import perf_counter
+
+import pytest
+from sqlalchemy.sql import text
+
+from lnbits.core.models import Payment, Wallet
+from lnbits.db import Database, _statement, dict_to_model, model_to_dict
+
+ROUNDS = 500
+
+
+async def _timed(coro_factory, rounds: int = ROUNDS) -> float:
+    start = perf_counter()
+    for _ in range(rounds):
+        await coro_factory()
+    return perf_counter() - start
+
+
+QUERY = "SELECT id, name, adminkey FROM wallets WHERE id = :id AND name = :name"
+VALUES = {"id": "benchmark", "name": "<b>benchmark</b>"}
+
+
+@pytest.mark.anyio
+async def test_query_statement_cache(app, db: Database):
+    async with db.connect() as conn:
+        await conn.fetchone(QUERY, VALUES)
+        hits = _statement.cache_info().hits
+        for _ in range(10):
+            assert await conn.fetchone(QUERY, VALUES) is None
+    assert _statement.cache_info().hits - hits >= 10
+
+
+@pytest.mark.anyio
+@pytest.mark.benchmark
+async def test_benchmark_query_overhead(app, db: Database):
+    """Per-query overhead of the `lnbits.db` wrapper versus raw SQLAlchemy."""
+    async with db.connect() as conn:
+
+        async def raw():
+            result = await conn.conn.execute(text(QUERY), VALUES)
+            result.mappings().first()
+            result.close()
+
+        async def wrapped():
+            await conn.fetchone(QUERY, VALUES)
+
+        # warm up both paths (and the statement cache)
+        await _timed(raw, 20)
+        await _timed(wrapped, 20)
+
+        raw_time = await _timed(raw)
+        wrapped_time = await _timed(wrapped)
+
+    overhead_us = (wrapped_time - raw_time) / ROUNDS * 1_000_000
+    print(
+        f"\nlnbits.db fetchone: {wrapped_time / ROUNDS * 1_000_000:.1f}us/query, "
+        f"raw sqlalchemy: {raw_time / ROUNDS * 1_000_000:.1f}us/query, "
+        f"overhead: {overhead_us:.1f}us"
+    )
+    assert wrapped_time < raw_time * 2
+
+
+def _payment_row(i: int) -> dict:
+    return model_to_dict(
+        Payment(
+            checking_id=f"checking_id_{i}",
+            payment_hash=f"payment_hash_{i}",
+            wallet_id="wallet_id",
+            amount=1000 * i,
+            fee=-i,
+            bolt11=f"lnbc{i}",
+            memo=f"payment {i}",
+            expiry=datetime.now(timezone.utc),
+            extra={"tag": "benchmark", "comment": f"comment {i}"},
+            labels=["benchmark"],
+        )
+    )
+
+
+def _wallet_row(i: int) -> dict:
+    row = model_to_dict(
+        Wallet(
+            id=f"wallet_id_{i}",
+            user="user_id",
+            name=f"wallet {i}",
+            adminkey=f"adminkey_{i}",
+            inkey=f"inkey_{i}",
+        )
+    )
+    row["balance_msat"] = 1000 * i
+    return row
+
+
+def _best_of(runs: int, func) -> tuple[float, list]:
+    """Fastest of a few runs without garbage collection pauses."""
+    best, result = float("inf"), []
+    gc.disable()
+    try:
+        for _ in range(runs):
+            start = perf_counter()
+            result = func()
+            best = min(best, perf_counter() - start)
+    finally:
+        gc.enable()
+    return best, result
+
+
+@pytest.mark.parametrize("model, row", [(Payment, _payment_row), (Wallet, _wallet_row)])
+def test_dict_to_model_trusted(model, row):
+    rows = [row(i) for i in range(100)]
+    validated = [dict_to_model(r, model) for r in rows]
+    trusted = [dict_to_model(r, model, trusted=True) for r in rows]
+    assert trusted == validated
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("model, row", [(Payment, _payment_row), (Wallet, _wallet_row)])
+@pytest.mark.parametrize("count", [1_000, 10_000])
+def test_benchmark_dict_to_model(model, row, count: int):
+    rows = [row(i) for i in range(count)]
+
+    validated_time, validated = _best_of(
+        3, lambda: [dict_to_model(r, model) for r in rows]
+    )
+    trusted_time, trusted = _best_of(
+        3, lambda: [dict_to_model(r, model, trusted=True) for r in rows]
+    )
+
+    assert trusted[-1] == validated[-1]
+    print(
+        f"\ndict_to_model {model.__name__} x {count}: "
+        f"validated {validated_time * 1000:.1f}ms, trusted {trusted_time * 1000:.1f}ms"
+    )
+    assert trusted_time < validated_time
@@ -1,5 +1,6 @@
 import pytest
 
+from lnbits.db import Filters
 from tests.helpers import DbTestModel
 
 
@@ -71,3 +72,111 @@ async def test_db_fetch_page_group_by_evil(fetch_page, db):
             model=DbTestModel,
             group_by=["name;"],
         )
+
+
+@pytest.mark.anyio
+async def test_db_fetch_page_cursor(fetch_page, db):
+    filters = Filters(limit=2, sortby="name", direction="desc")
+    seen = []
+    while True:
+        page = await db.fetch_page(
+            query="select * from test_db_fetch_page",
+            filters=filters,
+            model=DbTestModel,
+            cursor_field="id",
+        )
+        assert page.total == 5
+        seen += [(row.name, row.id) for row in page.data]
+        if not page.next_cursor:
+            break
+        filters = Filters(
+            limit=2, sortby="name", direction="desc", cursor=page.next_cursor
+        )
+
+    assert seen == [
+        ("Dave", 5),
+        ("Dave", 4),
+        ("Carol", 3),
+        ("Bob", 2),
+        ("Alice", 1),
+    ]
+
+
+@pytest.mark.anyio
+async def test_db_fetch_page_cursor_without_sortby(db):
+    await db.execute("DROP TABLE IF EXISTS test_db_fetch_page_keys")
+    await db.execute(
+        """
+        CREATE TABLE test_db_fetch_page_keys (
+            id TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            name TEXT NOT NULL
+        )
+        """
+    )
+    # inserted out of key order, without ORDER BY they come back in this order
+    ids = ["4", "1", "5", "2", "3"]
+    for row_id in ids:
+        await db.execute(
+            """
+            INSERT INTO test_db_fetch_page_keys (id, name, value)
+            VALUES (:id, 'name', 'value')
+            """,
+            {"id": row_id},
+        )
+    try:
+        filters = Filters(limit=2)
+        seen = []
+        while True:
+            page = await db.fetch_page(
+                query="select * from test_db_fetch_page_keys",
+                filters=filters,
+                model=DbTestModel,
+                cursor_field="id",
+            )
+            seen += [row.id for row in page.data]
+            if not page.next_cursor:
+                break
+            filters = Filters(limit=2, cursor=page.next_cursor)
+        assert seen == [1, 2, 3, 4, 5]
+    finally:
+        await db.execute("DROP TABLE test_db_fetch_page_keys")
+
+
+@pytest.mark.anyio
+async def test_db_fetch_page_cursor_skip_count(fetch_page, db):
+    page = await db.fetch_page(
+        query="select * from test_db_fetch_page",
+        filters=Filters(limit=3, count="none"),
+        model=DbTestModel,
+        cursor_field="id",
+    )
+    assert page.total == 3
+    assert page.next_cursor
+
+    page = await db.fetch_page(
+        query="select * from test_db_fetch_page",
+        filters=Filters(limit=3, count="estimate", cursor=page.next_cursor),
+        model=DbTestModel,
+        cursor_field="id",
+    )
+    assert page.total == 5
+    assert [row.id for row in page.data] == [4, 5]
+    assert page.next_cursor is None
+
+
+@pytest.mark.anyio
+async def test_db_fetch_page_cursor_invalid(fetch_page, db):
+    with pytest.raises(ValueError, match="Invalid cursor."):
+        await db.fetch_page(
+            query="select * from test_db_fetch_page",
+            filters=Filters(cursor="not-a-cursor"),
+            model=DbTestModel,
+            cursor_field="id",
+        )
+    with pytest.raises(ValueError, match="Cursor pagination is not supported"):
+        await db.fetch_page(
+            query="select * from test_db_fetch_page",
+            filters=Filters(cursor="WzEsMl0"),
+            model=DbTestModel,
+        )
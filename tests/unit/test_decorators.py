@@ -7,11 +7,23 @@ from fastapi import Request
 from fastapi.exceptions import HTTPException
 from httpx import AsyncClient
 from pydantic.types import UUID4
-
+from pytest_mock.plugin import MockerFixture
+
+from lnbits import decorators
+from lnbits.core.crud import (
+    create_user_extension,
+    create_wallet,
+    get_account,
+    reset_wallet_keys,
+    update_account,
+)
 from lnbits.core.crud.users import delete_account
-from lnbits.core.models import User
+from lnbits.core.crud.wallets import get_wallet_auth_for_key
+from lnbits.core.models import KeyType, User
+from lnbits.core.models.extensions import UserExtension
 from lnbits.core.models.users import AccessTokenPayload
-from lnbits.decorators import check_user_exists
+from lnbits.core.services import create_user_account, update_wallet_balance
+from lnbits.decorators import KeyChecker, LightKeyChecker, check_user_exists
 from lnbits.settings import AuthMethods, Settings, settings
 
 
@@ -136,3 +148,71 @@ async def test_check_user_exists_with_user_id_only_not_allowed(user_alan: User):
         await check_user_exists(request, access_token=None, usr=UUID4(user_alan.id))
     assert exc_info.value.status_code == 401
     assert exc_info.value.detail == "Missing user ID or access token."
+
+
+@pytest.mark.anyio
+async def test_wallet_auth_for_key(app):
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    await update_wallet_balance(wallet=wallet, amount=21)
+    for ext_id in ["lnurlp", "tpos"]:
+        await create_user_extension(
+            UserExtension(user=user.id, extension=ext_id, active=ext_id == "lnurlp")
+        )
+
+    wallet_auth = await get_wallet_auth_for_key(wallet.adminkey)
+    assert wallet_auth
+    assert wallet_auth.wallet.id == wallet.id
+    assert wallet_auth.wallet.balance_msat == 21_000
+    assert wallet_auth.active_extensions == ["lnurlp"]
+
+    wallet_auth = await get_wallet_auth_for_key(wallet.inkey, with_balance=False)
+    assert wallet_auth
+    assert wallet_auth.wallet.balance_msat == 0
+    assert await get_wallet_auth_for_key("not-a-key") is None
+
+
+def _key_request(key: str, path: str = "/api/v1/wallet") -> Request:
+    headers = [(b"x-api-key", key.encode())]
+    return Request({"type": "http", "path": path, "method": "GET", "headers": headers})
+
+
+@pytest.mark.anyio
+async def test_key_checker_cache(app, settings: Settings, mocker: MockerFixture):
+    mocker.patch.object(settings, "auth_authentication_cache_minutes", 1)
+    mocker.patch.object(settings, "lnbits_installed_extensions_ids", {"lnurlp"})
+    resolve = mocker.spy(decorators, "get_wallet_auth_for_key")
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    check = LightKeyChecker(expected_key_type=KeyType.invoice)
+
+    for _ in range(3):
+        key_info = await check(_key_request(wallet.inkey))
+        assert key_info.wallet.id == wallet.id
+    assert resolve.call_count == 1
+
+    # the active extensions are resolved with the wallet
+    with pytest.raises(HTTPException) as exc_info:
+        await check(_key_request(wallet.inkey, "/lnurlp/api/v1/links"))
+    assert exc_info.value.status_code == 403
+    assert resolve.call_count == 1
+
+    # not cached, the balance changes with every payment
+    await KeyChecker()(_key_request(wallet.inkey))
+    await KeyChecker()(_key_request(wallet.inkey))
+    assert resolve.call_count == 3
+
+    old_key = wallet.inkey
+    await reset_wallet_keys(wallet)
+    with pytest.raises(HTTPException) as exc_info:
+        await check(_key_request(old_key))
+    assert exc_info.value.status_code == 404
+    assert (await check(_key_request(wallet.inkey))).wallet.id == wallet.id
+
+    account = await get_account(user.id)
+    assert account
+    account.activated = False
+    await update_account(account)
+    with pytest.raises(HTTPException) as exc_info:
+        await check(_key_request(wallet.inkey))
+    assert exc_info.value.status_code == 404
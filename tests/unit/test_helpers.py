@@ -1,6 +1,6 @@
 import pytest
 
-from lnbits.helpers import check_callback_url
+from lnbits.helpers import check_callback_url, template_renderer
 from lnbits.settings import Settings
 
 
@@ -82,3 +82,22 @@ def test_check_callback_url_multiple_rules(settings: Settings):
 
     settings.lnbits_callback_url_rules.append("https://localhost:3000")
     check_callback_url("https://localhost:3000/callback")  # should not raise
+
+
+def test_template_renderer_is_cached(settings: Settings):
+    folders = ["myext/templates"]
+    renderer = template_renderer(folders)
+    assert template_renderer(["myext/templates"]) is renderer
+    assert template_renderer() is not renderer
+    assert folders == ["myext/templates"]
+
+    site_title = settings.lnbits_site_title
+    try:
+        settings.lnbits_site_title = "Cached Title"
+        assert template_renderer(folders).env.globals["SITE_TITLE"] == "Cached Title"
+        assert template_renderer().env.globals["SETTINGS"]["siteTitle"] == (
+            "Cached Title"
+        )
+    finally:
+        settings.lnbits_site_title = site_title
+    assert template_renderer(folders).env.globals["SITE_TITLE"] == site_title
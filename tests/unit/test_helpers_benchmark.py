@@ -0,0 +1,90 @@
+from time import perf_counter
+
+import pytest
+from httpx import AsyncClient
+from pytest_mock.plugin import MockerFixture
+
+from lnbits import helpers
+
+REQUESTS = 30
+
+
+async def _render_seconds(client: AsyncClient, path: str, headers: dict) -> float:
+    response = await client.get(path, headers=headers)
+    assert response.headers["content-type"].startswith("text/html")
+    start = perf_counter()
+    for _ in range(REQUESTS):
+        await client.get(path, headers=headers)
+    return (perf_counter() - start) / REQUESTS
+
+
+def _uncached(mocker: MockerFixture) -> None:
+    """The previous behaviour: a new environment and globals for every render."""
+
+    def _new_renderer(additional_folders: list | None = None):
+        helpers._template_renderers.clear()
+        helpers._template_globals.clear()
+        return renderer(additional_folders)
+
+    renderer = helpers.template_renderer
+    mocker.patch.object(helpers, "_template_bytecode_cache", return_value=None)
+    for module in ["lnbits.core.views.generic", "lnbits.exceptions"]:
+        mocker.patch(f"{module}.template_renderer", _new_renderer)
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "path, status_code",
+    [("/wallet", 200), ("/not-a-page", 404)],
+)
+async def test_template_renderer(
+    client: AsyncClient,
+    user_headers_from: dict,
+    mocker: MockerFixture,
+    path: str,
+    status_code: int,
+):
+    headers = {**user_headers_from, "user-agent": "Mozilla/5.0"}
+    for _ in range(2):
+        response = await client.get(path, headers=headers)
+        assert response.status_code == status_code
+        assert response.headers["content-type"].startswith("text/html")
+    assert helpers.template_renderer() is helpers.template_renderer()
+
+    _uncached(mocker)
+    response = await client.get(path, headers=headers)
+    assert response.status_code == status_code
+
+
+@pytest.mark.anyio
+@pytest.mark.benchmark
+@pytest.mark.parametrize(
+    "path, status_code",
+    [("/wallet", 200), ("/not-a-page", 404)],
+)
+async def test_benchmark_template_renderer(
+    client: AsyncClient,
+    user_headers_from: dict,
+    mocker: MockerFixture,
+    path: str,
+    status_code: int,
+):
+    """Time to render the wallet and the error page."""
+    # without compression, it would take most of the time
+    headers = {
+        **user_headers_from,
+        "user-agent": "Mozilla/5.0",
+        "accept-encoding": "identity",
+    }
+    response = await client.get(path, headers=headers)
+    assert response.status_code == status_code
+
+    cached = await _render_seconds(client, path, headers)
+    _uncached(mocker)
+    uncached = await _render_seconds(client, path, headers)
+
+    print(
+        f"\nrender {path}: {cached * 1000:.2f}ms cached, "
+        f"{uncached * 1000:.2f}ms with a new environment per request"
+    )
+    assert cached < uncached
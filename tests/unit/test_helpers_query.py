@@ -2,8 +2,17 @@ import json
 
 import pytest
 
+from lnbits.core.models import Payment, Wallet
+from lnbits.core.models.wallets import (
+    WalletExtra,
+    WalletPermission,
+    WalletSharePermission,
+    WalletShareStatus,
+)
 from lnbits.db import (
     dict_to_model,
+    insert_many_queries,
+    insert_many_query,
     insert_query,
     model_to_dict,
     update_query,
@@ -36,6 +45,37 @@ async def test_helpers_insert_query():
     )
 
 
+@pytest.mark.anyio
+async def test_helpers_insert_many_query():
+    other = DbTestModel(id=5, name="other", value="othervalue")
+    q, values = insert_many_query(
+        "test_helpers_query", [DbTestModel(id=3, name="myname", value="v"), other]
+    )
+    assert q == (
+        """INSERT INTO test_helpers_query ("id", "name", "value") """
+        "VALUES (:id_0, :name_0, :value_0), (:id_1, :name_1, :value_1)"
+    )
+    assert values == {
+        "id_0": 3,
+        "name_0": "myname",
+        "value_0": "v",
+        "id_1": 5,
+        "name_1": "other",
+        "value_1": "othervalue",
+    }
+
+
+def test_helpers_insert_many_queries():
+    models = [DbTestModel(id=i, name=f"name{i}", value="v") for i in range(5)]
+    queries = list(insert_many_queries("test_helpers_query", models, 7))
+    # 3 columns, at most 2 rows per query
+    assert [len(values) for _, values in queries] == [6, 6, 3]
+    assert queries[-1] == insert_many_query("test_helpers_query", models[4:])
+
+    (query,) = insert_many_queries("test_helpers_query", models)
+    assert query == insert_many_query("test_helpers_query", models)
+
+
 @pytest.mark.anyio
 async def test_helpers_update_query():
     q = update_query("test_helpers_query", test_data)
@@ -83,3 +123,53 @@ async def test_helpers_dict_to_model():
     assert m.active is True
     assert type(m.child) is DbTestModel2
     assert type(m.child.child) is DbTestModel
+
+
+@pytest.mark.anyio
+async def test_helpers_dict_to_model_trusted():
+    m = dict_to_model(test_dict, DbTestModel3, trusted=True)
+    assert m == test_data
+    assert type(m.child) is DbTestModel2
+    assert type(m.child.child_list[0]) is DbTestModel
+    assert type(m.children[0]) is DbTestModel
+
+
+@pytest.mark.anyio
+async def test_helpers_dict_to_model_trusted_matches_validated():
+    wallet = Wallet(
+        id="wallet_id",
+        user="user_id",
+        name="wallet",
+        adminkey="adminkey",
+        inkey="inkey",
+        extra=WalletExtra(
+            shared_with=[
+                WalletSharePermission(
+                    username="alice",
+                    permissions=[WalletPermission.VIEW_PAYMENTS],
+                    status=WalletShareStatus.APPROVED,
+                )
+            ]
+        ),
+    )
+    payment = Payment(
+        checking_id="checking_id",
+        payment_hash="payment_hash",
+        wallet_id="wallet_id",
+        amount=1000,
+        fee=0,
+        bolt11="bolt11",
+        extra={"fiat_payment_request": "fiat"},
+        labels=["a", "b"],
+    )
+    for model in (wallet, payment):
+        row = model_to_dict(model)
+        trusted = dict_to_model(row, type(model), trusted=True)
+        assert trusted == dict_to_model(row, type(model))
+
+    trusted_wallet = dict_to_model(model_to_dict(wallet), Wallet, trusted=True)
+    assert trusted_wallet.extra.shared_with[0].permissions == [
+        WalletPermission.VIEW_PAYMENTS
+    ]
+    trusted_payment = dict_to_model(model_to_dict(payment), Payment, trusted=True)
+    assert trusted_payment.payment_request == "fiat"
@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+from httpx import ASGITransport, AsyncClient
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.models import AuditEntry
+from lnbits.middleware import AuditMiddleware, InstalledExtensionMiddleware
+from lnbits.settings import Settings
+
+
+def _audited_app(queue: asyncio.Queue) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/v1/items/{item_id}")
+    async def create_item(item_id: str, payload: dict):
+        return JSONResponse({"item_id": item_id}, status_code=400)
+
+    @app.get("/api/v1/stream")
+    async def stream():
+        async def _chunks():
+            for i in range(3):
+                yield f"chunk {i}\n"
+
+        return StreamingResponse(_chunks(), status_code=503)
+
+    app.add_middleware(AuditMiddleware, audit_queue=queue)
+    return app
+
+
+@pytest.mark.anyio
+async def test_audit_middleware_records_request(
+    settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "lnbits_audit_log_request_body", True)
+    mocker.patch.object(settings, "lnbits_audit_max_body_size", 10)
+    mocker.patch.object(settings, "lnbits_audit_http_methods", ["POST", "GET"])
+    queue: asyncio.Queue[AuditEntry] = asyncio.Queue()
+    transport = ASGITransport(app=_audited_app(queue))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.post(
+            "/api/v1/items/abc?expand=1", json={"name": "a long item name"}
+        )
+        assert response.status_code == 400
+
+        response = await client.get("/api/v1/stream")
+        assert response.text == "chunk 0\nchunk 1\nchunk 2\n"
+
+    entry = queue.get_nowait()
+    assert entry.path == "/api/v1/items/{item_id}"
+    assert entry.request_method == "POST"
+    assert entry.response_code == "400"
+    assert entry.duration > 0
+    assert entry.request_details
+    details = json.loads(entry.request_details)
+    assert details["path_params"] == {"item_id": "abc"}
+    assert details["query_params"] == {"expand": "1"}
+    assert details["body"] == '{"name": "'[:10]
+
+    entry = queue.get_nowait()
+    assert entry.path == "/api/v1/stream"
+    assert entry.response_code == "503"
+    assert queue.empty()
+
+
+@pytest.mark.anyio
+async def test_audit_middleware_skips_unaudited_requests(
+    settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "lnbits_audit_http_methods", ["POST"])
+    queue: asyncio.Queue[AuditEntry] = asyncio.Queue()
+    transport = ASGITransport(app=_audited_app(queue))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/api/v1/stream")
+        assert response.status_code == 503
+
+    assert queue.empty()
+
+
+def _extensions_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/{full_path:path}")
+    async def echo(full_path: str):
+        return {"path": f"/{full_path}"}
+
+    app.add_middleware(InstalledExtensionMiddleware)
+    return app
+
+
+@pytest.mark.anyio
+async def test_installed_extension_middleware(
+    settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "lnbits_deactivated_extensions", {"disabled"})
+    mocker.patch.object(settings, "lnbits_upgraded_extensions", {"upgraded": "abc"})
+    mocker.patch.object(settings, "lnbits_extensions_redirects", [])
+    mocker.patch.object(settings, "lnbits_installed_extensions_ids", set())
+    settings.activate_extension_paths(
+        "lnurlp",
+        ext_redirects=[
+            {"from_path": "/.well-known/lnurlp", "redirect_to_path": "/api/v1/wk"}
+        ],
+    )
+    transport = ASGITransport(app=_extensions_app())
+    try:
+        async with AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/.well-known/lnurlp/alice")
+            assert response.json() == {"path": "/lnurlp/api/v1/wk/alice"}
+
+            response = await client.get("/upgraded/api/v1/links")
+            assert response.json() == {"path": "/upgrades/abc/upgraded/api/v1/links"}
+
+            response = await client.get("/upgraded/static/logo.png")
+            assert response.json() == {"path": "/upgraded/static/logo.png"}
+
+            response = await client.get("/disabled/api/v1/links")
+            assert response.status_code == 404
+            assert response.json() == {"detail": "Extension 'disabled' disabled"}
+
+            response = await client.get("/api/v1/wallet")
+            assert response.json() == {"path": "/api/v1/wallet"}
+    finally:
+        # rebuilt from the restored settings
+        settings.extension_routes_changed()
@@ -0,0 +1,170 @@
+import asyncio
+from time import perf_counter
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.middleware import AuditMiddleware, InstalledExtensionMiddleware
+from lnbits.settings import RedirectPath, Settings
+
+REQUESTS = 500
+
+
+def _app(audit_queue: asyncio.Queue | None) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/v1/items/{item_id}")
+    async def create_item(item_id: str, payload: dict):
+        return {"item_id": item_id}
+
+    if audit_queue is not None:
+        app.add_middleware(AuditMiddleware, audit_queue=audit_queue)
+    return app
+
+
+async def _requests_per_second(app: FastAPI) -> float:
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        # warm up
+        for _ in range(20):
+            await client.post("/api/v1/items/abc", json={"name": "item"})
+        start = perf_counter()
+        for _ in range(REQUESTS):
+            await client.post("/api/v1/items/abc", json={"name": "item"})
+        return REQUESTS / (perf_counter() - start)
+
+
+@pytest.mark.anyio
+async def test_audit_middleware_queues_requests(
+    settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "lnbits_audit_http_response_codes", [])
+    mocker.patch.object(settings, "lnbits_audit_log_request_body", True)
+    queue: asyncio.Queue = asyncio.Queue()
+    transport = ASGITransport(app=_app(queue))
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        for _ in range(10):
+            response = await client.post("/api/v1/items/abc", json={"name": "item"})
+            assert response.json() == {"item_id": "abc"}
+    assert queue.qsize() == 10
+
+
+@pytest.mark.anyio
+@pytest.mark.benchmark
+async def test_benchmark_audit_middleware(settings: Settings, mocker: MockerFixture):
+    """Requests per second without and with auditing every request."""
+    mocker.patch.object(settings, "lnbits_audit_http_response_codes", [])
+    mocker.patch.object(settings, "lnbits_audit_log_request_body", True)
+    queue: asyncio.Queue = asyncio.Queue()
+
+    audit_off = await _requests_per_second(_app(None))
+    audit_on = await _requests_per_second(_app(queue))
+
+    assert queue.qsize() == REQUESTS + 20
+    print(
+        f"\naudit middleware: {audit_on:.0f} req/s with audit, "
+        f"{audit_off:.0f} req/s without ({audit_on / audit_off:.0%})"
+    )
+    assert audit_on > audit_off * 0.3
+
+
+EXTENSIONS = 150
+
+
+def _extension_settings(settings: Settings, mocker: MockerFixture) -> None:
+    ids = [f"ext{i}" for i in range(EXTENSIONS)]
+    mocker.patch.object(settings, "lnbits_deactivated_extensions", set(ids[:20]))
+    mocker.patch.object(
+        settings, "lnbits_upgraded_extensions", dict.fromkeys(ids[20:40], "hash")
+    )
+    mocker.patch.object(
+        settings,
+        "lnbits_extensions_redirects",
+        [
+            RedirectPath(
+                ext_id=ext_id,
+                from_path=f"/.well-known/{ext_id}",
+                redirect_to_path="/api/v1/well-known",
+                header_filters={"accept": "application/json"},
+            )
+            for ext_id in ids
+        ],
+    )
+    settings.extension_routes_changed()
+
+
+def _linear_lookup(settings: Settings, path: str, req_headers: list) -> str:
+    """The previous per request work: scan all redirect rules, then the sets."""
+    headers = [(k.decode(), v.decode()) for k, v in req_headers]
+    for redirect in settings.lnbits_extensions_redirects:
+        if redirect.redirect_matches(path, headers):
+            path = redirect.new_path_from(path)
+            break
+    top_path, *_ = (p for p in path.split("/") if p)
+    if top_path in settings.lnbits_deactivated_extensions:
+        return ""
+    if top_path in settings.lnbits_upgraded_extensions:
+        return f"/upgrades/{top_path}"
+    return path
+
+
+@pytest.mark.anyio
+async def test_extension_routes(settings: Settings, mocker: MockerFixture):
+    _extension_settings(settings, mocker)
+    headers = [(b"accept", b"application/json"), (b"host", b"lnbits.local")]
+    paths = ["/api/v1/wallet", "/ext50/api/v1/links", "/.well-known/ext99/name"]
+    routed = []
+
+    async def _app(scope, receive, send):
+        routed.append(scope["path"])
+
+    middleware = InstalledExtensionMiddleware(_app)
+    try:
+        for path in [*paths, "/ext25/api/v1/links"]:
+            scope = {"type": "http", "path": path, "headers": headers}
+            await middleware(scope, None, None)  # type: ignore[arg-type]
+    finally:
+        settings.extension_routes_changed()
+
+    expected = [_linear_lookup(settings, path, headers) for path in paths]
+    assert routed == [*expected, "/upgrades/hash/ext25/api/v1/links"]
+    assert routed[2] != paths[2]
+
+
+@pytest.mark.anyio
+@pytest.mark.benchmark
+async def test_benchmark_extension_routes(settings: Settings, mocker: MockerFixture):
+    """Per request overhead of the extension routing with many extensions."""
+    _extension_settings(settings, mocker)
+    paths = ["/api/v1/wallet", "/ext50/api/v1/links", "/.well-known/ext99/name"]
+    headers = [(b"accept", b"application/json"), (b"host", b"lnbits.local")]
+    rounds = 2000
+
+    async def _app(scope, receive, send):
+        pass
+
+    middleware = InstalledExtensionMiddleware(_app)
+    try:
+        start = perf_counter()
+        for _ in range(rounds):
+            for path in paths:
+                scope = {"type": "http", "path": path, "headers": headers}
+                await middleware(scope, None, None)  # type: ignore[arg-type]
+        compiled = (perf_counter() - start) / (rounds * len(paths))
+
+        start = perf_counter()
+        for _ in range(rounds):
+            for path in paths:
+                _linear_lookup(settings, path, headers)
+        linear = (perf_counter() - start) / (rounds * len(paths))
+    finally:
+        settings.extension_routes_changed()
+
+    print(
+        f"\nextension routing with {EXTENSIONS} extensions: "
+        f"{compiled * 1_000_000:.1f}us/request compiled, "
+        f"{linear * 1_000_000:.1f}us/request scanning all rules"
+    )
+    assert compiled < linear
@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+from uuid import uuid4
+
+import httpx
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.crud import get_webhook_delivery
+from lnbits.core.crud.webhooks import (
+    get_due_webhook_deliveries,
+    replay_failed_webhook_deliveries,
+)
+from lnbits.core.models import Payment, Wallet, WebhookDeliveryStatus
+from lnbits.core.services import notifications
+from lnbits.core.services.notifications import (
+    WebhookOutbox,
+    dispatch_webhook,
+    notification_http_client,
+    send_payment_notification,
+    send_payment_push_notification,
+)
+from lnbits.settings import Settings
+
+MODULE = "lnbits.core.services.notifications"
+
+
+def _wallet() -> Wallet:
+    return Wallet(id="wallet", user="user", name="wallet", adminkey="a", inkey="i")
+
+
+def _payment(webhook: str | None = None, payment_hash="payment_hash") -> Payment:
+    return Payment(
+        checking_id=payment_hash,
+        payment_hash=payment_hash,
+        wallet_id="wallet",
+        amount=1000,
+        fee=0,
+        bolt11="lnbc1",
+        webhook=webhook,
+    )
+
+
+async def _drain_payment_notifications():
+    """Wait for notifications that earlier tests sent in the background."""
+    pending = [
+        task
+        for task in asyncio.all_tasks()
+        if task.get_coro().__name__ == "send_payment_notification"
+    ]
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+@pytest.mark.anyio
+async def test_payment_notification_channels_run_concurrently(mocker: MockerFixture):
+    async def _slow(*_):
+        await asyncio.sleep(0.2)
+
+    await _drain_payment_notifications()
+    for name in [
+        "send_ws_payment_notification",
+        "send_chat_payment_notification",
+        "dispatch_webhook",
+    ]:
+        mocker.patch(f"{MODULE}.{name}", AsyncMock(side_effect=_slow))
+    mocker.patch(
+        f"{MODULE}.send_payment_push_notification",
+        AsyncMock(side_effect=ValueError("push failed")),
+    )
+    stats: dict = {}
+    mocker.patch(f"{MODULE}.notification_stats", stats)
+
+    start = time.monotonic()
+    await send_payment_notification(_wallet(), _payment(webhook="https://a.b"))
+    assert time.monotonic() - start < 0.4
+
+    assert stats["websocket"].sent == 1
+    assert stats["chat"].sent == 1
+    assert stats["webhook"].sent == 1
+    assert stats["push"].failed == 1
+    assert stats["chat"].avg_seconds > 0.15
+    assert stats["chat"].max_seconds > 0.15
+
+
+@pytest.mark.anyio
+async def test_push_notifications_run_off_the_event_loop(mocker: MockerFixture):
+    subscriptions = [
+        SimpleNamespace(data="{}", host="lnbits.local", endpoint=f"e{i}")
+        for i in range(3)
+    ]
+    mocker.patch(
+        f"{MODULE}.get_webpush_subscriptions_for_user",
+        AsyncMock(return_value=subscriptions),
+    )
+    threads: list[str] = []
+
+    def _webpush(*_):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.2)
+
+    mocker.patch(f"{MODULE}.webpush", _webpush)
+
+    ticks = 0
+
+    async def _tick():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(_tick())
+    start = time.monotonic()
+    await send_payment_push_notification(_wallet(), _payment())
+    elapsed = time.monotonic() - start
+    ticker.cancel()
+
+    assert len(threads) == 3
+    assert all(name.startswith("webpush") for name in threads)
+    # sent in parallel and the event loop kept running meanwhile
+    assert elapsed < 0.5
+    assert ticks > 5
+
+
+@pytest.mark.anyio
+async def test_notification_http_client_is_shared():
+    client = notification_http_client()
+    assert notification_http_client() is client
+    await notifications.close_notification_http_client()
+    assert client.is_closed
+    assert notification_http_client() is not client
+
+
+def _http_client(mocker: MockerFixture, responses: list) -> Mock:
+    client = Mock()
+    client.post = AsyncMock(side_effect=responses)
+    mocker.patch(f"{MODULE}.notification_http_client", return_value=client)
+    return client
+
+
+@pytest.mark.anyio
+async def test_webhook_outbox_retries(app, settings: Settings, mocker: MockerFixture):
+    mocker.patch.object(settings, "webhook_retry_base_seconds", 0)
+    mocker.patch.object(settings, "webhook_max_attempts", 3)
+    mocker.patch.object(notifications, "webhook_outbox", WebhookOutbox())
+    client = _http_client(
+        mocker,
+        [
+            httpx.ConnectError("refused"),
+            httpx.Response(503),
+            httpx.Response(200),
+        ],
+    )
+    payment = _payment("https://example.com/hook", payment_hash=uuid4().hex)
+
+    await dispatch_webhook(payment)
+    (delivery,) = [
+        d
+        for d in await get_due_webhook_deliveries(100)
+        if d.payment_hash == payment.payment_hash
+    ]
+    assert delivery.status == WebhookDeliveryStatus.PENDING
+    assert delivery.attempts == 1
+    assert delivery.last_status == "-1"
+    assert delivery.last_error == "refused"
+
+    await notifications.webhook_outbox.deliver(delivery)
+    assert delivery.last_status == "503"
+    await notifications.webhook_outbox.deliver(delivery)
+
+    delivery = await get_webhook_delivery(delivery.id)
+    assert delivery
+    assert delivery.status == WebhookDeliveryStatus.SENT
+    assert delivery.attempts == 3
+    assert delivery.last_status == "200"
+    assert client.post.await_count == 3
+    assert client.post.call_args.kwargs["json"] == payment.json()
+
+
+@pytest.mark.anyio
+async def test_webhook_outbox_fails_and_replays(
+    app, settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "webhook_retry_base_seconds", 60)
+    outbox = WebhookOutbox()
+    _http_client(mocker, [httpx.Response(404), httpx.Response(204)])
+    delivery = await outbox.enqueue(
+        _payment("https://example.com/gone", payment_hash=uuid4().hex)
+    )
+
+    # client errors are not retried
+    await outbox.deliver(delivery)
+    assert delivery.status == WebhookDeliveryStatus.FAILED
+    assert delivery.attempts == 1
+
+    assert await replay_failed_webhook_deliveries() >= 1
+    delivery = await get_webhook_delivery(delivery.id)
+    assert delivery
+    assert delivery.status == WebhookDeliveryStatus.PENDING
+    assert delivery.attempts == 0
+
+    await outbox.replay(delivery)
+    assert delivery.status == WebhookDeliveryStatus.SENT
+
+
+@pytest.mark.anyio
+async def test_webhook_outbox_claims_deliveries(app, mocker: MockerFixture):
+    async def _post(url: str, **_):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    client = _http_client(mocker, [])
+    client.post.side_effect = _post
+    delivery = await WebhookOutbox().enqueue(
+        _payment("https://example.com/once", payment_hash=uuid4().hex)
+    )
+    # not picked up by `run` while the first attempt is made
+    due = await get_due_webhook_deliveries(1000)
+    assert delivery.id not in [d.id for d in due]
+
+    # two workers attempting the same delivery
+    await asyncio.gather(
+        WebhookOutbox().deliver(delivery), WebhookOutbox().deliver(delivery.copy())
+    )
+    assert client.post.await_count == 1
+    stored = await get_webhook_delivery(delivery.id)
+    assert stored
+    assert stored.status == WebhookDeliveryStatus.SENT
+    assert stored.attempts == 1
+
+
+@pytest.mark.anyio
+async def test_webhook_outbox_limits_requests_per_host(
+    app, settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "webhook_max_concurrency_per_host", 2)
+    running: dict[str, int] = {}
+    peak: dict[str, int] = {}
+
+    async def _post(url: str, **_):
+        host = httpx.URL(url).host
+        running[host] = running.get(host, 0) + 1
+        peak[host] = max(peak.get(host, 0), running[host])
+        await asyncio.sleep(0.05)
+        running[host] -= 1
+        return httpx.Response(200)
+
+    client = _http_client(mocker, [])
+    client.post.side_effect = _post
+    outbox = WebhookOutbox()
+    deliveries = [
+        await outbox.enqueue(_payment(f"https://{host}/hook", uuid4().hex))
+        for host in ["a.example.com"] * 5 + ["b.example.com"] * 5
+    ]
+    await asyncio.gather(*[outbox.deliver(d) for d in deliveries])
+
+    assert peak == {"a.example.com": 2, "b.example.com": 2}
+    assert all(d.status == WebhookDeliveryStatus.SENT for d in deliveries)
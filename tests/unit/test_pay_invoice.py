@@ -10,6 +10,7 @@ from pytest_mock.plugin import MockerFixture
 
 from lnbits.core.crud import create_wallet, get_standalone_payment, get_wallet
 from lnbits.core.crud.payments import get_payment, get_payments_paginated
+from lnbits.core.db import db as core_db
 from lnbits.core.models import PaymentState, Wallet
 from lnbits.core.services import create_invoice, create_user_account, pay_invoice
 from lnbits.core.services.payments import update_wallet_balance
@@ -705,3 +706,105 @@ async def test_get_payments_for_non_user():
     assert (
         user_payments.total == 0
     ), "No payments should be found for non-existent user."
+
+
+@pytest.mark.anyio
+async def test_concurrent_internal_payments_never_overdraw(to_wallet: Wallet):
+    user = await create_user_account()
+    payer = await create_wallet(user_id=user.id)
+    await update_wallet_balance(payer, 1000)
+
+    invoices = [
+        await create_invoice(wallet_id=to_wallet.id, amount=300, memo=f"stress {i}")
+        for i in range(10)
+    ]
+    results = await asyncio.gather(
+        *[
+            pay_invoice(wallet_id=payer.id, payment_request=invoice.bolt11)
+            for invoice in invoices
+        ],
+        return_exceptions=True,
+    )
+
+    paid = [r for r in results if not isinstance(r, Exception)]
+    errors = [r for r in results if isinstance(r, Exception)]
+    assert len(paid) == 3
+    assert all(isinstance(e, PaymentError) for e in errors)
+
+    payer_after = await get_wallet(payer.id)
+    assert payer_after
+    assert payer_after.balance == 100
+
+
+@pytest.mark.anyio
+async def test_concurrent_payments_of_same_invoice(to_wallet: Wallet):
+    user = await create_user_account()
+    payer = await create_wallet(user_id=user.id)
+    await update_wallet_balance(payer, 1000)
+
+    invoice = await create_invoice(wallet_id=to_wallet.id, amount=100, memo="twice")
+    results = await asyncio.gather(
+        *[
+            pay_invoice(wallet_id=payer.id, payment_request=invoice.bolt11)
+            for _ in range(5)
+        ],
+        return_exceptions=True,
+    )
+
+    assert len([r for r in results if not isinstance(r, Exception)]) == 1
+    payer_after = await get_wallet(payer.id)
+    assert payer_after
+    assert payer_after.balance == 900
+
+
+@pytest.mark.anyio
+async def test_concurrent_external_payments_in_pool_mode(
+    app, mocker: MockerFixture, external_funding_source: FakeWallet
+):
+    # "pool" concurrency: no global lock, the balance checks must hold on their own
+    url = core_db.engine.url.render_as_string(hide_password=False)
+    pooled_engine = core_db._create_pooled_engine(url)
+    mocker.patch.object(core_db, "concurrency", "pool")
+    mocker.patch.object(core_db, "engine", pooled_engine)
+
+    async def _pay(bolt11: str, *_, **__) -> PaymentResponse:
+        await asyncio.sleep(0.01)
+        payment_hash = bolt11_decode(bolt11).payment_hash
+        return PaymentResponse(ok=True, checking_id=payment_hash, preimage="0" * 64)
+
+    mocker.patch("lnbits.wallets.FakeWallet.pay_invoice", AsyncMock(side_effect=_pay))
+    mocker.patch(
+        "lnbits.core.services.payments.send_payment_notification_in_background"
+    )
+
+    payers = []
+    for _ in range(20):
+        user = await create_user_account()
+        payer = await create_wallet(user_id=user.id)
+        await update_wallet_balance(payer, 1000)
+        payers.append(payer)
+
+    async def _pay_five(payer: Wallet) -> list:
+        invoices = [await external_funding_source.create_invoice(300) for _ in range(5)]
+        return await asyncio.gather(
+            *[
+                pay_invoice(wallet_id=payer.id, payment_request=invoice.payment_request)
+                for invoice in invoices
+                if invoice.payment_request
+            ],
+            return_exceptions=True,
+        )
+
+    try:
+        results = await asyncio.gather(*[_pay_five(payer) for payer in payers])
+    finally:
+        await pooled_engine.dispose()
+
+    for payer, payer_results in zip(payers, results, strict=True):
+        errors = [r for r in payer_results if isinstance(r, Exception)]
+        assert all(isinstance(e, PaymentError) for e in errors), errors
+        # 3 x 300 sat and their fee reserve fit into 1000 sat, the 4th does not
+        assert len(payer_results) - len(errors) == 3
+        payer_after = await get_wallet(payer.id)
+        assert payer_after
+        assert payer_after.balance == 100
@@ -0,0 +1,221 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, Mock
+from uuid import uuid4
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.crud import create_payment, create_wallet, get_standalone_payment
+from lnbits.core.crud.settings import get_settings_field, set_settings_field
+from lnbits.core.models import CreatePayment, Payment, PaymentState
+from lnbits.core.services import create_user_account, update_wallet_balance
+from lnbits.core.services.payments import (
+    _PendingPaymentsCheckRun,
+    _RateLimiter,
+    check_pending_payments,
+    pending_payments_check,
+    poll_pending_payment,
+)
+from lnbits.settings import Settings
+from lnbits.wallets.base import (
+    PaymentFailedStatus,
+    PaymentPendingStatus,
+    PaymentSuccessStatus,
+)
+from lnbits.wallets.fake import FakeWallet
+from lnbits.wallets.lndrest import LndRestWallet
+
+
+async def _pending_payments(
+    wallet_id: str, amounts: list[int], expiry: datetime | None = None
+) -> list[Payment]:
+    payments = []
+    for amount in amounts:
+        payment_hash = f"pending_check_{uuid4().hex}"
+        payment = await create_payment(
+            checking_id=payment_hash,
+            data=CreatePayment(
+                wallet_id=wallet_id,
+                payment_hash=payment_hash,
+                bolt11=f"bolt11_{payment_hash}",
+                amount_msat=amount,
+                memo="pending check",
+                expiry=expiry,
+            ),
+        )
+        payments.append(payment)
+    return payments
+
+
+@pytest.mark.anyio
+async def test_pending_check_batch_and_single(
+    app, settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "pending_check_concurrency", 3)
+    mocker.patch.object(settings, "pending_check_rate_limit", 0)
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    await update_wallet_balance(wallet, 100)
+    incoming = await _pending_payments(wallet.id, [1000, 2000])
+    outgoing = await _pending_payments(wallet.id, [-3000, -4000, -5000])
+    batch_resolved = outgoing[0].checking_id
+
+    checked: list[str] = []
+
+    async def _single_status(checking_id: str):
+        checked.append(checking_id)
+        return PaymentFailedStatus()
+
+    batch = AsyncMock(return_value={batch_resolved: PaymentSuccessStatus(fee_msat=0)})
+    mocker.patch.object(FakeWallet, "get_payment_statuses", batch)
+    single = AsyncMock(side_effect=_single_status)
+    mocker.patch.object(FakeWallet, "get_payment_status", single)
+    mocker.patch.object(FakeWallet, "get_invoice_status", single)
+
+    run = _PendingPaymentsCheckRun(outgoing[::-1] + incoming)
+    await run.check_all()
+
+    batch.assert_awaited_once()
+    assert sorted(batch.call_args.args[0]) == sorted(p.checking_id for p in outgoing)
+    assert batch.call_args.kwargs["created_after"] == min(
+        p.created_at for p in outgoing
+    )
+    # the batch resolved payment is not checked again
+    # (background tasks may check other payments meanwhile)
+    ours = {p.checking_id for p in outgoing + incoming}
+    assert {c for c in checked if c in ours} == ours - {batch_resolved}
+
+    payment = await get_standalone_payment(batch_resolved)
+    assert payment
+    assert payment.status == PaymentState.SUCCESS
+    for p in outgoing[1:] + incoming:
+        payment = await get_standalone_payment(p.checking_id)
+        assert payment
+        assert payment.status == PaymentState.FAILED
+
+    assert pending_payments_check.total == 5
+    assert pending_payments_check.checked == 5
+    assert pending_payments_check.batched == 1
+    assert pending_payments_check.success == 1
+    assert pending_payments_check.failed == 4
+    assert pending_payments_check.finished_at
+
+
+@pytest.mark.anyio
+async def test_pending_check_saves_progress(
+    app, settings: Settings, mocker: MockerFixture
+):
+    mocker.patch.object(settings, "pending_check_concurrency", 1)
+    mocker.patch.object(settings, "pending_check_rate_limit", 0)
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    payments = await _pending_payments(wallet.id, [1000, 2000, 3000])
+    mocker.patch.object(
+        FakeWallet, "get_invoice_status", AsyncMock(return_value=PaymentFailedStatus())
+    )
+
+    run = _PendingPaymentsCheckRun(payments)
+    run.save_every = 2
+    await run.check_all()
+
+    progress = await get_settings_field("progress", tag="pending_check")
+    assert progress
+    assert progress.value[-1] == payments[2].checking_id
+
+
+@pytest.mark.anyio
+async def test_rate_limiter():
+    limiter = _RateLimiter(50)
+    start = time.monotonic()
+    for _ in range(6):
+        await limiter.wait()
+    # the first call does not wait, timers can fire slightly early
+    assert time.monotonic() - start >= 4 / 50
+
+    unlimited = _RateLimiter(0)
+    start = time.monotonic()
+    for _ in range(100):
+        await unlimited.wait()
+    assert time.monotonic() - start < 0.05
+
+
+@pytest.mark.anyio
+async def test_pending_check_skips_replayed_invoices(app, mocker: MockerFixture):
+    # start a fresh check, not the one saved by the previous test
+    await set_settings_field("progress", None, tag="pending_check")
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    now = datetime.now(timezone.utc)
+    (unexpired,) = await _pending_payments(
+        wallet.id, [1000], expiry=now + timedelta(hours=1)
+    )
+    (expired,) = await _pending_payments(
+        wallet.id, [1000], expiry=now - timedelta(hours=1)
+    )
+    (outgoing,) = await _pending_payments(wallet.id, [-1000])
+
+    run = mocker.patch("lnbits.core.services.payments._PendingPaymentsCheckRun")
+    run.return_value.check_all = AsyncMock()
+    mocker.patch.object(FakeWallet, "resumable_invoice_stream", True)
+    await check_pending_payments()
+
+    checked = {p.checking_id for p in run.call_args.args[0]}
+    assert unexpired.checking_id not in checked
+    assert expired.checking_id in checked
+    assert outgoing.checking_id in checked
+
+
+@pytest.mark.anyio
+async def test_poll_pending_payment_coalesced(app, mocker: MockerFixture):
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    (payment,) = await _pending_payments(wallet.id, [1000])
+
+    async def _status(_):
+        await asyncio.sleep(0.1)
+        return PaymentPendingStatus()
+
+    status = AsyncMock(side_effect=_status)
+    mocker.patch.object(FakeWallet, "get_invoice_status", status)
+
+    polls = await asyncio.gather(*[poll_pending_payment(payment) for _ in range(5)])
+
+    status.assert_awaited_once()
+    assert all(p.checking_id == payment.checking_id for p in polls)
+
+
+@pytest.mark.anyio
+async def test_lndrest_payment_statuses_scan_is_bounded():
+    pages: list[dict] = []
+
+    async def _list_payments(_, params: dict):
+        pages.append(params)
+        # a long history that never contains the unknown payment
+        offset = params["index_offset"] or 100_000
+        payments = [{"payment_hash": "known", "status": "SUCCEEDED"}] * (
+            len(pages) == 1
+        )
+        return Mock(
+            raise_for_status=Mock(),
+            json=Mock(
+                return_value={
+                    "payments": payments or [{"payment_hash": "other"}],
+                    "first_index_offset": offset - 1000,
+                }
+            ),
+        )
+
+    wallet = LndRestWallet.__new__(LndRestWallet)
+    wallet.client = Mock(get=AsyncMock(side_effect=_list_payments))
+    created_after = datetime.now(timezone.utc) - timedelta(days=1)
+
+    statuses = await wallet.get_payment_statuses(
+        ["known", "unknown"], created_after=created_after
+    )
+    assert statuses.keys() == {"known"}
+    assert statuses["known"].success
+    assert len(pages) == wallet.list_payments_max_pages
+    start = int(created_after.timestamp()) - wallet.list_payments_clock_skew
+    assert all(page["creation_date_start"] == start for page in pages)
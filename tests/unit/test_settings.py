@@ -1,6 +1,6 @@
 import pytest
 
-from lnbits.settings import RedirectPath
+from lnbits.settings import ExtensionRouteMatcher, RedirectPath, Settings
 
 lnurlp_redirect_path = {
     "from_path": "/.well-known/lnurlp",
@@ -166,3 +166,52 @@ def test_redirect_path_new_path_from(lnurlp: RedirectPath):
         lnurlp.new_path_from("/.well-known/lnurlp/path/more")
         == "/lnurlp/api/v1/well-known/path/more"
     )
+
+
+def test_extension_route_matcher_find_redirect(
+    lnurlp_with_headers: RedirectPath, nostrrelay: RedirectPath
+):
+    other = RedirectPath(ext_id="other", from_path="/other", redirect_to_path="/api")
+    matcher = ExtensionRouteMatcher(set(), {}, [lnurlp_with_headers, nostrrelay, other])
+    nostr_headers = [(b"accept", b"application/nostr+json")]
+
+    assert matcher.find_redirect("/", nostr_headers) == nostrrelay
+    assert matcher.find_redirect("/", []) is None
+    assert (
+        matcher.find_redirect("/.well-known/lnurlp/name", nostr_headers)
+        == lnurlp_with_headers
+    )
+    assert matcher.find_redirect("/.well-known/lnurlp/name", []) is None
+    assert matcher.find_redirect("/other/path", []) == other
+    assert matcher.find_redirect("/others", []) is None
+    assert matcher.find_redirect("/api/v1/wallet", nostr_headers) is None
+
+
+def test_extension_route_matcher_rebuilt_on_change(lnurlp: RedirectPath):
+    settings = Settings()
+    matcher = settings.extension_route_matcher()
+    assert settings.extension_route_matcher() is matcher
+    assert settings.find_extension_redirect("/.well-known/lnurlp", []) is None
+
+    settings.activate_extension_paths("lnurlp", "upgrade_hash", [lnurlp_redirect_path])
+    matcher = settings.extension_route_matcher()
+    assert matcher.upgraded == {"lnurlp": "upgrade_hash"}
+    assert settings.find_extension_redirect("/.well-known/lnurlp", []) == lnurlp
+
+    settings.deactivate_extension_paths("lnurlp")
+    assert settings.extension_route_matcher() is not matcher
+    assert "lnurlp" in settings.extension_route_matcher().deactivated
+    assert settings.find_extension_redirect("/.well-known/lnurlp", []) is None
+
+
+def test_audit_patterns_follow_settings():
+    settings = Settings()
+    settings.lnbits_audit_include_paths = [".*api/v1/.*"]
+    settings.lnbits_audit_exclude_paths = ["/api/v1/health", "["]
+    assert settings._is_http_request_path_auditable("/api/v1/wallet")
+    assert not settings._is_http_request_path_auditable("/api/v1/health")
+    assert not settings._is_http_request_path_auditable("/wallet")
+
+    settings.lnbits_audit_include_paths = ["/wallet"]
+    assert settings._is_http_request_path_auditable("/wallet")
+    assert not settings._is_http_request_path_auditable("/api/v1/wallet")
@@ -0,0 +1,46 @@
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core import core_app_extra
+from lnbits.core.crud import (
+    get_settings_version,
+    increment_settings_version,
+    update_admin_settings,
+)
+from lnbits.core.crud.settings import set_settings_field
+from lnbits.core.services.settings import SettingsWatcher
+from lnbits.settings import EditableSettings, Settings
+
+
+@pytest.mark.anyio
+async def test_settings_version(app):
+    version = await get_settings_version()
+    assert await increment_settings_version() == version + 1
+    await update_admin_settings(EditableSettings(lnbits_site_title="Title"))
+    assert await get_settings_version() == version + 2
+
+
+@pytest.mark.anyio
+async def test_settings_watcher_reloads(app, settings: Settings, mocker: MockerFixture):
+    ratelimiter = mocker.patch.object(core_app_extra, "register_new_ratelimiter")
+    watcher = SettingsWatcher()
+    assert not await watcher.check()
+    title = settings.lnbits_site_title
+    settings_version = settings.settings_version
+
+    # changed by another worker
+    await set_settings_field("lnbits_site_title", "Changed Title")
+    assert not await watcher.check()
+    await increment_settings_version()
+    try:
+        assert await watcher.check()
+        assert settings.lnbits_site_title == "Changed Title"
+        assert settings.settings_version > settings_version
+        ratelimiter.assert_called_once()
+        stats = watcher.stats()
+        assert stats.reloads == 1
+        assert stats.version == await get_settings_version()
+        assert not await watcher.check()
+    finally:
+        await set_settings_field("lnbits_site_title", title)
+        settings.lnbits_site_title = title
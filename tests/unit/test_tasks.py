@@ -0,0 +1,262 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock
+from uuid import uuid4
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.crud import create_wallet, get_standalone_payment, get_wallet
+from lnbits.core.crud.settings import get_settings_field, set_settings_field
+from lnbits.core.crud.tasks import acquire_task_lease, get_task_leases
+from lnbits.core.models import PaymentState
+from lnbits.core.services import create_invoice, create_user_account
+from lnbits.settings import Settings
+from lnbits.tasks import (
+    SettledPaymentsRelay,
+    SingletonTasks,
+    _next_invoice_batch,
+    _save_invoice_stream_cursor,
+    get_invoice_dispatch_stats,
+    invoice_callback_batch_dispatcher,
+    invoice_listener,
+    invoice_listener_stats,
+    invoice_listeners,
+    register_invoice_listener,
+    register_payment_waiter,
+    restore_invoice_stream_cursor,
+    unregister_payment_waiter,
+)
+
+
+@pytest.mark.anyio
+async def test_next_invoice_batch(settings: Settings, monkeypatch):
+    monkeypatch.setattr(settings, "invoice_dispatch_batch_size", 4)
+    monkeypatch.setattr(settings, "invoice_dispatch_batch_wait", 0.01)
+    queue: asyncio.Queue = asyncio.Queue()
+    for checking_id in ["a", "b", "a", "c", "d", "e"]:
+        queue.put_nowait(checking_id)
+
+    assert await _next_invoice_batch(queue) == ["a", "b", "c"]
+    # waits for the batch wait time, then returns what it has
+    assert await _next_invoice_batch(queue) == ["d", "e"]
+
+
+@pytest.mark.anyio
+async def test_batch_dispatcher(app, settings: Settings, monkeypatch):
+    monkeypatch.setattr(settings, "invoice_listener_max_queue", 2)
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    payments = [
+        await create_invoice(wallet_id=wallet.id, amount=10 + i, memo=f"batch {i}")
+        for i in range(3)
+    ]
+
+    slow_queue: asyncio.Queue = asyncio.Queue()
+    register_invoice_listener(slow_queue, "test_batch_dispatcher")
+    try:
+        await invoice_callback_batch_dispatcher(
+            [payment.checking_id for payment in payments] + ["unknown"]
+        )
+        stats = next(
+            s
+            for s in get_invoice_dispatch_stats().listeners
+            if s.name == "test_batch_dispatcher"
+        )
+    finally:
+        invoice_listeners.pop("test_batch_dispatcher")
+        invoice_listener_stats.pop("test_batch_dispatcher")
+
+    for payment in payments:
+        settled = await get_standalone_payment(payment.checking_id)
+        assert settled
+        assert settled.status == PaymentState.SUCCESS
+
+    wallet_after = await get_wallet(wallet.id)
+    assert wallet_after
+    assert wallet_after.balance == 10 + 11 + 12
+
+    # the slow listener does not block the dispatcher, it misses a payment
+    assert slow_queue.qsize() == 2
+    assert stats.delivered == 2
+    assert stats.dropped == 1
+    assert stats.peak_queued == 2
+
+
+@pytest.mark.anyio
+async def test_settled_payments_relay(app, mocker: MockerFixture):
+    ws = mocker.patch(
+        "lnbits.core.services.notifications.send_payment_ws_notifications",
+        AsyncMock(),
+    )
+    user = await create_user_account()
+    wallet = await create_wallet(user_id=user.id)
+    paid = await create_invoice(wallet_id=wallet.id, amount=21, memo="relay")
+    unpaid = await create_invoice(wallet_id=wallet.id, amount=42, memo="relay")
+    await invoice_callback_batch_dispatcher([paid.checking_id])
+
+    # as notified by the worker that settled the payment
+    relay = SettledPaymentsRelay()
+    waiters = [register_payment_waiter(p.payment_hash) for p in (paid, unpaid)]
+    try:
+        payload = {"origin": "other", "payment_hashes": [paid.payment_hash]}
+        relay._notified(None, 0, "", json.dumps({**payload, "origin": relay.origin}))
+        assert not relay._tasks
+        relay._notified(None, 0, "", json.dumps(payload))
+        await asyncio.gather(*relay._tasks)
+        await relay.relay([unpaid.payment_hash])
+    finally:
+        for payment, waiter in zip((paid, unpaid), waiters, strict=True):
+            unregister_payment_waiter(payment.payment_hash, waiter)
+
+    assert waiters[0].result().payment_hash == paid.payment_hash
+    assert not waiters[1].done()
+    notified = [call.args[1].payment_hash for call in ws.await_args_list]
+    assert paid.payment_hash in notified
+    assert unpaid.payment_hash not in notified
+    assert relay.stats().relayed == 1
+
+
+class ResumableStream:
+    resumable_invoice_stream = True
+
+    def __init__(self, checking_ids: list[str]):
+        self.checking_ids = checking_ids
+        self.index = 0
+        self.resumed_from: str | None = None
+
+    def invoice_stream_cursor(self) -> str | None:
+        return str(self.index) if self.index else None
+
+    def resume_invoice_stream(self, cursor: str) -> None:
+        self.resumed_from = cursor
+        self.index = int(cursor)
+
+    async def paid_invoices_stream(self):
+        while self.index < len(self.checking_ids):
+            self.index += 1
+            yield self.checking_ids[self.index - 1]
+
+
+@pytest.mark.anyio
+async def test_invoice_listener_resumes_stream(app, monkeypatch):
+    stream = ResumableStream(["a", "b", "c"])
+    queue: asyncio.Queue = asyncio.Queue()
+    monkeypatch.setattr("lnbits.tasks.get_funding_source", lambda: stream)
+    monkeypatch.setattr("lnbits.tasks.paid_invoice_queue", queue)
+    await set_settings_field("ResumableStream", "1", tag="invoice_stream")
+
+    await restore_invoice_stream_cursor(stream)  # type: ignore
+    await invoice_listener()
+
+    assert stream.resumed_from == "1"
+    assert [queue.get_nowait() for _ in range(queue.qsize())] == ["b", "c"]
+
+    # the cursor is only saved for settled invoices
+    await _save_invoice_stream_cursor(["b"])
+    cursor = await get_settings_field("ResumableStream", tag="invoice_stream")
+    assert cursor
+    assert cursor.value == "2"
+    await _save_invoice_stream_cursor(["c"])
+    cursor = await get_settings_field("ResumableStream", tag="invoice_stream")
+    assert cursor
+    assert cursor.value == "3"
+
+
+@pytest.mark.anyio
+async def test_task_lease(app):
+    name = f"task_{uuid4().hex}"
+    assert await acquire_task_lease(name, "worker_a", 60)
+    assert not await acquire_task_lease(name, "worker_b", 60)
+    # renewed by its owner
+    assert await acquire_task_lease(name, "worker_a", 60)
+
+    # expired, another worker takes over
+    assert await acquire_task_lease(name, "worker_a", -10)
+    assert await acquire_task_lease(name, "worker_b", 60)
+    assert not await acquire_task_lease(name, "worker_a", 60)
+    (lease,) = [lease for lease in await get_task_leases() if lease.name == name]
+    assert lease.owner == "worker_b"
+
+
+@pytest.mark.anyio
+async def test_singleton_tasks_failover(app):
+    name = f"task_{uuid4().hex}"
+    runs: list[str] = []
+
+    def _task(worker: str):
+        async def _run():
+            runs.append(worker)
+            await asyncio.sleep(10)
+
+        return _run
+
+    worker_a, worker_b = SingletonTasks(), SingletonTasks()
+    worker_a.register(name, _task("a"))
+    worker_b.register(name, _task("b"))
+
+    await worker_a.elect()
+    await worker_b.elect()
+    await asyncio.sleep(0.01)
+    assert runs == ["a"]
+    assert worker_a.stats().leading == [name]
+    assert worker_b.stats().leading == []
+
+    # the leader shuts down, the other worker takes over on its next election
+    await worker_a.release()
+    await worker_b.elect()
+    await asyncio.sleep(0.01)
+    assert runs == ["a", "b"]
+    assert worker_b.stats().leading == [name]
+
+    # the lease expired and was taken over, the stale leader stops the task
+    assert await acquire_task_lease(name, worker_b.owner, -10)
+    assert await acquire_task_lease(name, "worker_c", 60)
+    await worker_b.elect()
+    stats = worker_b.stats()
+    assert stats.leading == []
+    assert stats.lost == 1
+    assert stats.lease == "row"
+
+
+class _FailingLease:
+    kind = "stub"
+
+    def __init__(self, expires: bool) -> None:
+        self.expires = expires
+        self.fail = False
+
+    async def acquire(self, name: str) -> bool:
+        if self.fail:
+            raise ConnectionError("connection lost")
+        return True
+
+    async def release(self) -> None:
+        pass
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("expires", [True, False])
+async def test_singleton_tasks_renewal_fails(expires: bool):
+    async def _run():
+        await asyncio.sleep(10)
+
+    worker = SingletonTasks()
+    worker.register("first", _run)
+    worker.register("second", _run)
+    lease = _FailingLease(expires)
+    worker._lease = lease  # type: ignore[assignment]
+
+    await worker.elect()
+    assert worker.stats().leading == ["first", "second"]
+
+    lease.fail = True
+    await worker.elect()
+    if expires:
+        # row leases are kept until they would have expired
+        assert worker.stats().leading == ["first", "second"]
+    else:
+        # advisory locks are gone with the connection
+        assert worker.stats().leading == []
+        assert worker.stats().lost == 2
+    await worker.release()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from fastapi import WebSocketDisconnect
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.core.services.websockets import WebsocketConnectionManager
+from lnbits.settings import Settings
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay: float = 0):
+        self.send_delay = send_delay
+        self.sent: list[str] = []
+        self.closed = False
+        self.incoming: asyncio.Queue = asyncio.Queue()
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        await asyncio.sleep(self.send_delay)
+        self.sent.append(data)
+
+    async def receive_text(self) -> str:
+        data = await self.incoming.get()
+        if data is None:
+            raise WebSocketDisconnect()
+        return data
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+        self.incoming.put_nowait(None)
+
+
+async def _connect(manager: WebsocketConnectionManager, item_id: str, socket):
+    conn = await manager.connect(item_id, socket)
+    listener = asyncio.create_task(manager.listen(conn))
+    return conn, listener
+
+
+@pytest.mark.anyio
+async def test_websocket_index():
+    manager = WebsocketConnectionManager()
+    first, second, other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    _, first_listener = await _connect(manager, "item", first)
+    await _connect(manager, "item", second)
+    await _connect(manager, "other", other)
+
+    assert len(manager.get_connections("item")) == 2
+    assert manager.has_connection("other")
+    assert not manager.has_connection("missing")
+
+    await manager.send("item", "hello")
+    await asyncio.sleep(0.01)
+    assert first.sent == second.sent == ["hello"]
+    assert other.sent == []
+
+    first.incoming.put_nowait(None)  # client disconnects
+    await first_listener
+    assert len(manager.get_connections("item")) == 1
+    stats = manager.stats()
+    assert stats.connections == 2
+    assert stats.peak_connections == 3
+    assert stats.items == 2
+    assert stats.sent == 2
+
+
+@pytest.mark.anyio
+async def test_websocket_slow_client(settings: Settings, mocker: MockerFixture):
+    mocker.patch.object(settings, "websocket_send_timeout", 0.2)
+    mocker.patch.object(settings, "websocket_send_queue_size", 2)
+    manager = WebsocketConnectionManager()
+    fast, slow = FakeWebSocket(), FakeWebSocket(send_delay=10)
+    await _connect(manager, "item", fast)
+    _, slow_listener = await _connect(manager, "item", slow)
+
+    for i in range(4):
+        await manager.send("item", f"message {i}")
+        await asyncio.sleep(0.01)
+    # the slow client does not hold up the others
+    assert fast.sent == [f"message {i}" for i in range(4)]
+
+    await asyncio.wait_for(slow_listener, timeout=1)
+    assert slow.closed
+    assert manager.get_connections("item")[0].websocket is fast
+    stats = manager.stats()
+    assert stats.slow_disconnects == 1
+    # one message is being sent, two are queued
+    assert stats.dropped == 1
+
+
+@pytest.mark.anyio
+async def test_websocket_idle_timeout(settings: Settings, mocker: MockerFixture):
+    mocker.patch.object(settings, "websocket_idle_timeout", 0.2)
+    manager = WebsocketConnectionManager()
+    active, idle = FakeWebSocket(), FakeWebSocket()
+    active_conn, _ = await _connect(manager, "active", active)
+    _, idle_listener = await _connect(manager, "idle", idle)
+
+    for _ in range(3):
+        await asyncio.sleep(0.1)
+        active.incoming.put_nowait("ping")
+
+    await asyncio.wait_for(idle_listener, timeout=1)
+    assert idle.closed
+    assert not active.closed
+    assert manager.stats().idle_disconnects == 1
+    manager.disconnect(active_conn)
+    assert manager.stats().connections == 0
@@ -0,0 +1,75 @@
+from unittest.mock import Mock
+
+import pytest
+from pyln.client import RpcError
+from pytest_mock.plugin import MockerFixture
+
+from lnbits.settings import Settings
+from lnbits.wallets import CoreLightningWallet
+
+
+def _rpc(invoices: list[dict], wait: dict | Exception) -> Mock:
+    rpc = Mock()
+    rpc.help.return_value = {"help": [{"command": "invoice ... [deschashonly]"}]}
+    rpc.listinvoices.return_value = {"invoices": invoices}
+
+    def _call(method: str, payload: dict):
+        if method == "wait":
+            if isinstance(wait, Exception):
+                raise wait
+            return wait
+        assert method == "listinvoices"
+        assert payload["index"] == "updated"
+        start, end = payload["start"], payload["start"] + payload["limit"]
+        return {"invoices": [i for i in invoices if start <= i["updated_index"] < end]}
+
+    rpc.call.side_effect = _call
+    return rpc
+
+
+def _wallet(mocker: MockerFixture, settings: Settings, rpc: Mock):
+    mocker.patch.object(settings, "corelightning_rpc", "some-mock-value")
+    mocker.patch("lnbits.wallets.corelightning.LightningRpc", return_value=rpc)
+    wallet = CoreLightningWallet()
+    # nothing is requested from the node before the startup
+    rpc.help.assert_not_called()
+    rpc.listinvoices.assert_not_called()
+    return wallet
+
+
+@pytest.mark.anyio
+async def test_startup_pages_updated_invoices(
+    mocker: MockerFixture, settings: Settings
+):
+    invoices = [{"updated_index": i} for i in range(1, 2501)]
+    invoices[1200]["pay_index"] = 7
+    invoices[1210]["pay_index"] = 8
+    rpc = _rpc(invoices, wait={"subsystem": "invoices", "updated": 2500})
+    wallet = _wallet(mocker, settings, rpc)
+    wallet.pay_index_page_size = 1000
+
+    await wallet.startup()
+
+    assert wallet.supports_description_hash
+    assert wallet.last_pay_index == 8
+    # the newest page has no paid invoice, the second one has
+    assert rpc.call.call_count == 3
+    rpc.listinvoices.assert_not_called()
+
+
+@pytest.mark.anyio
+async def test_startup_resumed_or_old_node(mocker: MockerFixture, settings: Settings):
+    invoices = [{"updated_index": 1, "pay_index": 3}, {"updated_index": 2}]
+    rpc = _rpc(invoices, wait=RpcError("wait", {}, {"code": -32601}))
+    wallet = _wallet(mocker, settings, rpc)
+    wallet.resume_invoice_stream("5")
+    await wallet.startup()
+    assert wallet.last_pay_index == 5
+    rpc.call.assert_not_called()
+
+    # nodes without `wait` fall back to listing all invoices
+    rpc.reset_mock()
+    wallet = _wallet(mocker, settings, rpc)
+    await wallet.startup()
+    assert wallet.last_pay_index == 3
+    rpc.listinvoices.assert_called_once_with()
@@ -1,6 +1,7 @@
 # Python script to create a fake admin user for sqlite3,
 # for regtest setup as LNbits funding source
 
+import hashlib
 import os
 import sqlite3
 import sys
@@ -31,6 +32,7 @@ if old_account:
 cursor.execute("INSERT INTO accounts (id) VALUES (:adminkey)", {"adminkey": adminkey})
 
 wallet_id = uuid4().hex
+inkey = uuid4().hex  # invoice key is not important
 cursor.execute(
     """
     INSERT INTO wallets (id, name, "user", adminkey, inkey)
@@ -41,9 +43,22 @@ cursor.execute(
         "name": "TEST WALLET",
         "user": adminkey,
         "adminkey": adminkey,
-        "inkey": uuid4().hex,  # invoice key is not important
+        "inkey": inkey,
     },
 )
+# the keys are only resolved through their hashes in `wallet_keys`
+for key, key_type in [(adminkey, "admin"), (inkey, "invoice")]:
+    cursor.execute(
+        """
+        INSERT INTO wallet_keys (key_hash, wallet_id, key_type)
+        VALUES (:key_hash, :wallet_id, :key_type)
+        """,
+        {
+            "key_hash": hashlib.sha256(key.encode()).hexdigest(),
+            "wallet_id": wallet_id,
+            "key_type": key_type,
+        },
+    )
 
 expiration_date = time.time() + 420
 
@@ -73,6 +88,16 @@ cursor.execute(
     },
 )
 
+# balances are read from `wallet_balances`, not summed up from `apipayments`
+cursor.execute(
+    """
+    INSERT INTO wallet_balances (wallet_id, balance) VALUES (:wallet_id, :balance)
+    ON CONFLICT (wallet_id) DO UPDATE
+    SET balance = wallet_balances.balance + :balance
+    """,
+    {"wallet_id": wallet_id, "balance": amount * 1000},
+)
+
 print(f"created test admin: {adminkey} with {amount} sats")
 
 conn.commit()